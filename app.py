@@ -1,10 +1,8 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import pymysql
 import bcrypt
 import os
 from werkzeug.utils import secure_filename
 from PIL import Image
-import razorpay
 from datetime import datetime
 import uuid
 import json
@@ -12,19 +10,43 @@ from config import Config
 
 # Import email service
 from services.email_service import mail
+from services.email_renderer import email_renderer
+from services import db_pool, view_tracker, response_cache, template_cache, fragment_cache, session_store, payment_gateway, task_queue, outbox, email_dispatcher, ai_completions, catalog_index
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Disable Jinja2 bytecode cache for development
-app.jinja_env.auto_reload = True
-app.jinja_env.cache = {}
+# Jinja2 template and bytecode caches (before anything touches app.jinja_env)
+template_cache.init_app(app)
+fragment_cache.init_app(app)
 
-# Initialize Flask-Mail
+# Keep session data server-side
+session_store.init_app(app)
+
+# Initialize Flask-Mail and the batched email dispatcher
 mail.init_app(app)
+email_dispatcher.init_app(app)
+
+# Initialize database connection pool
+db_pool.init_app(app)
+
+# Initialize buffered product view tracking
+view_tracker.init_app(app)
+
+# Initialize the response cache for anonymous catalog pages
+response_cache.init_app(app)
+
+# Initialize the background task queue for post-commit work
+task_queue.init_app(app)
 
-# Initialize Razorpay client
-razorpay_client = razorpay.Client(auth=(app.config['RAZORPAY_KEY_ID'], app.config['RAZORPAY_KEY_SECRET']))
+# Run order side effects recorded in the outbox
+outbox.init_app(app)
+
+# Initialize Razorpay client (pooled connections, timeouts on every call)
+razorpay_client = payment_gateway.init_app(app)
+
+# Shared OpenAI client and the cache of chat answers
+ai_completions.init_app(app)
 
 # Template filter for handling both local and external images
 @app.template_filter('image_url')
@@ -48,15 +70,9 @@ def image_url_filter(image_path):
     except:
         return f'/static/{image_path}'
 
-# Database connection
+# Database connection (checked out of the shared pool; conn.close() returns it)
 def get_db_connection():
-    return pymysql.connect(
-        host=app.config['MYSQL_HOST'],
-        user=app.config['MYSQL_USER'],
-        password=app.config['MYSQL_PASSWORD'],
-        database=app.config['MYSQL_DB'],
-        cursorclass=pymysql.cursors.DictCursor
-    )
+    return db_pool.get_db_connection()
 
 # Helper functions
 def allowed_file(filename):
@@ -159,10 +175,18 @@ try:
     import routes.loyalty
     import routes.flash_deals
     import routes.comparison
+    import routes.metrics
     print("✅ All routes imported successfully")
 except ImportError as e:
     print(f"❌ Warning: Could not import all routes: {e}")
     print("Make sure all route files exist in the routes/ directory")
 
+# Compile every page and email template now that all filters are registered
+template_cache.precompile(app)
+email_renderer.precompile(app)
+
+# Build the in-memory catalog indexes before the first request, and keep them fresh in the background
+catalog_index.warm(app)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
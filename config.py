@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,8 +8,26 @@ class Config:
     # Flask Configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here-change-in-production'
     
+    # Server-Side Sessions (the cookie only carries a signed session id)
+    # 'sqlite:///<path>' (one host), a redis:// URL (redis package), 'memory' (local stand-in) or '' (cookie sessions)
+    SESSION_STORE = os.environ.get(
+        'SESSION_STORE', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'amazon_sessions.sqlite3')
+    )
+    
     # Template Configuration
-    TEMPLATES_AUTO_RELOAD = True  # Auto-reload templates in development
+    # Re-read templates when they change ('true' for development); unset: only in debug mode
+    TEMPLATES_AUTO_RELOAD = {'true': True, 'false': False}.get(os.environ.get('TEMPLATES_AUTO_RELOAD', '').lower())
+    TEMPLATE_CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE', 400))  # Compiled templates kept in memory
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_BYTECODE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'amazon_jinja_cache')
+    )  # Shared by worker processes; '' disables
+    TEMPLATE_PRECOMPILE = os.environ.get('TEMPLATE_PRECOMPILE', 'true').lower() == 'true'  # Compile all templates at startup
+    CATALOG_WARM_ON_START = os.environ.get('CATALOG_WARM_ON_START', 'true').lower() == 'true'  # Build the search/facet/suggest indexes at startup
+    
+    # Fragment Cache ({% cache key, ttl %} in templates)
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', 'true').lower() == 'true'
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 5000))  # Per-process LRU size
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))  # Seconds, when a fragment gives no ttl
     
     # MySQL Configuration
     # Use environment variables for production (Vercel), fallback to localhost for development
@@ -17,6 +36,26 @@ class Config:
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD', '')  # Default XAMPP MySQL password is empty
     MYSQL_DB = os.environ.get('MYSQL_DB', 'amazon_db')
     
+    # Database Connection Pool
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))  # Max open connections per process
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))  # Seconds to wait for a free connection
+    DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300))  # Close connections idle this long
+    DB_POOL_PING_INTERVAL = int(os.environ.get('DB_POOL_PING_INTERVAL', 30))  # Ping connections idle this long before reuse
+    
+    # Product View Tracking (buffered, flushed in batches)
+    VIEW_FLUSH_INTERVAL = float(os.environ.get('VIEW_FLUSH_INTERVAL', 5))  # Seconds between flushes
+    VIEW_FLUSH_SIZE = int(os.environ.get('VIEW_FLUSH_SIZE', 500))  # Flush early once this many views are pending
+    VIEW_MAX_BACKLOG = int(os.environ.get('VIEW_MAX_BACKLOG', 50000))  # Drop views beyond this while the DB is down
+    
+    # Response Cache (catalog pages for anonymous visitors)
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 2000))  # Per-process LRU size
+    # Required (a redis:// URL) when more than one process serves or writes the catalog (several web
+    # workers, the outbox worker, the reservation sweeper): without it a purge only reaches the
+    # process that made the change, and the others serve their cached pages until the TTL runs out
+    RESPONSE_CACHE_SHARED = os.environ.get('RESPONSE_CACHE_SHARED', '')  # '' (none), 'memory' (local stand-in) or a redis:// URL
+    RESPONSE_CACHE_LOCAL_TTL = int(os.environ.get('RESPONSE_CACHE_LOCAL_TTL', 5))  # Max seconds in the LRU when a shared store is used
+    
     # Upload Configuration
     UPLOAD_FOLDER = 'static/uploads/products'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -25,21 +64,50 @@ class Config:
     # Razorpay Configuration
     RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID') or 'rzp_test_S29syTllQCrTsO'
     RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET') or 'kR3BDGvZGM0R5gCCOLNueIh4'
+    RAZORPAY_CONNECT_TIMEOUT = float(os.environ.get('RAZORPAY_CONNECT_TIMEOUT', 3))  # Seconds to open a gateway connection
+    RAZORPAY_READ_TIMEOUT = float(os.environ.get('RAZORPAY_READ_TIMEOUT', 10))  # Seconds to wait for a gateway response
+    RAZORPAY_POOL_SIZE = int(os.environ.get('RAZORPAY_POOL_SIZE', 10))  # Kept-alive gateway connections per process
+    
+    # Background Task Queue (work after the response, e.g. draining the outbox)
+    TASK_QUEUE_WORKERS = int(os.environ.get('TASK_QUEUE_WORKERS', 4))  # Threads per process; 0 runs tasks inline
+    TASK_QUEUE_MAX_PENDING = int(os.environ.get('TASK_QUEUE_MAX_PENDING', 1000))  # Beyond this, tasks run inline
+    
+    # Transactional Outbox (order side effects; worker: python -m services.outbox)
+    OUTBOX_DRAIN_IN_APP = os.environ.get('OUTBOX_DRAIN_IN_APP', 'true').lower() == 'true'  # Also run new rows on the task queue right after commit
+    OUTBOX_WORKER_THREADS = int(os.environ.get('OUTBOX_WORKER_THREADS', 8))  # Threads of the worker process
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 1))  # Seconds between polls when idle
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 300))  # A claimed row is re-claimable after this
+    OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', 7))  # Done rows are purged by the worker after this
     
     # Email Configuration (Flask-Mail)
-    MAIL_SERVER = 'smtp.gmail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')  # localhost for a local SMTP sink
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
     MAIL_USE_SSL = False
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')  # Your Gmail address
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')  # Your Gmail app password
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_USERNAME')
+    MAIL_RATE_LIMIT = float(os.environ.get('MAIL_RATE_LIMIT', 10))  # Messages per second per process (provider limit)
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 50))  # Messages sent (and logged) per batch
+    MAIL_IDLE_TIMEOUT = float(os.environ.get('MAIL_IDLE_TIMEOUT', 30))  # Close the SMTP connection after this long without mail
+    MAIL_MAX_PENDING = int(os.environ.get('MAIL_MAX_PENDING', 10000))  # Queued messages per process
+    
+    # Newsletter Campaigns (python -m services.newsletter_service)
+    SITE_URL = os.environ.get('SITE_URL', 'http://localhost:5000')  # Base of absolute links in emails (unsubscribe, order pages)
+    NEWSLETTER_SMTP_CONNECTIONS = int(os.environ.get('NEWSLETTER_SMTP_CONNECTIONS', 4))  # Kept-open SMTP connections per sender
+    NEWSLETTER_RATE_LIMIT = float(os.environ.get('NEWSLETTER_RATE_LIMIT', 50))  # Messages per second across them (provider limit)
+    NEWSLETTER_CHUNK_SIZE = int(os.environ.get('NEWSLETTER_CHUNK_SIZE', 1000))  # Subscribers sent and recorded per step; at most this many re-sent after a crash
+    NEWSLETTER_STALE_SECONDS = int(os.environ.get('NEWSLETTER_STALE_SECONDS', 300))  # A sending campaign without a heartbeat this long can be resumed
     
     # AI Chat Configuration
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     AI_CHAT_MODEL = 'gpt-3.5-turbo'
     AI_CHAT_MAX_TOKENS = 500
     AI_CHAT_TEMPERATURE = 0.7
+    AI_CHAT_FAKE = os.environ.get('AI_CHAT_FAKE', 'false').lower() == 'true'  # Local stand-in for the API (load tests)
+    AI_CACHE_ENABLED = os.environ.get('AI_CACHE_ENABLED', 'true').lower() == 'true'  # Reuse answers to identical questions
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 1000))  # Per-process LRU size
+    AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', 3600))  # Seconds a cached answer is reused
     
     # Pagination
     PRODUCTS_PER_PAGE = 12
@@ -0,0 +1,20 @@
+-- ============================================================================
+-- CATALOG VERSION COUNTERS
+-- ============================================================================
+-- One counter per versioned part of the catalog, bumped in the same
+-- transaction as every change to it (services/conditional_get.py). ETags of
+-- the JSON endpoints are computed from these rows, so an unchanged response
+-- is answered 304 Not Modified with a primary key read.
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    scope VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO catalog_versions (scope, version) VALUES
+    ('categories', 1),
+    ('flash_deals', 1);
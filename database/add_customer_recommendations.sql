@@ -0,0 +1,28 @@
+-- ============================================================================
+-- PRECOMPUTED PERSONALIZED RECOMMENDATIONS
+-- ============================================================================
+-- Ranked homepage candidates per customer, written by
+-- services/personalization_service.py. Orders and wishlist changes bump the
+-- customer's version; a list is served only while computed_version matches.
+-- Precompute for active customers periodically (e.g. every 5 minutes):
+--   python -m services.personalization_service --active-days 30
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE TABLE IF NOT EXISTS customer_recommendation_state (
+    customer_id INT PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    computed_version INT NULL,
+    computed_at TIMESTAMP NULL,
+    FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS customer_recommendations (
+    customer_id INT NOT NULL,
+    product_id INT NOT NULL,
+    score FLOAT NOT NULL,
+    PRIMARY KEY (customer_id, product_id),
+    FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+);
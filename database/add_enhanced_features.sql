@@ -77,22 +77,8 @@ ADD COLUMN IF NOT EXISTS average_rating DECIMAL(3,2) DEFAULT 0.00,
 ADD COLUMN IF NOT EXISTS review_count INT DEFAULT 0,
 ADD COLUMN IF NOT EXISTS view_count INT DEFAULT 0;
 
--- Create view for product statistics
-CREATE OR REPLACE VIEW product_stats AS
-SELECT 
-    p.id,
-    p.name,
-    p.price,
-    p.discount_price,
-    COALESCE(AVG(pr.rating), 0) as avg_rating,
-    COUNT(DISTINCT pr.id) as total_reviews,
-    COUNT(DISTINCT w.id) as wishlist_count,
-    COUNT(DISTINCT pv.id) as total_views
-FROM products p
-LEFT JOIN product_reviews pr ON p.id = pr.product_id
-LEFT JOIN wishlist w ON p.id = w.product_id
-LEFT JOIN product_views pv ON p.id = pv.product_id
-GROUP BY p.id;
+-- Product statistics live in the product_stats table (add_product_stats.sql),
+-- maintained incrementally instead of aggregated by a view.
 
 -- ============================================================================
 -- Sample Data
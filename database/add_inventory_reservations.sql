@@ -0,0 +1,38 @@
+-- ============================================================================
+-- INVENTORY RESERVATIONS
+-- ============================================================================
+-- Stock taken by an unpaid order (services/inventory_service.py). Checkout
+-- decrements products.quantity conditionally and records a hold per
+-- product; payment commits it, a failed payment or an expired hold puts
+-- the units back. Legacy orders placed before this table have no rows.
+-- A payment that arrives after its hold expired and finds the stock gone
+-- marks the hold 'short' and the order stock_shortfall (refund/backorder).
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE TABLE IF NOT EXISTS inventory_reservations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    order_id INT NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    status ENUM('held', 'committed', 'released', 'short') NOT NULL DEFAULT 'held',
+    expires_at DATETIME NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    released_at DATETIME NULL,
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    UNIQUE KEY uniq_order_product (order_id, product_id),
+    -- Expiry sweep: held rows by expiry, optionally for given products
+    INDEX idx_status_expiry (status, expires_at),
+    INDEX idx_product_status_expiry (product_id, status, expires_at)
+);
+
+-- Databases migrated before 'short' existed
+ALTER TABLE inventory_reservations
+MODIFY status ENUM('held', 'committed', 'released', 'short') NOT NULL DEFAULT 'held';
+
+-- Paid orders that could not get their stock back after the hold expired
+ALTER TABLE orders
+ADD COLUMN IF NOT EXISTS stock_shortfall BOOLEAN NOT NULL DEFAULT FALSE AFTER payment_status,
+ADD INDEX IF NOT EXISTS idx_stock_shortfall (stock_shortfall);
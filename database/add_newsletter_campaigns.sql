@@ -0,0 +1,41 @@
+-- ============================================================================
+-- NEWSLETTER CAMPAIGNS
+-- ============================================================================
+-- Campaigns sent to newsletter_subscriptions by services/newsletter_service.py.
+-- last_subscription_id is the campaign's checkpoint: every active subscriber
+-- up to that id has a newsletter_deliveries row, so a crashed or paused
+-- campaign resumes after it. locked_by / heartbeat_at stop two senders from
+-- running one campaign.
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE TABLE IF NOT EXISTS newsletter_campaigns (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    subject VARCHAR(255) NOT NULL,
+    heading VARCHAR(255) NOT NULL,
+    body_html MEDIUMTEXT NOT NULL,
+    status ENUM('draft', 'sending', 'paused', 'sent') NOT NULL DEFAULT 'draft',
+    last_subscription_id INT NOT NULL DEFAULT 0,
+    total_recipients INT NULL,
+    sent_count INT NOT NULL DEFAULT 0,
+    failed_count INT NOT NULL DEFAULT 0,
+    locked_by VARCHAR(64) NULL,
+    heartbeat_at DATETIME NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    completed_at DATETIME NULL,
+    INDEX idx_status (status)
+);
+
+-- One row per campaign and subscriber, written a chunk at a time
+CREATE TABLE IF NOT EXISTS newsletter_deliveries (
+    campaign_id INT NOT NULL,
+    subscription_id INT NOT NULL,
+    status ENUM('sent', 'failed') NOT NULL,
+    error_message VARCHAR(500) NULL,
+    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (campaign_id, subscription_id),
+    INDEX idx_campaign_status (campaign_id, status),
+    FOREIGN KEY (campaign_id) REFERENCES newsletter_campaigns(id) ON DELETE CASCADE
+);
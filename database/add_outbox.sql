@@ -0,0 +1,35 @@
+-- ============================================================================
+-- TRANSACTIONAL OUTBOX
+-- ============================================================================
+-- Side effects of orders, payments and deliveries (emails, loyalty points,
+-- trending and co-purchase counters), inserted in the same transaction as
+-- the change and run afterwards by services/outbox.py with retries.
+-- dedupe_key makes enqueueing one effect twice a no-op. Done rows are
+-- purged by the worker after OUTBOX_RETENTION_DAYS.
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    handler VARCHAR(64) NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key VARCHAR(191) NULL,
+    status ENUM('pending', 'running', 'done', 'dead') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(64) NULL,
+    locked_until DATETIME NULL,
+    last_error TEXT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at DATETIME NULL,
+    UNIQUE KEY uniq_dedupe_key (dedupe_key),
+    -- Claiming: runnable rows per handler, oldest first
+    INDEX idx_status_handler (status, handler, available_at),
+    INDEX idx_locked_by (locked_by),
+    -- Purging: done rows by completion time
+    INDEX idx_status_completed (status, completed_at)
+);
+
+-- Tables created before the purge existed
+ALTER TABLE outbox ADD INDEX IF NOT EXISTS idx_status_completed (status, completed_at);
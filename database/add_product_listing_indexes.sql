@@ -0,0 +1,25 @@
+-- ============================================================================
+-- PRODUCT LISTING INDEXES
+-- ============================================================================
+-- Composite indexes backing keyset pagination on /products and /api/products.
+-- Each sort mode (newest, price_low, price_high, name) seeks on
+-- (is_active, <sort column>, id); the category_id variants serve the
+-- category filter. id is the tie-breaker that makes the order total.
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE INDEX IF NOT EXISTS idx_active_created ON products (is_active, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_active_price ON products (is_active, price, id);
+CREATE INDEX IF NOT EXISTS idx_active_name ON products (is_active, name, id);
+
+CREATE INDEX IF NOT EXISTS idx_category_created ON products (category_id, is_active, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_category_price ON products (category_id, is_active, price, id);
+CREATE INDEX IF NOT EXISTS idx_category_name ON products (category_id, is_active, name, id);
+
+-- ============================================================================
+-- Verify (should show a range scan on one of the indexes above, no filesort)
+-- ============================================================================
+-- EXPLAIN SELECT id FROM products
+-- WHERE is_active = 1 AND (price > 999.00 OR (price = 999.00 AND id > 42))
+-- ORDER BY price ASC, id ASC LIMIT 13;
@@ -0,0 +1,11 @@
+-- ============================================================================
+-- PRODUCT SEARCH SUPPORT
+-- ============================================================================
+-- Product search is served by an in-process BM25 index
+-- (services/search_service.py). Each worker re-reads products changed since
+-- its last sync every minute; this index keeps that query a range scan.
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE INDEX IF NOT EXISTS idx_updated ON products (updated_at);
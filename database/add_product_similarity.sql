@@ -0,0 +1,32 @@
+-- ============================================================================
+-- CO-PURCHASE SIMILARITY
+-- ============================================================================
+-- "Customers who bought this also bought" neighbours, built offline by
+-- services/copurchase_service.py:
+--   python -m services.copurchase_service --metric cosine --top-n 20
+-- New orders update both tables incrementally; rerun the build periodically
+-- (e.g. nightly) to refresh every score.
+-- ============================================================================
+
+USE amazon_db;
+
+-- Sparse item-item co-occurrence matrix: number of orders containing both
+-- products. The diagonal row (product_id = related_product_id) counts the
+-- orders containing the product.
+CREATE TABLE IF NOT EXISTS product_copurchase (
+    product_id INT NOT NULL,
+    related_product_id INT NOT NULL,
+    order_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, related_product_id)
+);
+
+-- Top-N neighbours per product; a recommendation lookup is one range scan
+-- of the primary key prefix
+CREATE TABLE IF NOT EXISTS product_similarity (
+    product_id INT NOT NULL,
+    similar_product_id INT NOT NULL,
+    score FLOAT NOT NULL,
+    co_purchase_count INT NOT NULL,
+    PRIMARY KEY (product_id, similar_product_id),
+    INDEX idx_product_score (product_id, score)
+);
@@ -0,0 +1,82 @@
+-- ============================================================================
+-- MATERIALIZED PRODUCT STATISTICS
+-- ============================================================================
+-- One row per product with running counters, maintained incrementally by
+-- services/product_stats.py:
+--   - review add/edit/delete  -> rating_sum, rating_count, rating_1..rating_5
+--   - order placement         -> sales_count (units)
+--   - product page views      -> view_count
+-- Readers LEFT JOIN this table instead of aggregating product_reviews and
+-- order_items. Run after add_enhanced_features.sql.
+-- ============================================================================
+
+USE amazon_db;
+
+-- Replaces the aggregating product_stats view from add_enhanced_features.sql
+DROP VIEW IF EXISTS product_stats;
+
+CREATE TABLE IF NOT EXISTS product_stats (
+    product_id INT PRIMARY KEY,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_1 INT NOT NULL DEFAULT 0,
+    rating_2 INT NOT NULL DEFAULT 0,
+    rating_3 INT NOT NULL DEFAULT 0,
+    rating_4 INT NOT NULL DEFAULT 0,
+    rating_5 INT NOT NULL DEFAULT 0,
+    sales_count INT NOT NULL DEFAULT 0,
+    view_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    INDEX idx_updated (updated_at)
+);
+
+-- ============================================================================
+-- Backfill from existing data (safe to re-run: recomputes every row)
+-- ============================================================================
+
+INSERT INTO product_stats (product_id, rating_sum, rating_count,
+                           rating_1, rating_2, rating_3, rating_4, rating_5,
+                           sales_count, view_count)
+SELECT
+    p.id,
+    COALESCE(r.rating_sum, 0),
+    COALESCE(r.rating_count, 0),
+    COALESCE(r.rating_1, 0),
+    COALESCE(r.rating_2, 0),
+    COALESCE(r.rating_3, 0),
+    COALESCE(r.rating_4, 0),
+    COALESCE(r.rating_5, 0),
+    COALESCE(o.sales_count, 0),
+    COALESCE(p.view_count, 0)
+FROM products p
+LEFT JOIN (
+    SELECT product_id,
+           SUM(rating) as rating_sum,
+           COUNT(*) as rating_count,
+           SUM(rating = 1) as rating_1,
+           SUM(rating = 2) as rating_2,
+           SUM(rating = 3) as rating_3,
+           SUM(rating = 4) as rating_4,
+           SUM(rating = 5) as rating_5
+    FROM product_reviews
+    GROUP BY product_id
+) r ON r.product_id = p.id
+LEFT JOIN (
+    SELECT product_id, SUM(quantity) as sales_count
+    FROM order_items
+    GROUP BY product_id
+) o ON o.product_id = p.id
+ON DUPLICATE KEY UPDATE
+    rating_sum = VALUES(rating_sum),
+    rating_count = VALUES(rating_count),
+    rating_1 = VALUES(rating_1),
+    rating_2 = VALUES(rating_2),
+    rating_3 = VALUES(rating_3),
+    rating_4 = VALUES(rating_4),
+    rating_5 = VALUES(rating_5),
+    sales_count = VALUES(sales_count),
+    view_count = VALUES(view_count);
+
+-- products.average_rating, review_count and view_count are superseded by
+-- this table and no longer maintained by the application.
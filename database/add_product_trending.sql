@@ -0,0 +1,23 @@
+-- ============================================================================
+-- TRENDING PRODUCTS
+-- ============================================================================
+-- Time-decayed sales and view counters maintained by
+-- services/trending_service.py as orders, payments and views happen.
+-- Values are stored in forward-decay units of their generation (see the
+-- service), so the top products of a generation are an index range scan.
+-- Seed from recent orders after creating the table:
+--   python -m services.trending_service --backfill-days 14
+-- ============================================================================
+
+USE amazon_db;
+
+CREATE TABLE IF NOT EXISTS product_trending (
+    product_id INT PRIMARY KEY,
+    generation INT NOT NULL,
+    views DOUBLE NOT NULL DEFAULT 0,
+    sales DOUBLE NOT NULL DEFAULT 0,
+    score DOUBLE NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    INDEX idx_generation_score (generation, score)
+);
@@ -100,7 +100,16 @@ CREATE TABLE IF NOT EXISTS products (
     FOREIGN KEY (category_id) REFERENCES categories(id),
     INDEX idx_category (category_id),
     INDEX idx_seller (seller_id),
-    INDEX idx_active (is_active)
+    INDEX idx_active (is_active),
+    -- Keyset pagination for the product listing (one per sort mode)
+    INDEX idx_active_created (is_active, created_at, id),
+    INDEX idx_active_price (is_active, price, id),
+    INDEX idx_active_name (is_active, name, id),
+    INDEX idx_category_created (category_id, is_active, created_at, id),
+    INDEX idx_category_price (category_id, is_active, price, id),
+    INDEX idx_category_name (category_id, is_active, name, id),
+    -- Incremental search index sync
+    INDEX idx_updated (updated_at)
 );
 
 -- Cart table
@@ -7,6 +7,8 @@ from services.email_service import (
     send_seller_approval_email, 
     send_seller_rejection_email
 )
+from services import response_cache
+from services.conditional_get import bump_version
 
 @app.route('/admin/dashboard')
 @login_required('admin')
@@ -155,6 +157,7 @@ def approve_seller(seller_id):
     if seller:
         cursor.execute("UPDATE sellers SET is_approved = 1 WHERE id = %s", (seller_id,))
         conn.commit()
+        response_cache.purge(response_cache.CATALOG)
         
         # Send approval email
         try:
@@ -193,6 +196,7 @@ def block_seller(seller_id):
         cursor.execute("UPDATE users SET is_active = 0 WHERE id = %s", (seller['user_id'],))
         cursor.execute("UPDATE sellers SET is_approved = 0 WHERE id = %s", (seller_id,))
         conn.commit()
+        response_cache.purge(response_cache.CATALOG)
         
         # Send rejection email
         try:
@@ -267,7 +271,9 @@ def add_category():
     try:
         cursor.execute("INSERT INTO categories (name, description) VALUES (%s, %s)", 
                       (name, description))
+        bump_version(cursor, 'categories')
         conn.commit()
+        response_cache.purge(response_cache.CATEGORIES)
         flash('Category added successfully!', 'success')
     except Exception as e:
         flash('Category name already exists!', 'error')
@@ -282,7 +288,9 @@ def toggle_category_status(category_id):
     cursor = conn.cursor()
     
     cursor.execute("UPDATE categories SET is_active = NOT is_active WHERE id = %s", (category_id,))
+    bump_version(cursor, 'categories')
     conn.commit()
+    response_cache.purge(response_cache.CATEGORIES)
     conn.close()
     
     flash('Category status updated successfully!', 'success')
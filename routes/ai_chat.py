@@ -8,19 +8,11 @@ from app import app, get_db_connection
 from services.ai_shopping_assistant import AIShoppingAssistant
 import os
 
-# Initialize AI assistant with database config
-db_config = {
-    'host': app.config.get('MYSQL_HOST', 'localhost'),
-    'user': app.config.get('MYSQL_USER', 'root'),
-    'password': app.config.get('MYSQL_PASSWORD', ''),
-    'database': app.config.get('MYSQL_DB', 'amazon_db')
-}
-
 # Initialize OpenAI API key from environment
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 
-# Create AI assistant instance
-ai_assistant = AIShoppingAssistant(api_key=OPENAI_API_KEY, db_config=db_config)
+# Create AI assistant instance (database access goes through the shared pool)
+ai_assistant = AIShoppingAssistant(api_key=OPENAI_API_KEY)
 
 @app.route('/chat')
 def chat_page():
@@ -10,8 +10,10 @@ from services.email_service import (
 
 # Import OTP service functions
 from services.otp_service import create_otp, verify_otp as verify_user_otp, get_user_otp_status
+from services import response_cache
 
 @app.route('/')
+@response_cache.cached(ttl=60, tags=(response_cache.CATALOG, response_cache.LISTINGS, response_cache.CATEGORIES))
 def index():
     try:
         conn = get_db_connection()
@@ -38,6 +40,7 @@ def index():
     
     except Exception as e:
         print(f"Error in index route: {e}")
+        response_cache.skip()
         # Return a simple response if there's an error
         try:
             conn = get_db_connection()
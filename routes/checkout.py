@@ -1,16 +1,172 @@
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
 from app import app, get_db_connection, login_required, razorpay_client
+from services.db_pool import get_db, release_db, transaction
+from services.product_stats import record_sale_counts
+from services import copurchase_service, response_cache, inventory_service
+from services.inventory_service import InsufficientStock
+from services.outbox import enqueue, handler
+from services.trending_service import record_activity
+from services.personalization_service import invalidate as invalidate_recommendations
+from routes.loyalty import award_points
+import razorpay
 import uuid
 import json
 
-# Import email service functions
-from services.email_service import (
-    send_order_placed_email,
-    send_payment_success_email,
-    send_payment_failed_email,
-    send_order_status_email,
-    send_seller_order_notification
-)
+# Emails are queued in the outbox and sent after the transaction commits
+from services.email_service import queue_email, render_seller_order_notifications
+
+def _create_payment_order(order_id, order_number, amount):
+    """
+    Create the Razorpay order for a committed order. The request connection
+    goes back to the pool for the gateway round trip, so no connection or
+    row lock waits on it. On failure the order is cancelled and its stock
+    released; returns the Razorpay order or None.
+    """
+    release_db()
+    try:
+        return razorpay_client.order.create({
+            'amount': int(amount * 100),  # Amount in paise
+            'currency': 'INR',
+            'receipt': order_number,
+            'payment_capture': 1
+        })
+    except Exception as e:
+        print(f"❌ Payment gateway error for order {order_number}: {e}")
+        _abandon_order(order_id)
+        return None
+
+
+def _abandon_order(order_id):
+    """Cancel an order that never reached payment and put its stock back"""
+    try:
+        with transaction() as conn:
+            inventory_service.fail_order(conn.cursor(), order_id)
+    except Exception as e:
+        print(f"❌ Failed to release stock for order {order_id}: {e}")
+
+
+def _record_coupon_usage(cursor, coupon_id, order_id, order_number, discount_amount):
+    """Record coupon usage and increment its count (a savepoint in the caller's transaction)"""
+    try:
+        with transaction():
+            # Record coupon usage
+            cursor.execute("""
+                INSERT INTO coupon_usage (coupon_id, customer_id, order_id, discount_amount)
+                VALUES (%s, %s, %s, %s)
+            """, (coupon_id, session['customer_id'], order_id, discount_amount))
+            
+            # Increment coupon used count
+            cursor.execute("""
+                UPDATE coupons SET used_count = used_count + 1 WHERE id = %s
+            """, (coupon_id,))
+        
+        print(f"✅ Coupon usage recorded for order {order_number}")
+        
+        # Clear coupon from session
+        session.pop('applied_coupon', None)
+    except Exception as e:
+        print(f"❌ Failed to record coupon usage: {e}")
+
+
+def _enqueue_order_effects(cursor, customer_id, order_id, order_number, total_amount, units, notify_sellers=True):
+    """Loyalty points (1 point per ₹1 spent), counters and emails of a new order, run from the outbox"""
+    enqueue(cursor, 'award_order_points', {
+        'customer_id': customer_id, 'order_id': order_id, 'order_number': order_number, 'points': int(total_amount)
+    }, key=f'order:{order_id}:points')
+    enqueue(cursor, 'record_order_activity', {'units': units}, key=f'order:{order_id}:activity')
+    enqueue(cursor, 'order_placed_emails', {
+        'order_id': order_id, 'order_number': order_number, 'total_amount': float(total_amount), 'notify_sellers': notify_sellers
+    }, key=f'order:{order_id}:placed_emails')
+
+
+# Outbox handlers: run after the order's transaction commits, each in a
+# transaction that also marks its outbox row done (no request or session)
+
+@handler('award_order_points')
+def _award_order_points(cursor, payload):
+    award_points(payload['customer_id'], payload['points'], f"Points earned on order {payload['order_number']}", payload['order_id'])
+    print(f"✅ Awarded {payload['points']} loyalty points for order {payload['order_number']}")
+
+
+@handler('record_order_activity', concurrency=2)
+def _record_order_activity(cursor, payload):
+    """Co-purchase neighbours and trending counters of an order's products"""
+    units = {int(product_id): quantity for product_id, quantity in payload['units'].items()}
+    copurchase_service.record_order(list(units), cursor=cursor)
+    record_activity(cursor, orders=units)
+
+
+@handler('order_placed_emails')
+def _queue_order_placed_emails(cursor, payload):
+    """One email for the customer and one per seller line item, each its own outbox row"""
+    order_id, order_number = payload['order_id'], payload['order_number']
+    
+    cursor.execute("""
+        SELECT c.first_name, c.last_name, u.email 
+        FROM orders o
+        JOIN customers c ON o.customer_id = c.id
+        JOIN users u ON c.user_id = u.id 
+        WHERE o.id = %s
+    """, (order_id,))
+    customer = cursor.fetchone()
+    if customer:
+        queue_email(cursor, 'send_order_placed_email', customer['email'], f"{customer['first_name']} {customer['last_name']}",
+                    order_number, payload['total_amount'], order_id, key=f'order:{order_id}:placed:customer')
+    
+    if not payload['notify_sellers']:
+        return
+    
+    cursor.execute("""
+        SELECT oi.id, s.owner_name, u.email, p.name, oi.quantity
+        FROM order_items oi
+        JOIN sellers s ON oi.seller_id = s.id
+        JOIN users u ON s.user_id = u.id
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id = %s
+    """, (order_id,))
+    sellers = cursor.fetchall()
+    # Rendered in one pass; each row carries its message, so a retry does not re-render
+    messages = render_seller_order_notifications(
+        order_number, order_id, [(seller['owner_name'], seller['name'], seller['quantity']) for seller in sellers]
+    )
+    for seller, html in zip(sellers, messages):
+        queue_email(cursor, 'send_seller_order_notification', seller['email'], seller['owner_name'],
+                    order_number, seller['name'], seller['quantity'], order_id, html, key=f"order:{order_id}:placed:item:{seller['id']}")
+
+
+@handler('record_payment_activity', concurrency=2)
+def _record_payment_activity(cursor, payload):
+    """Paid units count towards trending on top of the order itself"""
+    cursor.execute("SELECT product_id, quantity FROM order_items WHERE order_id = %s", (payload['order_id'],))
+    units = {}
+    for item in cursor.fetchall():
+        units[item['product_id']] = units.get(item['product_id'], 0) + item['quantity']
+    record_activity(cursor, payments=units)
+
+
+@handler('payment_email')
+def _queue_payment_email(cursor, payload):
+    order_id = payload['order_id']
+    cursor.execute("""
+        SELECT o.order_number, o.total_amount, c.first_name, c.last_name, u.email
+        FROM orders o
+        JOIN customers c ON o.customer_id = c.id
+        JOIN users u ON c.user_id = u.id
+        WHERE o.id = %s
+    """, (order_id,))
+    order_details = cursor.fetchone()
+    if not order_details:
+        return
+    
+    customer_name = f"{order_details['first_name']} {order_details['last_name']}"
+    if payload['succeeded']:
+        queue_email(cursor, 'send_payment_success_email', order_details['email'], customer_name,
+                    order_details['order_number'], float(order_details['total_amount']), order_id,
+                    key=f'order:{order_id}:payment_success:customer')
+    else:
+        queue_email(cursor, 'send_payment_failed_email', order_details['email'], customer_name,
+                    order_details['order_number'], order_id, key=f'order:{order_id}:payment_failed:customer')
+
 
 @app.route('/checkout')
 @login_required('customer')
@@ -44,12 +200,14 @@ def checkout():
 @app.route('/place_order', methods=['POST'])
 @login_required('customer')
 def place_order():
-    conn = get_db_connection()
+    # One request-scoped connection for the whole checkout, including the
+    # loyalty and email helpers called below
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get cart items
     cursor.execute("""
-        SELECT c.*, p.name, p.price, p.seller_id, p.quantity as stock
+        SELECT c.*, p.name, p.price, p.seller_id, p.category_id, p.quantity as stock
         FROM cart c
         JOIN products p ON c.product_id = p.id
         WHERE c.customer_id = %s AND p.is_active = 1
@@ -94,124 +252,81 @@ def place_order():
     # Generate order number
     order_number = f"ORD{uuid.uuid4().hex[:8].upper()}"
     
-    try:
-        # Create Razorpay order (use final_amount if coupon applied)
-        razorpay_order = razorpay_client.order.create({
-            'amount': int(final_amount * 100),  # Amount in paise
-            'currency': 'INR',
-            'receipt': order_number,
-            'payment_capture': 1
-        })
-    except Exception as e:
-        conn.close()
-        flash(f'Payment gateway error: {str(e)}. Please check your Razorpay configuration.', 'error')
-        return redirect(url_for('checkout'))
-    
-    # Create order in database with coupon information
-    cursor.execute("""
-        INSERT INTO orders (customer_id, order_number, total_amount, shipping_address, razorpay_order_id, coupon_id, discount_amount, final_amount)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """, (session['customer_id'], order_number, total_amount, json.dumps(shipping_address), razorpay_order['id'], coupon_id, discount_amount, final_amount))
-    
-    order_id = cursor.lastrowid
-    
-    # Create order items
+    # Units per product (a product can appear in more than one cart row)
+    units = {}
     for item in cart_items:
-        cursor.execute("""
-            INSERT INTO order_items (order_id, product_id, seller_id, quantity, price, total)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (order_id, item['product_id'], item['seller_id'], item['quantity'], 
-              item['price'], item['price'] * item['quantity']))
-        
-        # Update product quantity
-        cursor.execute("UPDATE products SET quantity = quantity - %s WHERE id = %s",
-                      (item['quantity'], item['product_id']))
+        units[item['product_id']] = units.get(item['product_id'], 0) + item['quantity']
     
-    # Clear cart
-    cursor.execute("DELETE FROM cart WHERE customer_id = %s", (session['customer_id'],))
+    # Stock held by abandoned payments for these products goes back first
+    try:
+        inventory_service.release_expired(product_ids=list(units))
+    except Exception as e:
+        print(f"❌ Failed to release expired reservations: {e}")
     
-    # If coupon was used, record usage and increment count
-    if coupon_id:
-        try:
-            # Record coupon usage
+    # Reserve the stock and create the order in one short transaction
+    try:
+        with transaction():
             cursor.execute("""
-                INSERT INTO coupon_usage (coupon_id, customer_id, order_id, discount_amount)
-                VALUES (%s, %s, %s, %s)
-            """, (coupon_id, session['customer_id'], order_id, discount_amount))
+                INSERT INTO orders (customer_id, order_number, total_amount, shipping_address, coupon_id, discount_amount, final_amount)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (session['customer_id'], order_number, total_amount, json.dumps(shipping_address), coupon_id, discount_amount, final_amount))
             
-            # Increment coupon used count
-            cursor.execute("""
-                UPDATE coupons SET used_count = used_count + 1 WHERE id = %s
-            """, (coupon_id,))
+            order_id = cursor.lastrowid
             
-            print(f"✅ Coupon usage recorded for order {order_number}")
+            # Hold the stock until the payment completes (conditional decrements).
+            # First, so products rows are locked in id order before the order
+            # items' foreign keys touch them in cart order.
+            inventory_service.reserve(cursor, order_id, units)
             
-            # Clear coupon from session
-            session.pop('applied_coupon', None)
-        except Exception as e:
-            print(f"❌ Failed to record coupon usage: {e}")
-    
-    # Get customer details for email
-    cursor.execute("""
-        SELECT c.first_name, c.last_name, u.email 
-        FROM customers c 
-        JOIN users u ON c.user_id = u.id 
-        WHERE c.id = %s
-    """, (session['customer_id'],))
-    customer = cursor.fetchone()
-    
-    conn.commit()
-    
-    # Send order placed email to customer
-    if customer:
-        try:
-            customer_name = f"{customer['first_name']} {customer['last_name']}"
-            send_order_placed_email(
-                customer['email'], 
-                customer_name, 
-                order_number, 
-                total_amount, 
-                order_id
-            )
-            print(f"✅ Order placed email sent to {customer['email']}")
-        except Exception as e:
-            print(f"❌ Failed to send order placed email: {e}")
-    
-    # Award loyalty points (1 point per ₹1 spent)
-    try:
-        from routes.loyalty import award_points
-        points_earned = int(total_amount)
-        award_points(session['customer_id'], points_earned, f'Points earned on order {order_number}', order_id)
-        print(f"✅ Awarded {points_earned} loyalty points for order {order_number}")
+            # Create order items
+            for item in cart_items:
+                cursor.execute("""
+                    INSERT INTO order_items (order_id, product_id, seller_id, quantity, price, total)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (order_id, item['product_id'], item['seller_id'], item['quantity'], 
+                      item['price'], item['price'] * item['quantity']))
+            record_sale_counts(cursor, units)
+    except InsufficientStock as e:
+        name = next(item['name'] for item in cart_items if item['product_id'] == e.product_id)
+        flash(f'Insufficient stock for {name}', 'error')
+        return redirect(url_for('cart'))
     except Exception as e:
-        print(f"❌ Failed to award loyalty points: {e}")
+        print(f"❌ Failed to place order {order_number}: {e}")
+        flash('We could not place your order. Please try again.', 'error')
+        return redirect(url_for('cart'))
     
-    # Send order notifications to sellers
+    # Create Razorpay order (use final_amount if coupon applied)
+    razorpay_order = _create_payment_order(order_id, order_number, final_amount)
+    if razorpay_order is None:
+        flash('The payment gateway is not responding. Please try again.', 'error')
+        return redirect(url_for('checkout'))
+    
+    # Attach the payment order, clear the cart and use the coupon
+    cursor = get_db().cursor()
     try:
-        cursor.execute("""
-            SELECT DISTINCT oi.seller_id, s.owner_name, u.email, p.name, oi.quantity
-            FROM order_items oi
-            JOIN sellers s ON oi.seller_id = s.id
-            JOIN users u ON s.user_id = u.id
-            JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = %s
-        """, (order_id,))
-        sellers = cursor.fetchall()
-        
-        for seller in sellers:
-            send_seller_order_notification(
-                seller['email'],
-                seller['owner_name'],
-                order_number,
-                seller['name'],
-                seller['quantity'],
-                order_id
-            )
-            print(f"✅ Seller order notification sent to {seller['email']}")
+        with transaction():
+            cursor.execute("UPDATE orders SET razorpay_order_id = %s WHERE id = %s", (razorpay_order['id'], order_id))
+            
+            # Clear cart
+            cursor.execute("DELETE FROM cart WHERE customer_id = %s", (session['customer_id'],))
+            invalidate_recommendations(cursor, session['customer_id'])
+            
+            # If coupon was used, record usage and increment count
+            if coupon_id:
+                _record_coupon_usage(cursor, coupon_id, order_id, order_number, discount_amount)
+            
+            # Loyalty points, counters and emails run from the outbox once this commits
+            _enqueue_order_effects(cursor, session['customer_id'], order_id, order_number, total_amount, units)
     except Exception as e:
-        print(f"❌ Failed to send seller notifications: {e}")
+        print(f"❌ Failed to place order {order_number}: {e}")
+        _abandon_order(order_id)
+        flash('We could not place your order. Please try again.', 'error')
+        return redirect(url_for('cart'))
     
-    conn.close()
+    # Cached pages show stock: product pages always, listings only when an item sold out
+    for item in cart_items:
+        response_cache.purge_product(item['product_id'], [item['category_id']],
+                                     listings=item['quantity'] >= item['stock'])
     
     return render_template('customer/payment.html', 
                          order=razorpay_order, 
@@ -227,7 +342,7 @@ def payment_success():
     razorpay_signature = request.form['razorpay_signature']
     order_id = request.form['order_id']
     
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
     
     try:
@@ -237,85 +352,56 @@ def payment_success():
             'razorpay_payment_id': razorpay_payment_id,
             'razorpay_signature': razorpay_signature
         })
+    except razorpay.errors.SignatureVerificationError:
+        # Payment verification failed: the order is cancelled and its stock released
+        try:
+            with transaction():
+                if inventory_service.fail_order(cursor, order_id, session['customer_id']):
+                    enqueue(cursor, 'payment_email', {'order_id': int(order_id), 'succeeded': False}, key=f'order:{order_id}:payment_failed')
+        except Exception as e:
+            print(f"❌ Failed to release stock for order {order_id}: {e}")
         
-        # Update order status
-        cursor.execute("""
-            UPDATE orders SET 
-            payment_status = 'completed', 
-            status = 'confirmed',
-            razorpay_payment_id = %s
-            WHERE id = %s AND customer_id = %s
-        """, (razorpay_payment_id, order_id, session['customer_id']))
-        
-        # Create payment record
-        cursor.execute("""
-            INSERT INTO payments (order_id, razorpay_order_id, razorpay_payment_id, razorpay_signature, amount, status)
-            SELECT %s, %s, %s, %s, total_amount, 'captured'
-            FROM orders WHERE id = %s
-        """, (order_id, razorpay_order_id, razorpay_payment_id, razorpay_signature, order_id))
-        
-        # Get order and customer details for email
-        cursor.execute("""
-            SELECT o.order_number, o.total_amount, c.first_name, c.last_name, u.email
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            JOIN users u ON c.user_id = u.id
-            WHERE o.id = %s
-        """, (order_id,))
-        order_details = cursor.fetchone()
-        
-        conn.commit()
-        
-        # Send payment success email
-        if order_details:
-            try:
-                customer_name = f"{order_details['first_name']} {order_details['last_name']}"
-                send_payment_success_email(
-                    order_details['email'],
-                    customer_name,
-                    order_details['order_number'],
-                    order_details['total_amount'],
-                    order_id
-                )
-                print(f"✅ Payment success email sent to {order_details['email']}")
-            except Exception as e:
-                print(f"❌ Failed to send payment success email: {e}")
+        flash('Payment verification failed. Please contact support.', 'error')
+        return redirect(url_for('order_history'))
+    
+    try:
+        with transaction():
+            # Update order status
+            cursor.execute("""
+                UPDATE orders SET 
+                payment_status = 'completed', 
+                status = 'confirmed',
+                razorpay_payment_id = %s
+                WHERE id = %s AND customer_id = %s
+            """, (razorpay_payment_id, order_id, session['customer_id']))
+            paid = cursor.rowcount == 1
+            
+            # The held stock now belongs to the order
+            if paid:
+                inventory_service.commit(cursor, order_id)
+            
+            # Create payment record
+            cursor.execute("""
+                INSERT INTO payments (order_id, razorpay_order_id, razorpay_payment_id, razorpay_signature, amount, status)
+                SELECT %s, %s, %s, %s, total_amount, 'captured'
+                FROM orders WHERE id = %s
+            """, (order_id, razorpay_order_id, razorpay_payment_id, razorpay_signature, order_id))
+            
+            # Trending counters, the confirmation email and a pending referral run from the outbox
+            if paid:
+                enqueue(cursor, 'record_payment_activity', {'order_id': int(order_id)}, key=f'order:{order_id}:payment_activity')
+                enqueue(cursor, 'payment_email', {'order_id': int(order_id), 'succeeded': True}, key=f'order:{order_id}:payment_success')
+                enqueue(cursor, 'complete_referral', {'customer_id': session['customer_id']}, key=f"referral:{session['customer_id']}")
         
         flash('Payment successful! Your order has been confirmed.', 'success')
         
     except Exception as e:
-        # Payment verification failed
-        cursor.execute("UPDATE orders SET payment_status = 'failed' WHERE id = %s", (order_id,))
-        
-        # Get order and customer details for failed payment email
-        cursor.execute("""
-            SELECT o.order_number, c.first_name, c.last_name, u.email
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            JOIN users u ON c.user_id = u.id
-            WHERE o.id = %s
-        """, (order_id,))
-        order_details = cursor.fetchone()
-        
-        conn.commit()
-        
-        # Send payment failed email
-        if order_details:
-            try:
-                customer_name = f"{order_details['first_name']} {order_details['last_name']}"
-                send_payment_failed_email(
-                    order_details['email'],
-                    customer_name,
-                    order_details['order_number'],
-                    order_id
-                )
-                print(f"✅ Payment failed email sent to {order_details['email']}")
-            except Exception as e:
-                print(f"❌ Failed to send payment failed email: {e}")
-        
-        flash('Payment verification failed. Please contact support.', 'error')
+        # The payment is genuine but recording it failed: the order stays pending
+        # (not cancelled) so it can be retried or reconciled with the gateway
+        print(f"❌ Failed to record verified payment {razorpay_payment_id} for order {order_id}: {e}")
+        flash('Your payment was received but we could not confirm your order yet. '
+              'It will be updated shortly; please contact support if it stays pending.', 'warning')
     
-    conn.close()
     return redirect(url_for('order_history'))
 
 @app.route('/buy_now', methods=['POST'])
@@ -387,13 +473,13 @@ def place_buy_now_order():
         flash('No item selected for purchase.', 'error')
         return redirect(url_for('products'))
     
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
     
     buy_now_item = session['buy_now_item']
     
     # Check stock availability again
-    cursor.execute("SELECT quantity FROM products WHERE id = %s AND is_active = 1", 
+    cursor.execute("SELECT quantity, category_id FROM products WHERE id = %s AND is_active = 1", 
                    (buy_now_item['product_id'],))
     product = cursor.fetchone()
     
@@ -430,86 +516,71 @@ def place_buy_now_order():
     order_number = f"ORD{uuid.uuid4().hex[:8].upper()}"
     
     try:
-        # Create Razorpay order (use final_amount if coupon applied)
-        razorpay_order = razorpay_client.order.create({
-            'amount': int(final_amount * 100),  # Amount in paise
-            'currency': 'INR',
-            'receipt': order_number,
-            'payment_capture': 1
-        })
+        inventory_service.release_expired(product_ids=[buy_now_item['product_id']])
     except Exception as e:
-        conn.close()
-        flash(f'Payment gateway error: {str(e)}. Please check your Razorpay configuration.', 'error')
-        return redirect(url_for('buy_now_checkout'))
-    
-    # Create order in database with coupon information
-    cursor.execute("""
-        INSERT INTO orders (customer_id, order_number, total_amount, shipping_address, razorpay_order_id, coupon_id, discount_amount, final_amount)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """, (session['customer_id'], order_number, total_amount, json.dumps(shipping_address), razorpay_order['id'], coupon_id, discount_amount, final_amount))
-    
-    order_id = cursor.lastrowid
+        print(f"❌ Failed to release expired reservations: {e}")
     
-    # Create order item
-    cursor.execute("""
-        INSERT INTO order_items (order_id, product_id, seller_id, quantity, price, total)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (order_id, buy_now_item['product_id'], buy_now_item['seller_id'], 
-          buy_now_item['quantity'], buy_now_item['price'], total_amount))
-    
-    # Update product quantity
-    cursor.execute("UPDATE products SET quantity = quantity - %s WHERE id = %s",
-                  (buy_now_item['quantity'], buy_now_item['product_id']))
-    
-    # Clear buy now item from session
-    session.pop('buy_now_item', None)
-    
-    # If coupon was used, record usage and increment count
-    if coupon_id:
-        try:
-            # Record coupon usage
+    # Reserve the stock and create the order in one short transaction
+    try:
+        with transaction():
             cursor.execute("""
-                INSERT INTO coupon_usage (coupon_id, customer_id, order_id, discount_amount)
-                VALUES (%s, %s, %s, %s)
-            """, (coupon_id, session['customer_id'], order_id, discount_amount))
+                INSERT INTO orders (customer_id, order_number, total_amount, shipping_address, coupon_id, discount_amount, final_amount)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (session['customer_id'], order_number, total_amount, json.dumps(shipping_address), coupon_id, discount_amount, final_amount))
             
-            # Increment coupon used count
-            cursor.execute("""
-                UPDATE coupons SET used_count = used_count + 1 WHERE id = %s
-            """, (coupon_id,))
+            order_id = cursor.lastrowid
             
-            print(f"✅ Coupon usage recorded for order {order_number}")
+            # Hold the stock until the payment completes (conditional decrement),
+            # before anything else touches the products row
+            units = {buy_now_item['product_id']: buy_now_item['quantity']}
+            inventory_service.reserve(cursor, order_id, units)
             
-            # Clear coupon from session
-            session.pop('applied_coupon', None)
-        except Exception as e:
-            print(f"❌ Failed to record coupon usage: {e}")
+            # Create order item
+            cursor.execute("""
+                INSERT INTO order_items (order_id, product_id, seller_id, quantity, price, total)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (order_id, buy_now_item['product_id'], buy_now_item['seller_id'], 
+                  buy_now_item['quantity'], buy_now_item['price'], total_amount))
+            record_sale_counts(cursor, units)
+    except InsufficientStock:
+        flash('Product is no longer available in the requested quantity.', 'error')
+        return redirect(url_for('products'))
+    except Exception as e:
+        print(f"❌ Failed to place order {order_number}: {e}")
+        flash('We could not place your order. Please try again.', 'error')
+        return redirect(url_for('buy_now_checkout'))
     
-    conn.commit()
-    conn.close()
+    # Create Razorpay order (use final_amount if coupon applied)
+    razorpay_order = _create_payment_order(order_id, order_number, final_amount)
+    if razorpay_order is None:
+        flash('The payment gateway is not responding. Please try again.', 'error')
+        return redirect(url_for('buy_now_checkout'))
     
-    # Send order placed email to customer
+    # Attach the payment order and use the coupon
+    cursor = get_db().cursor()
     try:
-        from services.email_service import send_order_placed_email, send_seller_order_notification
-        import pymysql
-        conn2 = get_db_connection()
-        c2 = conn2.cursor()
-        c2.execute("""
-            SELECT cu.first_name, cu.last_name, u.email
-            FROM customers cu JOIN users u ON cu.user_id = u.id
-            WHERE cu.id = %s
-        """, (session['customer_id'],))
-        cust = c2.fetchone()
-        if cust:
-            send_order_placed_email(cust['email'], f"{cust['first_name']} {cust['last_name']}", order_number, total_amount, order_id)
-            print(f"✅ Order placed email sent to {cust['email']}")
-        # Award loyalty points
-        from routes.loyalty import award_points
-        award_points(session['customer_id'], int(total_amount), f'Points earned on order {order_number}', order_id)
-        print(f"✅ Awarded {int(total_amount)} loyalty points for order {order_number}")
-        conn2.close()
+        with transaction():
+            cursor.execute("UPDATE orders SET razorpay_order_id = %s WHERE id = %s", (razorpay_order['id'], order_id))
+            invalidate_recommendations(cursor, session['customer_id'])
+            
+            # If coupon was used, record usage and increment count
+            if coupon_id:
+                _record_coupon_usage(cursor, coupon_id, order_id, order_number, discount_amount)
+            
+            # Loyalty points, counters and the customer's email run from the outbox once this commits
+            _enqueue_order_effects(cursor, session['customer_id'], order_id, order_number, total_amount,
+                                   {buy_now_item['product_id']: buy_now_item['quantity']}, notify_sellers=False)
     except Exception as e:
-        print(f"❌ Post-order tasks error: {e}")
+        print(f"❌ Failed to place order {order_number}: {e}")
+        _abandon_order(order_id)
+        flash('We could not place your order. Please try again.', 'error')
+        return redirect(url_for('buy_now_checkout'))
+    
+    response_cache.purge_product(buy_now_item['product_id'], [product['category_id']],
+                                 listings=buy_now_item['quantity'] >= product['quantity'])
+    
+    # Clear buy now item from session
+    session.pop('buy_now_item', None)
     
     return render_template('customer/payment.html', 
                          order=razorpay_order, 
@@ -591,6 +662,17 @@ def order_detail(order_id):
 @app.route('/payment_failed')
 @login_required('customer')
 def payment_failed():
+    # Cancelled or failed in the Razorpay window: release the order's stock now
+    # rather than when its hold expires
+    order_id = request.args.get('order_id', type=int)
+    if order_id:
+        try:
+            with transaction():
+                if inventory_service.fail_order(get_db().cursor(), order_id, session['customer_id']):
+                    print(f"📦 Released stock held by order {order_id} after a failed payment")
+        except Exception as e:
+            print(f"❌ Failed to release stock for order {order_id}: {e}")
+    
     flash('Payment failed. Please try again.', 'error')
     return redirect(url_for('cart'))
 
@@ -5,6 +5,22 @@ Handles product comparison functionality
 
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
 from app import app, get_db_connection
+from services.conditional_get import conditional
+
+def _comparison_version():
+    """The session's list and when its products last changed"""
+    comparison_list = [str(x) for x in session.get('comparison_list', [])]
+    if not comparison_list:
+        return (), None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ','.join(['%s'] * len(comparison_list))
+    cursor.execute(f"SELECT COUNT(*) as found, MAX(updated_at) as updated_at FROM products WHERE id IN ({placeholders})",
+                   comparison_list)
+    row = cursor.fetchone()
+    conn.close()
+    # No Last-Modified: the list itself changes without any product changing
+    return (tuple(comparison_list), row['found'], row['updated_at']), None
 
 @app.route('/compare')
 def compare_products():
@@ -33,16 +49,13 @@ def compare_products():
                     p.image_url, p.quantity, p.specifications,
                     c.name as category_name,
                     s.business_name, s.owner_name,
-                    COALESCE(AVG(pr.rating), 0) as avg_rating,
-                    COUNT(DISTINCT pr.id) as review_count
+                    COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as avg_rating,
+                    COALESCE(ps.rating_count, 0) as review_count
                 FROM products p
                 JOIN categories c ON p.category_id = c.id
                 JOIN sellers s ON p.seller_id = s.id
-                LEFT JOIN product_reviews pr ON p.id = pr.product_id
+                LEFT JOIN product_stats ps ON ps.product_id = p.id
                 WHERE p.id IN ({placeholders}) AND p.is_active = 1
-                GROUP BY p.id, p.name, p.description, p.price, p.discount_price,
-                         p.image_url, p.quantity, p.specifications, c.name,
-                         s.business_name, s.owner_name
             """
             cursor.execute(query, product_ids)
             results = cursor.fetchall()
@@ -140,6 +153,7 @@ def remove_from_comparison():
         }), 500
 
 @app.route('/api/compare/list')
+@conditional(_comparison_version, private=True)
 def get_comparison_list():
     """Get current comparison list"""
     comparison_list = [str(x) for x in session.get('comparison_list', [])]
@@ -1,66 +1,239 @@
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
 from app import app, get_db_connection, login_required
+from services.pagination import resolve_sort, decode_cursor, encode_cursor, keyset_clause
+from services.search_service import search_service
+from services.facet_service import facet_index
+from services.suggest_service import suggest_index
+from services import response_cache
+from services.conditional_get import conditional, read_version
 import json
 
-@app.route('/products')
-def products():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get filters
-    category_id = request.args.get('category')
-    search = request.args.get('search', '')
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    sort_by = request.args.get('sort', 'newest')
+# Most search results considered for one listing query
+SEARCH_MAX_RESULTS = 1000
+
+def _listing_filters(args):
+    """Parsed listing filters (shared by the SQL query and the facet counts)"""
+    return {
+        'category_id': args.get('category', type=int),
+        'brand': args.get('brand', '').strip() or None,
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+        'price_lt': args.get('price_lt', type=float),  # Exclusive upper bound of a price bucket link
+        'min_rating': args.get('rating', type=float)
+    }
+
+def _product_filters(args):
+    """Base listing query with the category, brand, price and rating filters applied"""
+    filters = _listing_filters(args)
     
-    # Build query
     query = """
-        SELECT p.*, c.name as category_name, s.business_name 
+        SELECT p.*, c.name as category_name, s.business_name,
+               COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as avg_rating,
+               COALESCE(ps.rating_count, 0) as review_count
         FROM products p 
         JOIN categories c ON p.category_id = c.id 
         JOIN sellers s ON p.seller_id = s.id 
+        LEFT JOIN product_stats ps ON ps.product_id = p.id
         WHERE p.is_active = 1 AND s.is_approved = 1
     """
     params = []
     
-    if category_id:
+    if filters['category_id']:
         query += " AND p.category_id = %s"
-        params.append(category_id)
+        params.append(filters['category_id'])
     
-    if search:
-        query += " AND (p.name LIKE %s OR p.description LIKE %s)"
-        params.extend([f'%{search}%', f'%{search}%'])
+    if filters['brand']:
+        query += " AND p.brand = %s"
+        params.append(filters['brand'])
     
-    if min_price:
+    if filters['min_price']:
         query += " AND p.price >= %s"
-        params.append(min_price)
+        params.append(filters['min_price'])
     
-    if max_price:
+    if filters['max_price']:
         query += " AND p.price <= %s"
-        params.append(max_price)
-    
-    # Add sorting
-    if sort_by == 'price_low':
-        query += " ORDER BY p.price ASC"
-    elif sort_by == 'price_high':
-        query += " ORDER BY p.price DESC"
-    elif sort_by == 'name':
-        query += " ORDER BY p.name ASC"
+        params.append(filters['max_price'])
+    
+    if filters['price_lt']:
+        # Exclusive, like the upper edge of the facet price buckets
+        query += " AND p.price < %s"
+        params.append(filters['price_lt'])
+    
+    if filters['min_rating']:
+        query += " AND ps.rating_sum >= %s * ps.rating_count AND ps.rating_count > 0"
+        params.append(filters['min_rating'])
+    
+    return query, params
+
+def _id_list_sql(ids):
+    return " AND p.id IN (" + ", ".join(["%s"] * len(ids)) + ")"
+
+def _fetch_relevance_page(cursor, args, ranked, per_page):
+    """
+    Page through search results in BM25 order.
+    Walks the ranked ids in chunks, keeping those that pass the SQL filters,
+    until one row more than a page has been collected.
+    """
+    position = decode_cursor('relevance', args.get('cursor'))
+    if position:
+        # Ranked order is (score DESC, id DESC); resume strictly after the cursor
+        ranked = [(pid, score) for pid, score in ranked if (score, pid) < position]
+    
+    base_query, base_params = _product_filters(args)
+    chunk_size = per_page * 4
+    products = []
+    for start in range(0, len(ranked), chunk_size):
+        chunk = ranked[start:start + chunk_size]
+        ids = [pid for pid, _ in chunk]
+        cursor.execute(base_query + _id_list_sql(ids), base_params + ids)
+        rows = {row['id']: row for row in cursor.fetchall()}
+        for pid, score in chunk:
+            if pid in rows:
+                rows[pid]['relevance'] = score
+                products.append(rows[pid])
+        if len(products) > per_page:
+            break
+    return products
+
+def _search_candidates(args):
+    """
+    Ranked (product_id, score) search results for ?search=, or None when the
+    listing is not a search. Candidates come from the full-text index
+    instead of a LIKE scan.
+    """
+    search = args.get('search', '').strip()
+    if not search:
+        return None
+    return search_service.search(search, limit=SEARCH_MAX_RESULTS)
+
+def _fetch_product_page(cursor, args, ranked):
+    """
+    Fetch one keyset-paginated page of the product listing.
+    Returns (products, next_cursor); next_cursor is None on the last page.
+    """
+    search = ranked is not None
+    sort_by = resolve_sort(args.get('sort'), searching=search)
+    per_page = app.config['PRODUCTS_PER_PAGE']
+    
+    if search and not ranked:
+        return [], None
+    
+    if sort_by == 'relevance':
+        products = _fetch_relevance_page(cursor, args, ranked, per_page)
     else:
-        query += " ORDER BY p.created_at DESC"
+        query, params = _product_filters(args)
+        if search:
+            ids = [pid for pid, _ in ranked]
+            query += _id_list_sql(ids)
+            params.extend(ids)
+        
+        # Continue after the previous page and add sorting (ties broken by id)
+        position = decode_cursor(sort_by, args.get('cursor'))
+        keyset_sql, keyset_params, order_sql = keyset_clause(sort_by, position)
+        query += keyset_sql + order_sql + " LIMIT %s"
+        params.extend(keyset_params)
+        params.append(per_page + 1)  # One extra row tells us whether there is a next page
+        
+        cursor.execute(query, params)
+        products = cursor.fetchall()
     
-    cursor.execute(query, params)
-    products = cursor.fetchall()
+    next_cursor = None
+    if len(products) > per_page:
+        products = products[:per_page]
+        next_cursor = encode_cursor(sort_by, products[-1])
+    
+    return products, next_cursor
+
+def _facet_counts(args, ranked):
+    """Facet counts for the current listing query from the in-memory facet index"""
+    product_ids = [pid for pid, _ in ranked] if ranked is not None else None
+    return facet_index.counts(product_ids=product_ids, **_listing_filters(args))
+
+@app.route('/products')
+@response_cache.cached(ttl=60, tags=(response_cache.CATALOG, response_cache.CATEGORIES))
+def products():
+    category_id = request.args.get('category', type=int)
+    response_cache.tag(response_cache.category_tag(category_id) if category_id else response_cache.LISTINGS)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    ranked = _search_candidates(request.args)
+    products, next_cursor = _fetch_product_page(cursor, request.args, ranked)
+    facets = _facet_counts(request.args, ranked)
     
     # Get categories for filter
     cursor.execute("SELECT * FROM categories WHERE is_active = 1")
     categories = cursor.fetchall()
     
     conn.close()
-    return render_template('customer/products.html', products=products, categories=categories)
+    
+    # Next/first page links keep the current filters and sort
+    filters = {k: v for k, v in request.args.items() if k != 'cursor'}
+    next_url = url_for('products', cursor=next_cursor, **filters) if next_cursor else None
+    first_url = url_for('products', **filters) if request.args.get('cursor') else None
+    
+    def facet_url(**changes):
+        """Listing URL with some filters changed (None removes one), back on page 1"""
+        args = dict(filters, **changes)
+        return url_for('products', **{k: v for k, v in args.items() if v not in (None, '')})
+    
+    return render_template('customer/products.html', products=products, categories=categories,
+                           facets=facets, facet_url=facet_url, next_url=next_url, first_url=first_url)
+
+@app.route('/api/products')
+def api_products():
+    """
+    JSON product listing with the same filters and sort modes as /products.
+    Pass the returned next_cursor as ?cursor= to fetch the following page.
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        ranked = _search_candidates(request.args)
+        products, next_cursor = _fetch_product_page(cursor, request.args, ranked)
+        conn.close()
+        
+        return jsonify({
+            'success': True,
+            'products': [
+                {
+                    'id': p['id'],
+                    'name': p['name'],
+                    'price': float(p['price']),
+                    'discount_price': float(p['discount_price']) if p['discount_price'] else None,
+                    'image_url': p['image_url'],
+                    'category_name': p['category_name'],
+                    'business_name': p['business_name'],
+                    'in_stock': p['quantity'] > 0
+                }
+                for p in products
+            ],
+            'next_cursor': next_cursor,
+            'facets': _facet_counts(request.args, ranked)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/search/suggest')
+def api_search_suggest():
+    """
+    Search-as-you-type suggestions (product names, brands, categories)
+    ranked by popularity, served from the in-memory prefix index
+    """
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 8, type=int)
+    return jsonify({
+        'success': True,
+        'suggestions': suggest_index.suggest(query, limit) if query else []
+    })
 
 @app.route('/product/<int:product_id>')
+@response_cache.cached(ttl=300, tags=lambda product_id: (response_cache.CATALOG, response_cache.product_tag(product_id)))
 def product_detail(product_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -78,7 +251,8 @@ def product_detail(product_id):
         flash('Product not found.', 'error')
         return redirect(url_for('products'))
     
-    # Get related products
+    # Get related products (the cached page follows changes to any product of the category)
+    response_cache.tag(response_cache.category_tag(product['category_id']))
     cursor.execute("""
         SELECT p.*, s.business_name 
         FROM products p 
@@ -207,6 +381,8 @@ def remove_from_cart(cart_id):
 
 # API endpoint for categories (used by advanced search)
 @app.route('/api/categories')
+@conditional(lambda: read_version('categories'))
+@response_cache.cached(ttl=600, tags=(response_cache.CATEGORIES,))
 def api_categories():
     """
     Get all categories for filters
@@ -4,8 +4,9 @@ import random
 import json
 from datetime import datetime
 
-# Import email service
-from services.email_service import send_delivery_confirmation_email
+# Emails are queued in the outbox and sent after the transaction commits
+from services.email_service import queue_email
+from services.outbox import enqueue, handler
 
 @app.route('/delivery/dashboard')
 @login_required('delivery')
@@ -206,43 +207,10 @@ def verify_delivery(order_id):
                 VALUES (%s, %s, 'delivered', 'Delivery completed with OTP verification')
             """, (order_id, delivery_person['id']))
             
-            conn.commit()
+            # Confirmation emails to the customer and sellers run from the outbox
+            enqueue(cursor, 'delivery_emails', {'order_id': order_id}, key=f'order:{order_id}:delivered')
             
-            # Send delivery confirmation emails
-            try:
-                # Get seller details
-                cursor.execute("""
-                    SELECT DISTINCT s.owner_name, u.email as seller_email
-                    FROM order_items oi
-                    JOIN sellers s ON oi.seller_id = s.id
-                    JOIN users u ON s.user_id = u.id
-                    WHERE oi.order_id = %s
-                """, (order_id,))
-                sellers = cursor.fetchall()
-                
-                customer_name = f"{order['first_name']} {order['last_name']}"
-                
-                # Send to customer
-                send_delivery_confirmation_email(
-                    order['customer_email'],
-                    customer_name,
-                    order['order_number'],
-                    'customer'
-                )
-                print(f"✅ Delivery confirmation sent to customer: {order['customer_email']}")
-                
-                # Send to sellers
-                for seller in sellers:
-                    send_delivery_confirmation_email(
-                        seller['seller_email'],
-                        seller['owner_name'],
-                        order['order_number'],
-                        'seller'
-                    )
-                    print(f"✅ Delivery confirmation sent to seller: {seller['seller_email']}")
-                    
-            except Exception as e:
-                print(f"❌ Failed to send delivery confirmation emails: {e}")
+            conn.commit()
             
             conn.close()
             flash('✅ Delivery verified successfully! Order marked as delivered.', 'success')
@@ -253,6 +221,39 @@ def verify_delivery(order_id):
     conn.close()
     return render_template('delivery/verify.html', order=order)
 
+@handler('delivery_emails')
+def _queue_delivery_emails(cursor, payload):
+    """Outbox handler: one delivery confirmation for the customer and one per seller"""
+    order_id = payload['order_id']
+    cursor.execute("""
+        SELECT o.order_number, c.first_name, c.last_name, u.email as customer_email
+        FROM orders o
+        JOIN customers c ON o.customer_id = c.id
+        JOIN users u ON c.user_id = u.id
+        WHERE o.id = %s
+    """, (order_id,))
+    order = cursor.fetchone()
+    if not order:
+        return
+    
+    # Send to customer
+    queue_email(cursor, 'send_delivery_confirmation_email', order['customer_email'],
+                f"{order['first_name']} {order['last_name']}", order['order_number'], 'customer',
+                key=f'order:{order_id}:delivered:customer')
+    
+    # Send to sellers
+    cursor.execute("""
+        SELECT DISTINCT s.id, s.owner_name, u.email as seller_email
+        FROM order_items oi
+        JOIN sellers s ON oi.seller_id = s.id
+        JOIN users u ON s.user_id = u.id
+        WHERE oi.order_id = %s
+    """, (order_id,))
+    for seller in cursor.fetchall():
+        queue_email(cursor, 'send_delivery_confirmation_email', seller['seller_email'],
+                    seller['owner_name'], order['order_number'], 'seller',
+                    key=f"order:{order_id}:delivered:seller:{seller['id']}")
+
 @app.route('/delivery/generate_otp/<int:order_id>', methods=['POST'])
 @login_required('delivery')
 def generate_delivery_otp(order_id):
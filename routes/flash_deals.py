@@ -2,8 +2,34 @@ from flask import render_template, request, redirect, url_for, session, flash, j
 from app import app, get_db_connection, login_required
 from datetime import datetime, timedelta
 from decimal import Decimal
+from services import response_cache
+from services.conditional_get import conditional, bump_version
+
+def _active_deals_version():
+    """
+    Changes with every deal edit, whenever a deal starts or ends (the
+    earliest upcoming start or end among active deals moves on) and when a
+    live deal's product is edited (its name and image are in the response)
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT
+            (SELECT version FROM catalog_versions WHERE scope = 'flash_deals') as version,
+            (SELECT MIN(IF(start_time > NOW(), start_time, end_time))
+             FROM flash_deals
+             WHERE is_active = 1 AND end_time > NOW()) as next_change,
+            (SELECT MAX(p.updated_at)
+             FROM flash_deals fd
+             JOIN products p ON fd.product_id = p.id
+             WHERE fd.is_active = 1 AND fd.start_time <= NOW() AND fd.end_time > NOW()) as products_updated
+    """)
+    row = cursor.fetchone()
+    conn.close()
+    return (row['version'], row['next_change'], row['products_updated']), None
 
 @app.route('/flash-deals')
+@response_cache.cached(ttl=30, tags=(response_cache.FLASH_DEALS,))
 def flash_deals():
     """Display all active flash deals"""
     conn = get_db_connection()
@@ -30,6 +56,7 @@ def flash_deals():
         ORDER BY fd.end_time ASC
     """)
     deals = cursor.fetchall()
+    response_cache.tag(*(response_cache.product_tag(deal['product_id']) for deal in deals))
     
     conn.close()
     return render_template('flash_deals.html', deals=deals)
@@ -67,6 +94,7 @@ def daily_deals():
     return render_template('daily_deals.html', deals=deals)
 
 @app.route('/api/flash_deals/active')
+@conditional(_active_deals_version)
 def get_active_flash_deals():
     """API endpoint for active flash deals"""
     conn = get_db_connection()
@@ -187,9 +215,11 @@ def create_flash_deal():
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
     """, (product_id, original_price, deal_price, discount_percentage,
           quantity_limit, start_time, end_time, deal_type))
+    bump_version(cursor, 'flash_deals')
     
     conn.commit()
     conn.close()
+    response_cache.purge(response_cache.FLASH_DEALS)
     
     flash('Flash deal created successfully!', 'success')
     return redirect(url_for('admin_flash_deals'))
@@ -206,9 +236,11 @@ def toggle_flash_deal(deal_id):
         SET is_active = NOT is_active 
         WHERE id = %s
     """, (deal_id,))
+    bump_version(cursor, 'flash_deals')
     
     conn.commit()
     conn.close()
+    response_cache.purge(response_cache.FLASH_DEALS)
     
     flash('Flash deal status updated!', 'success')
     return redirect(url_for('admin_flash_deals'))
@@ -221,9 +253,11 @@ def delete_flash_deal(deal_id):
     cursor = conn.cursor()
     
     cursor.execute("DELETE FROM flash_deals WHERE id = %s", (deal_id,))
+    bump_version(cursor, 'flash_deals')
     
     conn.commit()
     conn.close()
+    response_cache.purge(response_cache.FLASH_DEALS)
     
     flash('Flash deal deleted!', 'success')
     return redirect(url_for('admin_flash_deals'))
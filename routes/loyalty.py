@@ -5,6 +5,8 @@ Handles points, tiers, and referrals
 
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
 from app import app, get_db_connection, login_required
+from services.db_pool import transaction
+from services.outbox import handler
 from datetime import datetime
 import random
 import string
@@ -242,100 +244,103 @@ def apply_referral_code():
     return jsonify({'success': True, 'message': 'Referral code applied!'})
 
 def award_points(customer_id, points, description, order_id=None):
-    """Award loyalty points to customer"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Update points
-    cursor.execute("""
-        INSERT INTO loyalty_points (customer_id, points, total_earned)
-        VALUES (%s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            points = points + %s,
-            total_earned = total_earned + %s
-    """, (customer_id, points, points, points, points))
-    
-    # Record transaction
-    cursor.execute("""
-        INSERT INTO loyalty_transactions
-        (customer_id, points, type, description, order_id)
-        VALUES (%s, %s, 'earned', %s, %s)
-    """, (customer_id, points, description, order_id))
-    
-    # Check for tier upgrade
-    cursor.execute("""
-        SELECT total_earned, tier FROM loyalty_points
-        WHERE customer_id = %s
-    """, (customer_id,))
-    loyalty = cursor.fetchone()
-    
-    if loyalty:
-        new_tier = calculate_tier(loyalty['total_earned'])
-        if new_tier != loyalty['tier']:
-            cursor.execute("""
-                UPDATE loyalty_points
-                SET tier = %s
-                WHERE customer_id = %s
-            """, (new_tier, customer_id))
-            
-            # Award tier upgrade bonus
-            tier_bonus = get_tier_bonus(new_tier)
-            if tier_bonus > 0:
+    """
+    Award loyalty points to customer
+    Joins the request's open transaction (as a savepoint) when called from
+    another write path such as place_order; commits on its own otherwise.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        
+        # Update points
+        cursor.execute("""
+            INSERT INTO loyalty_points (customer_id, points, total_earned)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                points = points + %s,
+                total_earned = total_earned + %s
+        """, (customer_id, points, points, points, points))
+        
+        # Record transaction
+        cursor.execute("""
+            INSERT INTO loyalty_transactions
+            (customer_id, points, type, description, order_id)
+            VALUES (%s, %s, 'earned', %s, %s)
+        """, (customer_id, points, description, order_id))
+        
+        # Check for tier upgrade
+        cursor.execute("""
+            SELECT total_earned, tier FROM loyalty_points
+            WHERE customer_id = %s
+        """, (customer_id,))
+        loyalty = cursor.fetchone()
+        
+        if loyalty:
+            new_tier = calculate_tier(loyalty['total_earned'])
+            if new_tier != loyalty['tier']:
                 cursor.execute("""
                     UPDATE loyalty_points
-                    SET points = points + %s,
-                        total_earned = total_earned + %s
+                    SET tier = %s
                     WHERE customer_id = %s
-                """, (tier_bonus, tier_bonus, customer_id))
+                """, (new_tier, customer_id))
                 
-                cursor.execute("""
-                    INSERT INTO loyalty_transactions
-                    (customer_id, points, type, description)
-                    VALUES (%s, %s, 'earned', %s)
-                """, (customer_id, tier_bonus, f'Tier upgrade bonus: {new_tier}'))
-    
-    conn.commit()
-    conn.close()
+                # Award tier upgrade bonus
+                tier_bonus = get_tier_bonus(new_tier)
+                if tier_bonus > 0:
+                    cursor.execute("""
+                        UPDATE loyalty_points
+                        SET points = points + %s,
+                            total_earned = total_earned + %s
+                        WHERE customer_id = %s
+                    """, (tier_bonus, tier_bonus, customer_id))
+                    
+                    cursor.execute("""
+                        INSERT INTO loyalty_transactions
+                        (customer_id, points, type, description)
+                        VALUES (%s, %s, 'earned', %s)
+                    """, (customer_id, tier_bonus, f'Tier upgrade bonus: {new_tier}'))
 
 def complete_referral(referred_customer_id):
     """Complete referral when referred customer makes first purchase"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Find pending referral
-    cursor.execute("""
-        SELECT * FROM referrals
-        WHERE referred_id = %s
-        AND status = 'pending'
-    """, (referred_customer_id,))
-    referral = cursor.fetchone()
-    
-    if referral:
-        # Mark as completed
-        cursor.execute("""
-            UPDATE referrals
-            SET status = 'completed',
-                completed_at = NOW()
-            WHERE id = %s
-        """, (referral['id'],))
-        
-        # Award points to referrer
-        award_points(
-            referral['referrer_id'],
-            REFERRAL_REWARD,
-            f'Referral reward for inviting customer #{referred_customer_id}'
-        )
+    with transaction() as conn:
+        cursor = conn.cursor()
         
-        # Award welcome bonus to referred customer
-        award_points(
-            referred_customer_id,
-            50,
-            'Welcome bonus for joining via referral'
-        )
+        # Find pending referral
+        cursor.execute("""
+            SELECT * FROM referrals
+            WHERE referred_id = %s
+            AND status = 'pending'
+            FOR UPDATE
+        """, (referred_customer_id,))
+        referral = cursor.fetchone()
         
-        conn.commit()
-    
-    conn.close()
+        if referral:
+            # Mark as completed
+            cursor.execute("""
+                UPDATE referrals
+                SET status = 'completed',
+                    completed_at = NOW()
+                WHERE id = %s
+            """, (referral['id'],))
+            
+            # Award points to referrer (same transaction)
+            award_points(
+                referral['referrer_id'],
+                REFERRAL_REWARD,
+                f'Referral reward for inviting customer #{referred_customer_id}'
+            )
+            
+            # Award welcome bonus to referred customer
+            award_points(
+                referred_customer_id,
+                50,
+                'Welcome bonus for joining via referral'
+            )
+
+@handler('complete_referral')
+def _complete_referral(cursor, payload):
+    """Outbox handler: queued by payment_success for the paying customer"""
+    complete_referral(payload['customer_id'])
 
 def calculate_tier(total_points):
     """Calculate tier based on total points earned"""
@@ -0,0 +1,56 @@
+"""
+Operational Metrics Routes
+Exposes internal performance counters for monitoring
+"""
+
+from flask import jsonify
+from app import app, login_required
+from services.db_pool import get_pool
+from services.view_tracker import get_view_buffer
+from services.task_queue import get_task_queue
+from services.outbox import outbox
+from services.email_dispatcher import get_email_dispatcher
+from services.email_renderer import email_renderer
+from services.newsletter_service import campaign_progress
+from services.payment_gateway import get_gateway_session
+from services.ai_completions import completion_cache
+from services.response_cache import get_response_cache
+from services.conditional_get import conditional_stats
+from services.fragment_cache import fragment_cache
+from services.search_service import search_service
+from services.facet_service import facet_index
+from services.suggest_service import suggest_index
+from services.price_index import price_index
+from services.recommendation_engine import recommendation_engine
+from services.trending_service import trending_service
+from services.personalization_service import personalization_service
+
+@app.route('/admin/metrics')
+@login_required('admin')
+def admin_metrics():
+    """
+    Runtime metrics for the admin / monitoring
+    """
+    return jsonify({
+        'success': True,
+        'db_pool': get_pool().stats(),
+        'view_buffer': get_view_buffer().stats(),
+        'task_queue': get_task_queue().stats(),
+        'outbox': outbox.stats(),
+        'email': get_email_dispatcher().stats(),
+        'email_renderer': email_renderer.stats(),
+        'newsletter_campaigns': campaign_progress(),
+        'payment_gateway': get_gateway_session().stats(),
+        'ai_completions': completion_cache.stats(),
+        'response_cache': get_response_cache().stats() if get_response_cache() else None,
+        'conditional_get': conditional_stats.stats(),
+        'fragment_cache': fragment_cache.stats(),
+        'sessions': app.session_interface.stats() if hasattr(app.session_interface, 'stats') else None,
+        'search_index': search_service.stats(),
+        'facet_index': facet_index.stats(),
+        'suggest_index': suggest_index.stats(),
+        'price_index': price_index.stats(),
+        'recommendation_engine': recommendation_engine.stats(),
+        'trending': trending_service.stats(),
+        'personalized': personalization_service.stats()
+    })
@@ -6,8 +6,42 @@ Handles all recommendation-related endpoints
 from flask import render_template, request, jsonify, session
 from app import app, get_db_connection
 from services.recommendation_service import recommendation_service
+from services.recommendation_engine import recommendation_engine
+from services.price_index import price_index
+from services.trending_service import trending_service
+from services.personalization_service import personalization_service
+from services.conditional_get import conditional
+
+def _current_customer_id():
+    return session.get('customer_id') if session.get('role') == 'customer' else None
+
+def _recommendations_version(product_id):
+    """Engine contents, plus the customer's recent views when signed in"""
+    customer_id = _current_customer_id()
+    viewed = recommendation_engine.recently_viewed_version(customer_id) if customer_id else None
+    return (recommendation_engine.content_version(), customer_id, viewed), None
+
+def _trending_version():
+    return trending_service.content_version(), None
+
+def _personalized_version():
+    """Stored list version; None while it needs recomputing"""
+    customer_id = _current_customer_id()
+    if not customer_id:
+        return None
+    stored = personalization_service.stored_version(customer_id)
+    if stored is None:
+        return None
+    version, computed_at, has_list = stored
+    # Products are described from the engine; an empty list falls back to trending
+    fallback = None if has_list else trending_service.content_version()
+    return (customer_id, version, computed_at, recommendation_engine.content_version(), fallback), None
+
+def _similar_price_version(product_id):
+    return (price_index.content_version(), recommendation_engine.content_version()), None
 
 @app.route('/api/recommendations/<int:product_id>')
+@conditional(_recommendations_version, private=True)
 def get_product_recommendations(product_id):
     """
     API endpoint to get recommendations for a specific product
@@ -34,6 +68,7 @@ def get_product_recommendations(product_id):
         }), 500
 
 @app.route('/api/recommendations/trending')
+@conditional(_trending_version)
 def get_trending_recommendations():
     """
     Get trending products
@@ -55,6 +90,7 @@ def get_trending_recommendations():
         }), 500
 
 @app.route('/api/recommendations/personalized')
+@conditional(_personalized_version, private=True)
 def get_personalized_recommendations():
     """
     Get personalized recommendations for logged-in user
@@ -86,16 +122,20 @@ def get_personalized_recommendations():
         }), 500
 
 @app.route('/api/recommendations/similar-price/<int:product_id>')
+@conditional(_similar_price_version)
 def get_similar_price_recommendations(product_id):
     """
     Get products with similar price range
+    ?scope=category restricts them to the product's category
     """
     limit = request.args.get('limit', 5, type=int)
+    same_category = request.args.get('scope') == 'category'
     
     try:
         similar = recommendation_service.get_similar_products_by_price(
             product_id=product_id,
-            limit=limit
+            limit=limit,
+            same_category=same_category
         )
         
         return jsonify({
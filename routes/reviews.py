@@ -1,5 +1,7 @@
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
 from app import app, get_db_connection, login_required
+from services.product_stats import get_product_stats, record_review, change_review_rating, remove_review
+from services import response_cache
 
 @app.route('/product/<int:product_id>/reviews')
 def product_reviews(product_id):
@@ -8,13 +10,20 @@ def product_reviews(product_id):
     cursor = conn.cursor()
     
     # Get product info
-    cursor.execute("SELECT name, average_rating, review_count FROM products WHERE id = %s", (product_id,))
+    cursor.execute("SELECT name FROM products WHERE id = %s", (product_id,))
     product = cursor.fetchone()
     
     if not product:
         flash('Product not found.', 'error')
+        conn.close()
         return redirect(url_for('products'))
     
+    # Rating summary and distribution come from the materialized stats row
+    stats = get_product_stats(cursor, product_id)
+    product['average_rating'] = stats['avg_rating']
+    product['review_count'] = stats['review_count']
+    rating_distribution = {star: count for star, count in stats['rating_distribution'].items() if count}
+    
     # Get all reviews
     cursor.execute("""
         SELECT pr.*, c.first_name, c.last_name
@@ -25,16 +34,6 @@ def product_reviews(product_id):
     """, (product_id,))
     reviews = cursor.fetchall()
     
-    # Get rating distribution
-    cursor.execute("""
-        SELECT rating, COUNT(*) as count
-        FROM product_reviews
-        WHERE product_id = %s
-        GROUP BY rating
-        ORDER BY rating DESC
-    """, (product_id,))
-    rating_distribution = {row['rating']: row['count'] for row in cursor.fetchall()}
-    
     conn.close()
     return render_template('customer/product_reviews.html', 
                          product=product, 
@@ -51,7 +50,7 @@ def add_review(order_id, product_id):
     
     # Verify customer purchased this product
     cursor.execute("""
-        SELECT oi.*, p.name as product_name, o.status
+        SELECT oi.*, p.name as product_name, p.category_id, o.status
         FROM order_items oi
         JOIN orders o ON oi.order_id = o.id
         JOIN products p ON oi.product_id = p.id
@@ -91,19 +90,12 @@ def add_review(order_id, product_id):
                 VALUES (%s, %s, %s, %s, %s, %s)
             """, (product_id, session['customer_id'], order_id, rating, review_title, review_text))
             
-            # Update product average rating and review count
-            cursor.execute("""
-                UPDATE products 
-                SET average_rating = (
-                    SELECT AVG(rating) FROM product_reviews WHERE product_id = %s
-                ),
-                review_count = (
-                    SELECT COUNT(*) FROM product_reviews WHERE product_id = %s
-                )
-                WHERE id = %s
-            """, (product_id, product_id, product_id))
+            # Update product rating stats (same transaction)
+            record_review(cursor, product_id, rating)
             
             conn.commit()
+            # Cached product pages and listings show the rating
+            response_cache.purge_product(product_id, [order_item['category_id']])
             flash('Thank you for your review!', 'success')
             conn.close()
             return redirect(url_for('order_detail', order_id=order_id))
@@ -123,7 +115,7 @@ def edit_review(review_id):
     
     # Get review
     cursor.execute("""
-        SELECT pr.*, p.name as product_name
+        SELECT pr.*, p.name as product_name, p.category_id
         FROM product_reviews pr
         JOIN products p ON pr.product_id = p.id
         WHERE pr.id = %s AND pr.customer_id = %s
@@ -150,16 +142,11 @@ def edit_review(review_id):
                 WHERE id = %s AND customer_id = %s
             """, (rating, review_title, review_text, review_id, session['customer_id']))
             
-            # Update product average rating
-            cursor.execute("""
-                UPDATE products 
-                SET average_rating = (
-                    SELECT AVG(rating) FROM product_reviews WHERE product_id = %s
-                )
-                WHERE id = %s
-            """, (review['product_id'], review['product_id']))
+            # Update product rating stats (same transaction)
+            change_review_rating(cursor, review['product_id'], review['rating'], rating)
             
             conn.commit()
+            response_cache.purge_product(review['product_id'], [review['category_id']])
             flash('Review updated successfully!', 'success')
             conn.close()
             return redirect(url_for('order_detail', order_id=review['order_id']))
@@ -176,8 +163,10 @@ def delete_review(review_id):
     
     # Get review to get product_id
     cursor.execute("""
-        SELECT product_id, order_id FROM product_reviews 
-        WHERE id = %s AND customer_id = %s
+        SELECT pr.product_id, pr.order_id, pr.rating, p.category_id
+        FROM product_reviews pr
+        JOIN products p ON pr.product_id = p.id
+        WHERE pr.id = %s AND pr.customer_id = %s
     """, (review_id, session['customer_id']))
     review = cursor.fetchone()
     
@@ -189,20 +178,12 @@ def delete_review(review_id):
     # Delete review
     cursor.execute("DELETE FROM product_reviews WHERE id = %s", (review_id,))
     
-    # Update product stats
-    cursor.execute("""
-        UPDATE products 
-        SET average_rating = COALESCE((
-            SELECT AVG(rating) FROM product_reviews WHERE product_id = %s
-        ), 0),
-        review_count = (
-            SELECT COUNT(*) FROM product_reviews WHERE product_id = %s
-        )
-        WHERE id = %s
-    """, (review['product_id'], review['product_id'], review['product_id']))
+    # Update product rating stats (same transaction)
+    remove_review(cursor, review['product_id'], review['rating'])
     
     conn.commit()
     conn.close()
+    response_cache.purge_product(review['product_id'], [review['category_id']])
     flash('Review deleted.', 'info')
     return redirect(url_for('order_detail', order_id=review['order_id']))
 
@@ -9,8 +9,9 @@ import uuid
 from services.email_service import (
     send_product_added_email,
     send_seller_order_notification,
-    send_order_status_email
+    queue_email
 )
+from services import catalog_index, response_cache
 
 @app.route('/seller/dashboard')
 @login_required('seller')
@@ -148,6 +149,9 @@ def add_product():
         conn.commit()
         conn.close()
         
+        catalog_index.refresh_product(product_id)
+        response_cache.purge_product(product_id, [request.form['category_id']])
+        
         # Send product added email
         if seller:
             try:
@@ -234,6 +238,8 @@ def edit_product(product_id):
         
         conn.commit()
         conn.close()
+        catalog_index.refresh_product(product_id)
+        response_cache.purge_product(product_id, {product['category_id'], int(request.form['category_id'])})
         flash('Product updated successfully!', 'success')
         return redirect(url_for('seller_products'))
     
@@ -251,7 +257,7 @@ def delete_product(product_id):
     cursor = conn.cursor()
     
     # Check if product belongs to seller
-    cursor.execute("SELECT image_url FROM products WHERE id = %s AND seller_id = %s", 
+    cursor.execute("SELECT image_url, category_id FROM products WHERE id = %s AND seller_id = %s", 
                    (product_id, session['seller_id']))
     product = cursor.fetchone()
     
@@ -270,6 +276,8 @@ def delete_product(product_id):
                    (product_id, session['seller_id']))
     conn.commit()
     conn.close()
+    catalog_index.remove_product(product_id)
+    response_cache.purge_product(product_id, [product['category_id']])
     
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('seller_products'))
@@ -337,23 +345,14 @@ def update_order_status():
             WHERE id = %s
         """, (status, order_info['order_id']))
     
+    # Status update email to the customer, sent from the outbox once this commits
+    if order_info:
+        queue_email(cursor, 'send_order_status_email', order_info['email'],
+                    f"{order_info['first_name']} {order_info['last_name']}",
+                    order_info['order_number'], status, order_info['order_id'])
+    
     conn.commit()
     conn.close()
     
-    # Send order status update email to customer
-    if order_info:
-        try:
-            customer_name = f"{order_info['first_name']} {order_info['last_name']}"
-            send_order_status_email(
-                order_info['email'],
-                customer_name,
-                order_info['order_number'],
-                status,
-                order_info['order_id']
-            )
-            print(f"✅ Order status update email sent to {order_info['email']}")
-        except Exception as e:
-            print(f"❌ Failed to send order status update email: {e}")
-    
     flash('Order status updated successfully! Customer notified via email.', 'success')
     return redirect(url_for('seller_orders'))
\ No newline at end of file
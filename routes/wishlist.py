@@ -1,5 +1,6 @@
 from flask import render_template, request, redirect, url_for, session, flash, jsonify
 from app import app, get_db_connection, login_required
+from services.personalization_service import invalidate as invalidate_recommendations
 
 @app.route('/wishlist')
 @login_required('customer')
@@ -12,11 +13,12 @@ def wishlist():
         cursor.execute("""
             SELECT w.*, p.name, p.price, p.discount_price, p.image_url, 
                    p.quantity as stock, 
-                   COALESCE(p.average_rating, 0) as average_rating, 
-                   COALESCE(p.review_count, 0) as review_count,
+                   COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as average_rating, 
+                   COALESCE(ps.rating_count, 0) as review_count,
                    s.business_name, c.name as category_name
             FROM wishlist w
             JOIN products p ON w.product_id = p.id
+            LEFT JOIN product_stats ps ON ps.product_id = p.id
             JOIN sellers s ON p.seller_id = s.id
             JOIN categories c ON p.category_id = c.id
             WHERE w.customer_id = %s AND p.is_active = 1
@@ -63,6 +65,7 @@ def add_to_wishlist():
     # Add to wishlist
     cursor.execute("INSERT INTO wishlist (customer_id, product_id) VALUES (%s, %s)",
                   (session['customer_id'], product_id))
+    invalidate_recommendations(cursor, session['customer_id'])
     conn.commit()
     conn.close()
     
@@ -79,6 +82,7 @@ def remove_from_wishlist(wishlist_id):
     cursor = conn.cursor()
     cursor.execute("DELETE FROM wishlist WHERE id = %s AND customer_id = %s", 
                   (wishlist_id, session['customer_id']))
+    invalidate_recommendations(cursor, session['customer_id'])
     conn.commit()
     conn.close()
     flash('Removed from wishlist.', 'info')
@@ -154,6 +158,7 @@ def api_add_to_wishlist():
             INSERT INTO wishlist (customer_id, product_id) 
             VALUES (%s, %s)
         """, (session['customer_id'], product_id))
+        invalidate_recommendations(cursor, session['customer_id'])
         
         conn.commit()
         conn.close()
@@ -190,6 +195,7 @@ def api_remove_from_wishlist():
             DELETE FROM wishlist 
             WHERE customer_id = %s AND product_id = %s
         """, (session['customer_id'], product_id))
+        invalidate_recommendations(cursor, session['customer_id'])
         
         conn.commit()
         conn.close()
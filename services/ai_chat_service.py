@@ -4,23 +4,13 @@ AI Chat Service for E-Commerce Platform
 Provides intelligent assistance for customers and sellers using OpenAI GPT
 """
 
-from openai import OpenAI
 import json
 from datetime import datetime
 from flask import current_app, session
-import pymysql
+from services.db_pool import get_db_connection
+from services.ai_completions import completion_cache, create_completion, get_ai_client
 import traceback
 
-def get_db_connection():
-    """Get database connection"""
-    return pymysql.connect(
-        host=current_app.config['MYSQL_HOST'],
-        user=current_app.config['MYSQL_USER'],
-        password=current_app.config['MYSQL_PASSWORD'],
-        database=current_app.config['MYSQL_DB'],
-        cursorclass=pymysql.cursors.DictCursor
-    )
-
 def get_user_context():
     """Get current user context for personalized responses"""
     context = {
@@ -156,18 +146,14 @@ def get_chat_response(user_message, conversation_history=None):
         dict: Response with message and metadata
     """
     try:
-        # Initialize OpenAI client
-        api_key = current_app.config['OPENAI_API_KEY']
-        
-        if not api_key or api_key == 'your-openai-api-key-here':
+        # OpenAI client shared by the process (see services/ai_completions.py)
+        if get_ai_client() is None:
             return {
                 'success': False,
                 'message': "AI chat is currently unavailable. Please contact support for assistance.",
                 'error': 'API key not configured'
             }
         
-        client = OpenAI(api_key=api_key)
-        
         # Get user context and platform data
         user_context = get_user_context()
         platform_data = get_platform_data()
@@ -191,23 +177,25 @@ def get_chat_response(user_message, conversation_history=None):
         # Add current user message
         messages.append({"role": "user", "content": user_message})
         
-        # Get response from OpenAI
-        response = client.chat.completions.create(
-            model=current_app.config['AI_CHAT_MODEL'],
-            messages=messages,
-            max_tokens=current_app.config['AI_CHAT_MAX_TOKENS'],
-            temperature=current_app.config['AI_CHAT_TEMPERATURE'],
-            presence_penalty=0.1,
-            frequency_penalty=0.1
-        )
-        
-        ai_message = response.choices[0].message.content.strip()
+        # Get response from OpenAI, or the cached answer to the same question
+        # from the same kind of user with the same prompt and prior turns
+        model = current_app.config['AI_CHAT_MODEL']
+        params = {
+            'max_tokens': current_app.config['AI_CHAT_MAX_TOKENS'],
+            'temperature': current_app.config['AI_CHAT_TEMPERATURE'],
+            'presence_penalty': 0.1,
+            'frequency_penalty': 0.1
+        }
+        context = json.dumps(messages[:-1], sort_keys=True)
+        cache_key = completion_cache.key(model, user_message, user_context['user_type'], context, **params)
+        ai_message, tokens_used, source = create_completion(cache_key, messages, model, **params)
         
         return {
             'success': True,
             'message': ai_message,
-            'tokens_used': response.usage.total_tokens,
-            'model': current_app.config['AI_CHAT_MODEL']
+            'tokens_used': tokens_used,
+            'model': model,
+            'cached': source != 'miss'
         }
         
     except Exception as e:
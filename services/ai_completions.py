@@ -0,0 +1,195 @@
+"""
+AI Completions
+OpenAI chat completions behind a per-process cache: answers keyed by the
+normalized message, intent, a hash of the context sent with it (products,
+platform data, prior turns) and the model, kept in an LRU with a TTL, and
+concurrent identical requests coalesced into one API call
+
+AI_CHAT_FAKE=true answers with FakeChatClient, a local stand-in for the
+API, so the cache can be exercised without a key or spend.
+"""
+
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+from flask import current_app
+from openai import OpenAI
+from services.response_cache import LocalTier
+
+
+class FakeChatClient:
+    """
+    Local stand-in for OpenAI(): client.chat.completions.create(...) waits
+    `latency` seconds and echoes the question, with word counts as usage
+    """
+
+    def __init__(self, latency=0.5):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **params):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        question = messages[-1]['content'].split('\n')[0]
+        content = f"[{model}] Here is what I found for: {question}"
+        prompt_tokens = sum(len(message['content'].split()) for message in messages)
+        completion_tokens = len(content.split())
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens)
+        )
+
+
+class Flight:
+    """One API call in progress that identical requests wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CompletionCache:
+    """
+    LRU + TTL cache of completions with single-flight coalescing
+
+    The first request for a key calls the API; identical requests arriving
+    meanwhile wait (up to wait_timeout) for its answer instead of calling
+    again. Failed calls are not cached, and their error is raised to the
+    waiting requests too.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, wait_timeout=30.0, enabled=True):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.local = LocalTier(max_entries)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0, 'wait_timeouts': 0,
+            'tokens_spent': 0, 'tokens_saved': 0
+        }
+
+    @staticmethod
+    def key(model, message, intent, context, **params):
+        """Cache key: model, intent, the message lowercased with whitespace collapsed, and a context hash"""
+        normalized = ' '.join(message.lower().split()).rstrip('?!. ')
+        digest = hashlib.sha256(context.encode('utf-8')).hexdigest()
+        return repr((model, intent, normalized, digest, sorted(params.items())))
+
+    def _count(self, stat, tokens=0, token_stat=None):
+        with self._lock:
+            self._stats[stat] += 1
+            if token_stat:
+                self._stats[token_stat] += tokens
+
+    def complete(self, key, call):
+        """
+        The answer for key: cached, from an identical call in flight, or from
+        call(), which returns (text, tokens_used). Returns (text, tokens_used,
+        source) with source 'hit', 'coalesced' or 'miss'.
+        """
+        if not self.enabled:
+            text, tokens = call()
+            self._count('misses', tokens, 'tokens_spent')
+            return text, tokens, 'miss'
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = False
+            if flight is None:
+                cached = self.local.get(key)
+                if cached is None:
+                    flight = self._flights[key] = Flight()
+                    leader = True
+        if flight is None:
+            self._count('hits', cached[1], 'tokens_saved')
+            return cached[0], cached[1], 'hit'
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                self._count('wait_timeouts')
+                text, tokens = call()
+                self._count('misses', tokens, 'tokens_spent')
+                return text, tokens, 'miss'
+            if flight.error is not None:
+                raise flight.error
+            self._count('coalesced', flight.result[1], 'tokens_saved')
+            return flight.result[0], flight.result[1], 'coalesced'
+
+        try:
+            flight.result = call()
+            self.local.set(key, flight.result, self.ttl, ())
+        except Exception as e:
+            flight.error = e
+            self._count('errors')
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        self._count('misses', flight.result[1], 'tokens_spent')
+        return flight.result[0], flight.result[1], 'miss'
+
+    def stats(self):
+        """Entries, hit rate (hits and coalesced over all requests) and tokens spent and saved"""
+        with self._lock:
+            stats = dict(self._stats)
+            in_flight = len(self._flights)
+        requests = stats['hits'] + stats['coalesced'] + stats['misses']
+        return {
+            'enabled': self.enabled,
+            'entries': len(self.local),
+            'evictions': self.local.evictions,
+            'in_flight': in_flight,
+            'hit_rate': round((stats['hits'] + stats['coalesced']) / requests, 4) if requests else None,
+            **stats
+        }
+
+
+# Create singleton instance
+completion_cache = CompletionCache()
+
+
+def get_ai_client():
+    """The application's OpenAI client (or FakeChatClient); None when no API key is configured"""
+    return current_app.extensions.get('ai_client')
+
+
+def create_completion(cache_key, messages, model, **params):
+    """
+    Chat completion for messages through the completion cache. Raises when
+    the API fails or is not configured. Returns (text, tokens_used, source);
+    tokens_used is 0 unless this call went to the API.
+    """
+    def call():
+        client = get_ai_client()
+        if client is None:
+            raise RuntimeError("OpenAI API key not configured")
+        response = client.chat.completions.create(model=model, messages=messages, **params)
+        return response.choices[0].message.content.strip(), response.usage.total_tokens
+
+    text, tokens, source = completion_cache.complete(cache_key, call)
+    return text, tokens if source == 'miss' else 0, source
+
+
+def init_app(app):
+    """Create the application's API client (one connection pool per process) and size the cache"""
+    api_key = app.config['OPENAI_API_KEY']
+    if app.config['AI_CHAT_FAKE']:
+        client = FakeChatClient()
+    elif api_key and api_key != 'your-openai-api-key-here':
+        client = OpenAI(api_key=api_key)
+    else:
+        client = None
+    app.extensions['ai_client'] = client
+    completion_cache.enabled = app.config['AI_CACHE_ENABLED']
+    completion_cache.ttl = app.config['AI_CACHE_TTL']
+    completion_cache.local.max_entries = app.config['AI_CACHE_MAX_ENTRIES']
+    return completion_cache
@@ -6,27 +6,26 @@ Intelligent chatbot for product recommendations and queries
 import openai
 import json
 import re
-import pymysql
 from datetime import datetime
+from services.db_pool import get_db_connection
+from services.search_service import search_service
+from services.ai_completions import completion_cache, create_completion
+
+# Model and limits of the assistant's answers
+ASSISTANT_MODEL = 'gpt-3.5-turbo'
+ASSISTANT_MAX_TOKENS = 300
+ASSISTANT_TEMPERATURE = 0.7
 
 class AIShoppingAssistant:
     """
     AI-powered shopping assistant using OpenAI GPT
     """
     
-    def __init__(self, api_key=None, db_config=None):
-        """Initialize with OpenAI API key and database config"""
+    def __init__(self, api_key=None):
+        """Initialize with OpenAI API key"""
         if api_key:
             openai.api_key = api_key
         
-        self.db_config = db_config or {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '',
-            'database': 'amazon_db',
-            'cursorclass': pymysql.cursors.DictCursor
-        }
-        
         self.conversation_history = []
         self.max_history = 10
         
@@ -189,8 +188,8 @@ class AIShoppingAssistant:
         return criteria
     
     def _get_db_connection(self):
-        """Get database connection"""
-        return pymysql.connect(**self.db_config)
+        """Get database connection from the shared pool"""
+        return get_db_connection()
     
     def _search_products(self, criteria):
         """
@@ -211,18 +210,18 @@ class AIShoppingAssistant:
                 p.quantity,
                 c.name as category_name,
                 s.business_name,
-                COALESCE(AVG(pr.rating), 0) as avg_rating,
-                COUNT(DISTINCT pr.id) as review_count,
+                COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as avg_rating,
+                COALESCE(ps.rating_count, 0) as review_count,
                 (
-                    COALESCE(AVG(pr.rating), 0) * 0.3 +
-                    (COUNT(DISTINCT pr.id) / 10.0) * 0.2 +
+                    COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) * 0.3 +
+                    (COALESCE(ps.rating_count, 0) / 10.0) * 0.2 +
                     CASE WHEN p.discount_price IS NOT NULL THEN 0.2 ELSE 0 END +
                     (p.quantity > 0) * 0.3
                 ) as relevance_score
             FROM products p
             JOIN categories c ON p.category_id = c.id
             JOIN sellers s ON p.seller_id = s.id
-            LEFT JOIN product_reviews pr ON p.id = pr.product_id
+            LEFT JOIN product_stats ps ON ps.product_id = p.id
             WHERE p.is_active = 1
         """
         
@@ -237,30 +236,31 @@ class AIShoppingAssistant:
             query += " AND p.price <= %s"
             params.append(criteria['max_price'])
         
-        # Add keyword search
+        # Keyword search goes through the shared full-text index
+        text_scores = {}
         if criteria['keywords']:
-            keyword_conditions = []
-            for keyword in criteria['keywords'][:5]:  # Limit to 5 keywords
-                keyword_conditions.append(
-                    "(p.name LIKE %s OR p.description LIKE %s OR c.name LIKE %s)"
-                )
-                keyword_pattern = f"%{keyword}%"
-                params.extend([keyword_pattern, keyword_pattern, keyword_pattern])
-            
-            if keyword_conditions:
-                query += " AND (" + " OR ".join(keyword_conditions) + ")"
-        
-        query += """
-            GROUP BY p.id, p.name, p.description, p.price, p.discount_price, 
-                     p.image_url, p.quantity, c.name, s.business_name
-            ORDER BY relevance_score DESC, avg_rating DESC
-            LIMIT 10
-        """
+            ranked = search_service.search(' '.join(criteria['keywords']), limit=50)
+            if not ranked:
+                conn.close()
+                return []
+            text_scores = dict(ranked)
+            ids = list(text_scores)
+            query += " AND p.id IN (" + ", ".join(["%s"] * len(ids)) + ")"
+            params.extend(ids)
+        
+        query += " ORDER BY relevance_score DESC, avg_rating DESC"
+        if not text_scores:
+            query += " LIMIT 10"
         
         cursor.execute(query, params)
         results = cursor.fetchall()
         conn.close()
         
+        if text_scores:
+            # Text match first, then the rating/stock based relevance score
+            results = sorted(results, key=lambda row: (text_scores.get(row['id'], 0), row['relevance_score']),
+                             reverse=True)[:10]
+        
         products = []
         for row in results:
             products.append({
@@ -283,6 +283,11 @@ class AIShoppingAssistant:
     def _generate_response(self, user_message, products, intent, customer_id=None):
         """
         Generate AI response using OpenAI GPT
+        
+        Answers are cached by message, intent and product context, so
+        everyone asking the same question about the same products (e.g. a
+        quick suggestion) shares one API call; the conversation history is
+        sent along but is not part of the key.
         """
         try:
             # Prepare context for GPT
@@ -306,16 +311,16 @@ class AIShoppingAssistant:
                 messages.append({"role": "user", "content": msg['user']})
                 messages.append({"role": "assistant", "content": msg['assistant']})
             
-            # Call OpenAI API
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=300,
-                temperature=0.7
+            # Call OpenAI API (or reuse the answer to the same question)
+            cache_key = completion_cache.key(ASSISTANT_MODEL, user_message, intent, context)
+            ai_response, _, _ = create_completion(
+                cache_key,
+                messages,
+                model=ASSISTANT_MODEL,
+                max_tokens=ASSISTANT_MAX_TOKENS,
+                temperature=ASSISTANT_TEMPERATURE
             )
             
-            ai_response = response.choices[0].message.content.strip()
-            
             return ai_response
             
         except Exception as e:
@@ -418,14 +423,13 @@ class AIShoppingAssistant:
                 c.name as category_name,
                 s.business_name,
                 s.owner_name,
-                COALESCE(AVG(pr.rating), 0) as avg_rating,
-                COUNT(DISTINCT pr.id) as review_count
+                COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as avg_rating,
+                COALESCE(ps.rating_count, 0) as review_count
             FROM products p
             JOIN categories c ON p.category_id = c.id
             JOIN sellers s ON p.seller_id = s.id
-            LEFT JOIN product_reviews pr ON p.id = pr.product_id
+            LEFT JOIN product_stats ps ON ps.product_id = p.id
             WHERE p.id = %s
-            GROUP BY p.id
         """
         
         cursor.execute(query, (product_id,))
@@ -0,0 +1,293 @@
+"""
+Catalog Index Base
+Shared plumbing for in-memory indexes over the products table (search,
+facets, autocomplete): initial load at startup, incremental sync and
+rebuilds on a background thread, and change hooks
+"""
+
+import copy
+import os
+import threading
+import time
+from flask import current_app
+from services.db_pool import get_db_connection
+
+# Seconds between the refresher's checks for due syncs and rebuilds
+REFRESH_TICK = 1.0
+
+# Seconds before a failed build is retried (until then the index stays empty or stale)
+BUILD_RETRY_INTERVAL = 10
+
+# Every product column an index may need; one query shape for build, sync and refresh
+_CATALOG_QUERY = """
+    SELECT p.id, p.name, p.description, p.brand, p.price, p.discount_price,
+           p.image_url, p.quantity, p.category_id, c.name as category_name,
+           s.business_name,
+           COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as average_rating,
+           COALESCE(ps.rating_count, 0) as review_count,
+           COALESCE(ps.view_count, 0) as view_count,
+           COALESCE(ps.sales_count, 0) as sales_count,
+           p.is_active, s.is_approved, p.updated_at, ps.updated_at as stats_updated_at
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    JOIN sellers s ON p.seller_id = s.id
+    LEFT JOIN product_stats ps ON ps.product_id = p.id
+"""
+
+# All live indexes, so a product change reaches each of them
+_registry = []
+
+
+class CatalogIndex:
+    """
+    Base class for a per-process index of visible products
+
+    The index is built from the database at startup (warm()). Seller
+    add/edit/delete call refresh_product()/remove_product() so the change is
+    visible immediately; writes from other worker processes are picked up by
+    an incremental sync on products.updated_at and product_stats.updated_at
+    (ratings, sales, views) every sync_interval seconds, and a full rebuild
+    every rebuild_interval seconds catches the rest (deletes and seller
+    approval changes made elsewhere). Syncs and rebuilds run on one
+    background thread per process; requests never wait for them.
+
+    A rebuild fills a copy of the index and then swaps its contents in, so
+    queries keep using the old contents meanwhile. Subclasses implement
+    _build(rows), _add(row) and _remove(product_id); _build must replace
+    (not mutate) the containers it fills, and queries that read several of
+    them together hold _write_lock, which the swap takes too.
+    """
+
+    name = 'catalog'
+
+    def __init__(self, sync_interval=60, rebuild_interval=3600):
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._loaded_at = None
+        self._synced_at = None
+        self._high_water = None  # Latest products.updated_at seen
+        self._version = 0  # Bumped whenever the contents may have changed
+        self._lock = threading.Lock()
+        self._retry_at = 0.0  # monotonic time a failed build may be retried
+        self._building = False
+        self._changed_while_building = set()  # product ids to re-read after the swap
+        _registry.append(self)
+
+    # Subclass hooks
+    def _build(self, rows):
+        """Replace the whole index with these (visible) rows"""
+        raise NotImplementedError
+
+    def _add(self, row):
+        """Insert or update one visible product"""
+        raise NotImplementedError
+
+    def _remove(self, product_id):
+        """Drop one product (no-op if it is not indexed)"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _visible(row):
+        return bool(row['is_active']) and bool(row['is_approved'])
+
+    def _fetch(self, where='', params=()):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(_CATALOG_QUERY + where, params)
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def _rebuild(self):
+        rows = self._fetch()
+        self._building = True
+        try:
+            self._swap_in(self._staged([row for row in rows if self._visible(row)]))
+        finally:
+            self._building = False
+        self._high_water = max(
+            (stamp for row in rows for stamp in (row['updated_at'], row['stats_updated_at']) if stamp),
+            default=None
+        )
+        self._loaded_at = self._synced_at = time.monotonic()
+        self._version += 1
+        print(f"🔎 {self.name} index built: {len(rows)} products")
+
+        # Seller edits made while the copy was being filled went to the old contents
+        changed, self._changed_while_building = self._changed_while_building, set()
+        for product_id in changed:
+            self.refresh_product(product_id)
+
+    def _staged(self, rows):
+        """
+        A copy of this index built from rows; returns the attributes _build
+        replaced, to be swapped in
+        """
+        staged = copy.copy(self)
+        staged._write_lock = threading.RLock()  # Its own, so queries are not held up
+        original = dict(vars(staged))
+        staged._build(rows)
+        return {name: value for name, value in vars(staged).items()
+                if name != '_write_lock' and value is not original.get(name)}
+
+    def _swap_in(self, contents):
+        """Replace this index's contents with a staged copy's"""
+        write_lock = getattr(self, '_write_lock', None) or threading.Lock()
+        with write_lock:
+            for name, value in contents.items():
+                setattr(self, name, value)
+
+    def _sync(self):
+        if self._high_water is None:
+            self._rebuild()
+            return
+        # >= so rows written in the same second as the high-water mark are not missed.
+        # Two range scans (one per updated_at index) rather than an OR across tables.
+        since = self._high_water
+        rows = {row['id']: row for row in self._fetch(" WHERE p.updated_at >= %s", (since,))}
+        stats_rows = self._fetch(" WHERE ps.updated_at >= %s", (since,))
+        rows.update((row['id'], row) for row in stats_rows)
+        for row in rows.values():
+            self._apply(row)
+            for stamp in (row['updated_at'], row['stats_updated_at']):
+                if stamp and stamp > self._high_water:
+                    self._high_water = stamp
+        if self._high_water != since:
+            self._version += 1
+        self._synced_at = time.monotonic()
+
+    def _apply(self, row):
+        if self._visible(row):
+            self._add(row)
+        else:
+            self._remove(row['id'])
+
+    def refresh_due(self):
+        """
+        Rebuild or sync the index if it is due (or not built yet); called by
+        the refresher thread and warm() inside an app context. Failures are
+        logged and the current contents kept.
+        """
+        with self._lock:
+            now = time.monotonic()
+            try:
+                if self._loaded_at is None or now - self._loaded_at >= self.rebuild_interval:
+                    if now < self._retry_at:
+                        return
+                    self._rebuild()
+                elif now - self._synced_at >= self.sync_interval:
+                    self._sync()
+            except Exception as e:
+                if self._loaded_at is None:
+                    self._retry_at = now + BUILD_RETRY_INTERVAL
+                    print(f"❌ {self.name} index build failed, serving no results; retrying in "
+                          f"{BUILD_RETRY_INTERVAL}s: {e}")
+                else:
+                    print(f"❌ {self.name} index sync failed: {e}")
+
+    def ensure_fresh(self):
+        """
+        Make sure this process's refresher thread is running; the index
+        itself is kept fresh there, never on the calling request
+        """
+        _refresher.ensure_running(current_app._get_current_object())
+
+    def refresh_product(self, product_id):
+        """Re-read one product after it was added or edited"""
+        if self._building:
+            self._changed_while_building.add(product_id)
+        if self._loaded_at is None:
+            return  # Not built yet; the build loads everything
+        try:
+            rows = self._fetch(" WHERE p.id = %s", (product_id,))
+            if rows:
+                self._apply(rows[0])
+            else:
+                self._remove(product_id)
+            self._version += 1
+        except Exception as e:
+            print(f"❌ Failed to refresh product {product_id} in {self.name} index: {e}")
+
+    def remove_product(self, product_id):
+        """Drop a deleted product"""
+        if self._building:
+            self._changed_while_building.add(product_id)
+        self._remove(product_id)
+        self._version += 1
+
+    def content_version(self):
+        """
+        Identifies the current contents of this process's index (for ETags);
+        it changes whenever they may have changed
+        """
+        self.ensure_fresh()
+        return f'{os.getpid()}.{self._version}'
+
+    def sync_stats(self):
+        return {
+            'loaded': self._loaded_at is not None,
+            'seconds_since_sync': round(time.monotonic() - self._synced_at, 1) if self._synced_at else None
+        }
+
+
+class _Refresher:
+    """One thread per process that syncs and rebuilds every catalog index when due"""
+
+    def __init__(self):
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self, app):
+        # Started per process so that forked workers each get their own
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._app = app
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='catalog-refresher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            for index in list(_registry):
+                with self._app.app_context():
+                    index.refresh_due()
+            time.sleep(REFRESH_TICK)
+
+
+_refresher = _Refresher()
+
+
+def warm(app):
+    """
+    Build every catalog index now, at startup, and start the refresher
+    thread; call once all route modules (and so all indexes) are imported.
+    Returns how many indexes were built.
+    """
+    if not app.config['CATALOG_WARM_ON_START']:
+        return 0
+    started = time.perf_counter()
+    with app.app_context():
+        for index in _registry:
+            index.refresh_due()
+    _refresher.ensure_running(app)
+    built = sum(1 for index in _registry if index._loaded_at is not None)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"🔎 Warmed {built}/{len(_registry)} catalog indexes in {elapsed:.0f} ms")
+    return built
+
+
+def refresh_product(product_id):
+    """Propagate an added or edited product to every catalog index"""
+    for index in _registry:
+        index.refresh_product(product_id)
+
+
+def remove_product(product_id):
+    """Propagate a deleted product to every catalog index"""
+    for index in _registry:
+        index.remove_product(product_id)
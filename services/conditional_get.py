@@ -0,0 +1,120 @@
+"""
+Conditional GET
+Strong ETags (and Last-Modified where there is one) computed from cheap
+version reads, so a client polling an unchanged JSON endpoint gets a
+304 Not Modified without the endpoint's query ever running
+"""
+
+import functools
+import hashlib
+import threading
+from flask import current_app, request
+from services.db_pool import get_db_connection
+
+
+def bump_version(cursor, scope):
+    """
+    Record a change to a versioned part of the catalog (e.g. 'categories',
+    'flash_deals'). Runs on the caller's cursor, so it commits with the
+    change itself.
+    """
+    cursor.execute("""
+        INSERT INTO catalog_versions (scope, version)
+        VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, (scope,))
+
+
+def read_version(scope):
+    """(version, updated_at) of a scope; (0, None) before its first change"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT version, updated_at FROM catalog_versions WHERE scope = %s", (scope,))
+    row = cursor.fetchone()
+    conn.close()
+    return (row['version'], row['updated_at']) if row else (0, None)
+
+
+class ConditionalStats:
+    """Per-endpoint counts of 304s and full responses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def count(self, endpoint, outcome):
+        with self._lock:
+            counts = self._endpoints.setdefault(endpoint, {'not_modified': 0, 'full': 0, 'unvalidated': 0})
+            counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self._endpoints.items()}
+
+
+conditional_stats = ConditionalStats()
+
+
+def _etag(token):
+    """Strong ETag for this URL (path and query) in the state described by token"""
+    key = repr((request.path, sorted(request.args.items(multi=True)), token))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def _set_validators(response, etag, last_modified, private):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Cacheable by browsers and CDNs, but revalidated before every reuse
+    response.headers['Cache-Control'] = 'private, no-cache' if private else 'public, no-cache'
+    if private:
+        response.vary.add('Cookie')
+
+
+def conditional(validator, private=False):
+    """
+    Answer GETs with 304 Not Modified when the client's copy is current
+
+    validator(*view_args) returns (token, last_modified) describing the
+    data behind the response, without running the view's query: the
+    token goes into the ETag, last_modified (a datetime or None) into
+    Last-Modified. It returns None when it cannot tell (the view then
+    runs and no validators are sent). private=True marks responses that
+    depend on the session: only the browser may keep them.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def decorated_function(*args, **kwargs):
+            try:
+                validated = validator(*args, **kwargs)
+            except Exception as e:
+                print(f"❌ Validator for {request.endpoint} failed: {e}")
+                validated = None
+            if validated is None:
+                conditional_stats.count(request.endpoint, 'unvalidated')
+                return view(*args, **kwargs)
+
+            token, last_modified = validated
+            etag = _etag(token)
+            if _not_modified(etag, last_modified):
+                conditional_stats.count(request.endpoint, 'not_modified')
+                response = current_app.response_class(status=304)
+                _set_validators(response, etag, last_modified, private)
+                return response
+
+            conditional_stats.count(request.endpoint, 'full')
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _set_validators(response, etag, last_modified, private)
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,258 @@
+"""
+Co-purchase Similarity Service
+Item-to-item "customers who bought this also bought" neighbours, computed
+offline from order_items and served from the product_similarity table
+
+Run the full build periodically (e.g. nightly from cron):
+    python -m services.copurchase_service [--metric cosine|jaccard] [--top-n 20]
+"""
+
+import numpy as np
+from services.db_pool import get_db_connection
+
+# Neighbours kept per product
+TOP_N = 20
+
+# Orders with more distinct products than this only contribute their first
+# MAX_BASKET items; one huge basket would otherwise add O(n^2) weak pairs
+MAX_BASKET = 50
+
+METRICS = ('cosine', 'jaccard')
+DEFAULT_METRIC = 'cosine'
+
+_INSERT_CHUNK = 1000
+
+
+def _similarity(pair_counts, counts_a, counts_b, metric):
+    """
+    Vectorised similarity of item pairs from co-occurrence counts
+
+    pair_counts[i] is the number of orders containing both items of pair i,
+    counts_a[i]/counts_b[i] the number of orders containing each item.
+    """
+    pair_counts = np.asarray(pair_counts, dtype=np.float64)
+    counts_a = np.asarray(counts_a, dtype=np.float64)
+    counts_b = np.asarray(counts_b, dtype=np.float64)
+    if metric == 'jaccard':
+        return pair_counts / np.maximum(counts_a + counts_b - pair_counts, 1.0)
+    return pair_counts / np.maximum(np.sqrt(counts_a * counts_b), 1.0)
+
+
+def _baskets(order_ids, product_ids):
+    """
+    Group (order_id, product_id) rows into baskets
+
+    Returns (product code per row, basket start per row, basket length per
+    row, products) with rows sorted by order and capped at MAX_BASKET items.
+    """
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+    products, codes = np.unique(np.asarray(product_ids, dtype=np.int64), return_inverse=True)
+
+    # Sort by order, drop duplicate (order, product) rows
+    order = np.lexsort((codes, order_ids))
+    order_ids, codes = order_ids[order], codes[order]
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = (order_ids[1:] != order_ids[:-1]) | (codes[1:] != codes[:-1])
+    order_ids, codes = order_ids[keep], codes[keep]
+
+    # Position of each row inside its basket; cap basket size
+    boundaries = np.flatnonzero(np.diff(order_ids)) + 1
+    starts = np.concatenate(([0], boundaries))
+    lengths = np.diff(np.concatenate((starts, [len(codes)])))
+    position = np.arange(len(codes)) - np.repeat(starts, lengths)
+    keep = position < MAX_BASKET
+    codes = codes[keep]
+    lengths = np.minimum(lengths, MAX_BASKET)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return codes, np.repeat(starts, lengths), np.repeat(lengths, lengths), products
+
+
+def compute_similarity(order_ids, product_ids, metric=DEFAULT_METRIC, top_n=TOP_N):
+    """
+    Build the item-item co-occurrence matrix and its top-N neighbours
+
+    The sparse matrix C = A^T A (A = order x product incidence) is built
+    directly as pair counts: every basket of k items expands into its k^2
+    (item, item) pairs, which np.unique collapses into counts. The diagonal
+    of C is the number of orders containing each item.
+
+    Returns (copurchase, similarity):
+        copurchase: [(product_id, related_product_id, order_count)] for every
+            nonzero entry of C, diagonal included
+        similarity: [(product_id, similar_product_id, score, co_purchase_count)]
+            for the best top_n neighbours of each product
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown similarity metric: {metric}")
+    if len(order_ids) == 0:
+        return [], []
+
+    codes, row_start, row_length, products = _baskets(order_ids, product_ids)
+    n = len(products)
+
+    # Expand every row into one pair per item of its basket
+    left = np.repeat(codes, row_length)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(row_length) - row_length, row_length)
+    right = codes[np.repeat(row_start, row_length) + offsets]
+
+    keys, pair_counts = np.unique(left * n + right, return_counts=True)
+    left, right = keys // n, keys % n
+
+    diagonal = left == right
+    item_counts = np.zeros(n, dtype=np.int64)
+    item_counts[left[diagonal]] = pair_counts[diagonal]
+
+    copurchase = list(zip(products[left].tolist(), products[right].tolist(), pair_counts.tolist()))
+
+    # Off-diagonal pairs: score, then keep the best top_n per product
+    left, right, pair_counts = left[~diagonal], right[~diagonal], pair_counts[~diagonal]
+    scores = _similarity(pair_counts, item_counts[left], item_counts[right], metric)
+    order = np.lexsort((-pair_counts, -scores, left))
+    left, right, pair_counts, scores = left[order], right[order], pair_counts[order], scores[order]
+    group_start = np.searchsorted(left, left, side='left')
+    rank = np.arange(len(left)) - group_start
+    best = rank < top_n
+
+    similarity = list(zip(
+        products[left[best]].tolist(),
+        products[right[best]].tolist(),
+        scores[best].round(6).tolist(),
+        pair_counts[best].tolist()
+    ))
+    return copurchase, similarity
+
+
+def _insert_rows(cursor, table, columns, rows):
+    for i in range(0, len(rows), _INSERT_CHUNK):
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+            rows[i:i + _INSERT_CHUNK]
+        )
+
+
+def rebuild(metric=DEFAULT_METRIC, top_n=TOP_N):
+    """
+    Full batch build from order_items, replacing both tables atomically
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT order_id, product_id FROM order_items")
+        rows = cursor.fetchall()
+        copurchase, similarity = compute_similarity(
+            [row['order_id'] for row in rows],
+            [row['product_id'] for row in rows],
+            metric, top_n
+        )
+
+        cursor.execute("DELETE FROM product_copurchase")
+        cursor.execute("DELETE FROM product_similarity")
+        _insert_rows(cursor, 'product_copurchase',
+                     ('product_id', 'related_product_id', 'order_count'), copurchase)
+        _insert_rows(cursor, 'product_similarity',
+                     ('product_id', 'similar_product_id', 'score', 'co_purchase_count'), similarity)
+        conn.commit()
+        print(f"🛒 Co-purchase similarity built: {len(rows)} order lines, "
+              f"{len(copurchase)} pairs, {len(similarity)} neighbours ({metric})")
+        return len(similarity)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def record_order(product_ids, metric=DEFAULT_METRIC, top_n=TOP_N, cursor=None):
+    """
+    Incremental update for one new order
+
+    Adds the order's pairs to the co-occurrence counts and recomputes the
+    neighbour lists of the products in it. Neighbours of *other* products
+    whose scores shift slightly because an item count changed are left
+    until the next full rebuild.
+
+    Runs in its own short transaction after the order has committed, so
+    popular pairs never hold row locks inside checkout. Given a cursor it
+    runs in the caller's transaction instead (the outbox handler, which
+    commits it together with its outbox row).
+    """
+    product_ids = list(dict.fromkeys(int(pid) for pid in product_ids))[:MAX_BASKET]
+    if not product_ids:
+        return
+    if cursor is not None:
+        _add_order(cursor, product_ids, metric, top_n)
+        return
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        _add_order(cursor, product_ids, metric, top_n)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _add_order(cursor, product_ids, metric, top_n):
+    pairs = [(a, b) for a in product_ids for b in product_ids]
+    cursor.execute(f"""
+        INSERT INTO product_copurchase (product_id, related_product_id, order_count)
+        VALUES {', '.join(['(%s, %s, 1)'] * len(pairs))}
+        ON DUPLICATE KEY UPDATE order_count = order_count + 1
+    """, [pid for pair in pairs for pid in pair])
+    if len(product_ids) > 1:
+        _refresh_neighbours(cursor, product_ids, metric, top_n)
+
+
+def _refresh_neighbours(cursor, product_ids, metric, top_n):
+    """Recompute the top-N rows of the given products from their counts"""
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    cursor.execute(f"""
+        SELECT c.product_id, c.related_product_id, c.order_count,
+               own.order_count as product_orders, other.order_count as related_orders
+        FROM product_copurchase c
+        JOIN product_copurchase own
+            ON own.product_id = c.product_id AND own.related_product_id = c.product_id
+        JOIN product_copurchase other
+            ON other.product_id = c.related_product_id AND other.related_product_id = c.related_product_id
+        WHERE c.product_id IN ({placeholders})
+        AND c.related_product_id != c.product_id
+    """, product_ids)
+    rows = cursor.fetchall()
+
+    neighbours = []
+    for product_id in product_ids:
+        mine = [row for row in rows if row['product_id'] == product_id]
+        if not mine:
+            continue
+        pair_counts = np.array([row['order_count'] for row in mine])
+        scores = _similarity(
+            pair_counts,
+            [row['product_orders'] for row in mine],
+            [row['related_orders'] for row in mine],
+            metric
+        )
+        best = np.argpartition(-scores, top_n - 1)[:top_n] if len(scores) > top_n else np.arange(len(scores))
+        neighbours.extend(
+            (product_id, mine[i]['related_product_id'], round(float(scores[i]), 6), int(pair_counts[i]))
+            for i in best
+        )
+
+    cursor.execute(f"DELETE FROM product_similarity WHERE product_id IN ({placeholders})", product_ids)
+    _insert_rows(cursor, 'product_similarity',
+                 ('product_id', 'similar_product_id', 'score', 'co_purchase_count'), neighbours)
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Rebuild the co-purchase similarity tables')
+    parser.add_argument('--metric', choices=METRICS, default=DEFAULT_METRIC)
+    parser.add_argument('--top-n', type=int, default=TOP_N)
+    args = parser.parse_args()
+
+    with app.app_context():
+        rebuild(args.metric, args.top_n)
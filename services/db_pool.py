@@ -0,0 +1,328 @@
+"""
+Database Connection Pool
+Shared, bounded pool of PyMySQL connections used by every route and service
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import pymysql
+from flask import current_app, g
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within DB_POOL_TIMEOUT"""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a PyMySQL connection.
+    Behaves like the raw connection, but close() hands it back to the pool
+    instead of tearing down the TCP session.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def returned(self):
+        return self._returned
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        if not self._returned:
+            self._returned = True
+            self._pool.release(self._raw)
+
+
+class ConnectionPool:
+    """
+    Bounded connection pool with health checks and idle timeout
+
+    - At most `max_size` connections are open at once; callers wait up to
+      `timeout` seconds for one to be returned.
+    - Connections idle for longer than `ping_interval` are pinged before
+      being handed out; dead ones are replaced transparently.
+    - Connections idle for longer than `idle_timeout` are closed.
+    """
+
+    def __init__(self, connect_kwargs, max_size=10, timeout=5.0, idle_timeout=300, ping_interval=30):
+        self.connect_kwargs = connect_kwargs
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+
+        self._idle = deque()  # (raw_connection, last_used_at)
+        self._size = 0
+        self._cond = threading.Condition(threading.Lock())
+
+        # Metrics
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._peak_in_use = 0
+
+    def _connect(self):
+        return pymysql.connect(**self.connect_kwargs)
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _reap_idle(self, now):
+        """Close connections idle for longer than idle_timeout (caller holds the lock)"""
+        expired = []
+        # Oldest connections sit at the left end of the deque
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+            self._discarded += 1
+        return expired
+
+    def acquire(self):
+        """Check a connection out of the pool"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            raw = None
+            last_used = None
+            create = False
+
+            with self._cond:
+                expired = self._reap_idle(time.monotonic())
+                while True:
+                    if self._idle:
+                        # LIFO keeps the hot connections hot and lets the rest idle out
+                        raw, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.timeout}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            for conn in expired:
+                self._discard(conn)
+
+            if create:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            elif time.monotonic() - last_used > self.ping_interval:
+                # Health check connections that have been sitting idle
+                try:
+                    raw.ping(reconnect=False)
+                except Exception:
+                    self._discard(raw)
+                    with self._cond:
+                        self._size -= 1
+                        self._discarded += 1
+                        self._cond.notify()
+                    continue
+
+            wait_time = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+                self._peak_in_use = max(self._peak_in_use, self._size - len(self._idle))
+            return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """Return a raw connection to the pool"""
+        healthy = raw.open
+        if healthy:
+            try:
+                # Never hand out a connection with a half-finished transaction
+                raw.rollback()
+            except Exception:
+                healthy = False
+
+        if not healthy:
+            self._discard(raw)
+
+        with self._cond:
+            if healthy:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._size -= 1
+                self._discarded += 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (in-use connections close when returned)"""
+        with self._cond:
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for raw in idle:
+            self._discard(raw)
+
+    def stats(self):
+        """Pool metrics: size, saturation and wait times"""
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': in_use,
+                'idle': len(self._idle),
+                'saturation': round(in_use / self.max_size, 3) if self.max_size else 0,
+                'peak_in_use': self._peak_in_use,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_avg_ms': round(self._wait_time_total / self._checkouts * 1000, 3) if self._checkouts else 0,
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+                'created': self._created,
+                'discarded': self._discarded
+            }
+
+
+def init_app(app):
+    """Create the application's connection pool and register request teardown"""
+    pool = ConnectionPool(
+        connect_kwargs={
+            'host': app.config['MYSQL_HOST'],
+            'user': app.config['MYSQL_USER'],
+            'password': app.config['MYSQL_PASSWORD'],
+            'database': app.config['MYSQL_DB'],
+            'cursorclass': pymysql.cursors.DictCursor
+        },
+        max_size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        idle_timeout=app.config['DB_POOL_IDLE_TIMEOUT'],
+        ping_interval=app.config['DB_POOL_PING_INTERVAL']
+    )
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(_return_checked_out_connections)
+    app.teardown_appcontext(_release_request_connection)
+    return pool
+
+
+def get_pool():
+    """Get the connection pool of the current application"""
+    return current_app.extensions['db_pool']
+
+
+def get_db_connection():
+    """
+    Check out a pooled database connection.
+    Call conn.close() to return it; anything still checked out when the
+    request (app context) ends is returned automatically.
+    """
+    conn = get_pool().acquire()
+    g.setdefault('_db_checkouts', []).append(conn)
+    return conn
+
+
+def _return_checked_out_connections(exc=None):
+    """Return connections the request forgot to close"""
+    for conn in g.pop('_db_checkouts', []):
+        if not conn.returned:
+            conn.close()
+
+
+def get_db():
+    """
+    Get the connection bound to the current request (app context).
+    Every helper that calls get_db() during a request shares this one
+    connection and its open transaction. Do not close it: it is returned to
+    the pool in teardown_appcontext, rolling back anything left uncommitted.
+    """
+    conn = g.get('_db_conn')
+    if conn is None or conn.returned:
+        conn = get_pool().acquire()
+        g._db_conn = conn
+        g._db_tx_depth = 0
+    return conn
+
+
+def release_db():
+    """
+    Return the request connection to the pool before a slow call that needs
+    no database (a payment gateway request). Must not be called inside
+    transaction(); the next get_db() checks out a connection again.
+    """
+    if g.get('_db_tx_depth'):
+        raise RuntimeError("release_db() called inside a transaction")
+    _release_request_connection()
+
+
+@contextmanager
+def transaction():
+    """
+    Run a block atomically on the request connection.
+
+    The outermost block commits on success and rolls back on error. Nested
+    blocks (e.g. a helper such as award_points called from place_order) run
+    inside a SAVEPOINT instead, so they join the caller's transaction and a
+    failing helper only undoes its own work.
+    """
+    conn = get_db()
+    depth = g._db_tx_depth
+    savepoint = f"sp_{depth}"
+
+    if depth:
+        conn.cursor().execute(f"SAVEPOINT {savepoint}")
+    g._db_tx_depth = depth + 1
+    try:
+        yield conn
+    except Exception:
+        if depth:
+            conn.cursor().execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+        else:
+            conn.rollback()
+        raise
+    else:
+        if depth:
+            conn.cursor().execute(f"RELEASE SAVEPOINT {savepoint}")
+        else:
+            conn.commit()
+    finally:
+        g._db_tx_depth = depth
+
+
+def _release_request_connection(exc=None):
+    """Return the request-scoped connection to the pool"""
+    conn = g.pop('_db_conn', None)
+    g.pop('_db_tx_depth', None)
+    if conn is not None and not conn.returned:
+        conn.close()
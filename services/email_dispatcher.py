@@ -0,0 +1,358 @@
+"""
+Email Dispatcher
+Outgoing mail queued per process and sent by a background thread over one
+kept-open SMTP connection, paced to the provider's rate limit, with the
+email_logs rows of each batch written in a single insert
+
+A local SMTP sink stands in for Gmail in development:
+    python -m aiosmtpd -n -l localhost:8025
+    MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=false
+"""
+
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import current_app
+from services.db_pool import get_db_connection
+
+# Seconds an SMTP read or write may block before the connection is dropped
+SMTP_SOCKET_TIMEOUT = 30
+
+
+class Delivery:
+    """
+    Outcome of one queued message, set once the dispatcher has tried it
+
+    A caller that stops waiting cancels the delivery; the dispatcher skips a
+    cancelled message, and once it has started sending one it can no longer
+    be cancelled, so a message is either sent or reported as not sent.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._state = 'queued'  # queued -> sending | cancelled
+        self.sent = False
+        self.error = None
+
+    def start(self):
+        """Called by the dispatcher before sending; False if the caller gave up"""
+        with self._lock:
+            if self._state == 'cancelled':
+                return False
+            self._state = 'sending'
+            return True
+
+    def cancel(self):
+        """Withdraw a message not yet being sent; False if sending has started"""
+        with self._lock:
+            if self._state != 'queued':
+                return False
+            self._state = 'cancelled'
+            return True
+
+    def finish(self, error=None):
+        self.sent = error is None
+        self.error = error
+        self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+
+class EmailDispatcher:
+    """
+    Per-process mail queue drained by one sender thread
+
+    The thread takes up to batch_size queued messages at a time, sends them
+    on its SMTP connection (opened on first use, reconnected after an
+    error, closed after idle_timeout seconds without mail) no faster than
+    rate_limit messages per second, then writes their email_logs rows in
+    one multi-row insert.
+
+    submit() returns as soon as the message is queued; inside waiting() it
+    blocks until the message has been sent or has failed, and a message
+    still queued after send_timeout is withdrawn so that a caller told it
+    failed can retry without sending it twice. Loss bound:
+    messages still queued when the process is killed are lost; callers
+    that cannot lose mail (the outbox) wait for delivery.
+    """
+
+    def __init__(self, app, rate_limit=10.0, batch_size=50, idle_timeout=30.0, max_pending=10000, send_timeout=60.0):
+        self.app = app
+        self.rate_limit = rate_limit
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.send_timeout = send_timeout
+        self._queue = queue.Queue(max_pending)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._connection = None
+        self._next_send_at = 0.0
+        self._recent = deque()  # monotonic send times within the last minute
+        self._stats = {
+            'queued': 0, 'sent': 0, 'failed': 0, 'rejected': 0, 'cancelled': 0,
+            'batches': 0, 'connections_opened': 0, 'reconnects': 0,
+            'log_rows': 0, 'log_batches': 0, 'log_errors': 0,
+            'queue_ms': 0.0, 'max_queue_ms': 0.0, 'send_ms': 0.0
+        }
+
+    @contextmanager
+    def waiting(self):
+        """Make submit() in this thread wait for the SMTP outcome"""
+        previous = getattr(self._local, 'wait', False)
+        self._local.wait = True
+        try:
+            yield
+        finally:
+            self._local.wait = previous
+
+    def submit(self, message, log):
+        """
+        Queue a Flask-Mail message; log holds its email_logs columns
+        (recipient_email, subject, email_type, user_id, order_id, product_id).
+        Returns True once queued, or inside waiting() True once sent.
+        """
+        delivery = Delivery()
+        self._ensure_thread()
+        try:
+            self._queue.put((message, log, delivery, time.monotonic()), timeout=1)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            print(f"❌ Email queue is full; dropped mail to {log['recipient_email']}")
+            return False
+        with self._lock:
+            self._stats['queued'] += 1
+
+        if not getattr(self._local, 'wait', False):
+            return True
+        if not delivery.wait(self.send_timeout):
+            if delivery.cancel():
+                print(f"❌ Timed out waiting to send mail to {log['recipient_email']}; withdrawn")
+                return False
+            # Already on the wire: its outcome follows within the SMTP timeouts
+            delivery.wait(None)
+        return delivery.sent
+
+    def log_failure(self, log, error):
+        """Record a message that failed before it could be queued (e.g. rendering)"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((None, dict(log, error_message=error), Delivery(), time.monotonic()))
+        except queue.Full:
+            pass
+
+    def _ensure_thread(self):
+        # Started lazily so that forked worker processes each get their own
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._connection = None  # An inherited socket belongs to the parent
+            self._thread = threading.Thread(target=self._run, name='email-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._close()
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send_batch(batch)
+            except Exception as e:
+                print(f"❌ Email batch failed: {e}")
+                for _, _, delivery, _ in batch:
+                    if not delivery.done:
+                        delivery.finish(str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _throttle(self):
+        now = time.monotonic()
+        if self.rate_limit and self._next_send_at > now:
+            time.sleep(self._next_send_at - now)
+            now = self._next_send_at
+        self._next_send_at = now + (1.0 / self.rate_limit if self.rate_limit else 0)
+
+    def _open(self):
+        from services.email_service import mail
+        connection = mail.connect()
+        connection.__enter__()
+        if connection.host is not None and connection.host.sock is not None:
+            connection.host.sock.settimeout(SMTP_SOCKET_TIMEOUT)
+        self._connection = connection
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return connection
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.__exit__(None, None, None)
+            except Exception:
+                pass  # Already dropped by the server
+            self._connection = None
+
+    def _send_one(self, message):
+        """Send on the kept-open connection, reconnecting once if it was dropped"""
+        connection = self._connection or self._open()
+        try:
+            connection.send(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+            self._close()
+            with self._lock:
+                self._stats['reconnects'] += 1
+            self._open().send(message)
+
+    def _send_batch(self, batch):
+        rows = []
+        with self.app.app_context():
+            for message, log, delivery, queued_at in batch:
+                if message is None:
+                    rows.append(dict(log, status='failed'))
+                    delivery.finish(log.get('error_message'))
+                    continue
+
+                if not delivery.start():
+                    with self._lock:
+                        self._stats['cancelled'] += 1
+                    continue
+
+                self._throttle()
+                started = time.monotonic()
+                try:
+                    self._send_one(message)
+                    error = None
+                except Exception as e:
+                    self._close()
+                    error = f"Failed to send email: {e}"
+                    print(f"❌ {error}")
+                finished = time.monotonic()
+                delivery.finish(error)
+                rows.append(dict(log, status='failed' if error else 'sent', error_message=error))
+
+                with self._lock:
+                    self._stats['failed' if error else 'sent'] += 1
+                    queue_ms = (started - queued_at) * 1000
+                    self._stats['queue_ms'] += queue_ms
+                    self._stats['max_queue_ms'] = max(self._stats['max_queue_ms'], queue_ms)
+                    self._stats['send_ms'] += (finished - started) * 1000
+                    if not error:
+                        self._recent.append(finished)
+                    self._prune_recent(finished)
+
+            with self._lock:
+                self._stats['batches'] += 1
+            self._write_logs(rows)
+
+    def _write_logs(self, rows):
+        """One multi-row insert into email_logs for the batch"""
+        if not rows:
+            return
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                existing = {}
+                for column, table in (('user_id', 'users'), ('order_id', 'orders'), ('product_id', 'products')):
+                    ids = {row[column] for row in rows if row.get(column)}
+                    existing[column] = set()
+                    if ids:
+                        cursor.execute(f"SELECT id FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", list(ids))
+                        existing[column] = {found['id'] for found in cursor.fetchall()}
+
+                # References to rows that no longer exist (or test ids) are logged as NULL
+                cursor.execute(f"""
+                    INSERT INTO email_logs (recipient_email, subject, email_type, status, error_message, user_id, order_id, product_id)
+                    VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(rows))}
+                """, [value for row in rows for value in (
+                    row['recipient_email'], row['subject'][:500], row['email_type'], row['status'], row.get('error_message'),
+                    *(row.get(column) if row.get(column) in existing[column] else None
+                      for column in ('user_id', 'order_id', 'product_id'))
+                )])
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            with self._lock:
+                self._stats['log_errors'] += 1
+            print(f"Error logging email: {e}")
+            return
+        with self._lock:
+            self._stats['log_rows'] += len(rows)
+            self._stats['log_batches'] += 1
+
+    def drain(self, timeout=10.0):
+        """Wait (up to timeout) for queued mail to be sent; True if the queue emptied"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def _prune_recent(self, now):
+        # Caller holds _lock
+        cutoff = now - 60
+        while self._recent and self._recent[0] < cutoff:
+            self._recent.popleft()
+
+    def stats(self):
+        """Queue depth, throughput over the last minute and per-message latency"""
+        with self._lock:
+            self._prune_recent(time.monotonic())
+            stats = dict(self._stats)
+            sent_last_minute = len(self._recent)
+        attempted = stats['sent'] + stats['failed']
+        queue_ms, send_ms = stats.pop('queue_ms'), stats.pop('send_ms')
+        stats['max_queue_ms'] = round(stats['max_queue_ms'], 3)
+        return {
+            'pending': self._queue.qsize(),
+            'rate_limit': self.rate_limit,
+            'batch_size': self.batch_size,
+            'connected': self._connection is not None,
+            'sent_per_second': round(sent_last_minute / 60, 3),
+            'avg_queue_ms': round(queue_ms / attempted, 3) if attempted else None,
+            'avg_send_ms': round(send_ms / attempted, 3) if attempted else None,
+            **stats
+        }
+
+
+def init_app(app):
+    """Create the application's email dispatcher and send queued mail on shutdown"""
+    dispatcher = EmailDispatcher(
+        app,
+        rate_limit=app.config['MAIL_RATE_LIMIT'],
+        batch_size=app.config['MAIL_BATCH_SIZE'],
+        idle_timeout=app.config['MAIL_IDLE_TIMEOUT'],
+        max_pending=app.config['MAIL_MAX_PENDING']
+    )
+    app.extensions['email_dispatcher'] = dispatcher
+    atexit.register(dispatcher.drain)
+    return dispatcher
+
+
+def get_email_dispatcher():
+    """Get the email dispatcher of the current application"""
+    return current_app.extensions['email_dispatcher']
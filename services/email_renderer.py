@@ -0,0 +1,197 @@
+"""
+Email Renderer
+Email templates compiled once at startup and split into a cached static
+shell (base_email.html's styles, header and footer, plus any block that
+uses no variables) and the blocks rendered per message, with batch
+rendering of one template for many recipients
+"""
+
+import re
+import threading
+import time
+from flask import current_app
+from jinja2 import nodes
+
+EMAIL_TEMPLATE_DIR = 'emails'
+BASE_TEMPLATE = 'emails/base_email.html'
+
+# Stands in for each block while the shell is rendered
+BLOCK_MARKER = '\x00block:{}\x00'
+BLOCK_MARKER_PATTERN = re.compile('\x00block:(\\w+)\x00')
+
+
+def _names(node, skip_blocks=False):
+    """Variable names a template node reads (optionally outside its blocks)"""
+    for child in node.iter_child_nodes():
+        if skip_blocks and isinstance(child, nodes.Block):
+            continue
+        if isinstance(child, nodes.Name):
+            yield child.name
+        yield from _names(child, skip_blocks)
+
+
+def _parse(env, name):
+    source = env.loader.get_source(env, name)[0]
+    return env.parse(source, name)
+
+
+class CompiledEmail:
+    """
+    One email template, precompiled
+
+    A template that only extends base_email.html and fills its blocks is
+    kept as a list of segments: text (the shell and the blocks that read
+    no variables, rendered once) and the block functions that render per
+    message. Anything else (top-level logic, super(), a different base)
+    falls back to a full render.
+    """
+
+    def __init__(self, env, name):
+        self.name = name
+        self.template = env.get_template(name)
+        self.base = env.get_template(BASE_TEMPLATE)
+        self.segments = self._split(env)
+
+    def _split(self, env):
+        tree = _parse(env, self.name)
+        extends = tree.body[0] if tree.body else None
+        if not (isinstance(extends, nodes.Extends) and isinstance(extends.template, nodes.Const)
+                and extends.template.value == BASE_TEMPLATE):
+            return None
+        if any(not isinstance(node, (nodes.Extends, nodes.Block, nodes.Output)) for node in tree.body):
+            return None
+        blocks = {block.name: block for block in tree.find_all(nodes.Block)}
+        if any('super' in set(_names(block)) or 'self' in set(_names(block)) for block in blocks.values()):
+            return None
+
+        base_tree = _parse(env, BASE_TEMPLATE)
+        if any(True for _ in _names(base_tree, skip_blocks=True)):
+            return None  # The shell itself would vary per message
+        base_blocks = {block.name: block for block in base_tree.find_all(nodes.Block)}
+        if set(blocks) - set(base_blocks):
+            return None
+
+        # Render the shell once with a marker in place of every block
+        context = self.base.new_context({})
+        context.blocks = {
+            name: [lambda _context, name=name: iter([BLOCK_MARKER.format(name)])]
+            for name in base_blocks
+        }
+        shell = ''.join(self.base.root_render_func(context))
+
+        parts = BLOCK_MARKER_PATTERN.split(shell)
+        segments = [parts[0]]
+        for block_name, text in zip(parts[1::2], parts[2::2]):
+            # The template's block, or the base's default when it has none
+            template, block = (self.template, blocks[block_name]) if block_name in blocks \
+                else (self.base, base_blocks[block_name])
+            render_block = template.blocks[block_name]
+            if any(True for _ in _names(block)):
+                segments.append(render_block)
+            else:
+                segments[-1] += ''.join(render_block(template.new_context({})))
+            if isinstance(segments[-1], str):
+                segments[-1] += text
+            else:
+                segments.append(text)
+        return segments
+
+    @property
+    def split(self):
+        return self.segments is not None
+
+    def is_up_to_date(self):
+        return self.template.is_up_to_date and self.base.is_up_to_date
+
+    def render(self, template_vars):
+        if self.segments is None:
+            return self.template.render(template_vars)
+        context = self.template.new_context(template_vars)
+        return ''.join(
+            segment if isinstance(segment, str) else ''.join(segment(context))
+            for segment in self.segments
+        )
+
+
+class EmailRenderer:
+    """Compiled email templates by name ('order_placed') and render counters"""
+
+    def __init__(self):
+        self._compiled = {}
+        self._lock = threading.Lock()
+        self._stats = {'renders': 0, 'batches': 0, 'full_renders': 0, 'render_ms': 0.0}
+
+    def _get(self, env, template_name):
+        compiled = self._compiled.get(template_name)
+        if compiled is not None and (not env.auto_reload or compiled.is_up_to_date()):
+            return compiled
+        with self._lock:
+            compiled = self._compiled.get(template_name)
+            if compiled is None or (env.auto_reload and not compiled.is_up_to_date()):
+                compiled = CompiledEmail(env, f'{EMAIL_TEMPLATE_DIR}/{template_name}.html')
+                self._compiled[template_name] = compiled
+        return compiled
+
+    def precompile(self, app):
+        """
+        Compile every email template and render its shell; call once all
+        template filters are registered. Returns how many were compiled.
+        """
+        if not app.config['TEMPLATE_PRECOMPILE']:
+            return 0
+        started = time.perf_counter()
+        names = [
+            name[len(EMAIL_TEMPLATE_DIR) + 1:-len('.html')]
+            for name in app.jinja_env.list_templates()
+            if name.startswith(f'{EMAIL_TEMPLATE_DIR}/') and name.endswith('.html') and name != BASE_TEMPLATE
+        ]
+        compiled = []
+        for name in names:
+            try:
+                compiled.append(self._get(app.jinja_env, name))
+            except Exception as e:
+                print(f"❌ Failed to precompile email template {name}: {e}")
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"✉️ Precompiled {len(compiled)} email templates ({sum(1 for email in compiled if email.split)} "
+              f"with a cached shell) in {elapsed:.0f} ms")
+        return len(compiled)
+
+    def render_batch(self, template_name, contexts):
+        """
+        Render one email template (name without emails/ and .html) for
+        each dict of variables in contexts, in a single pass: the template
+        is looked up and the context processors run once for the batch.
+        """
+        started = time.perf_counter()
+        app = current_app._get_current_object()
+        compiled = self._get(app.jinja_env, template_name)
+        shared = {}
+        app.update_template_context(shared)
+        rendered = [compiled.render({**shared, **template_vars}) for template_vars in contexts]
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['renders'] += len(rendered)
+            self._stats['batches'] += 1
+            if not compiled.split:
+                self._stats['full_renders'] += len(rendered)
+            self._stats['render_ms'] += elapsed
+        return rendered
+
+    def render(self, template_name, **template_vars):
+        """Render one email template; the HTML of the message"""
+        return self.render_batch(template_name, [template_vars])[0]
+
+    def stats(self):
+        """Templates compiled and average render time per message"""
+        with self._lock:
+            stats = dict(self._stats)
+            templates = {name: compiled.split for name, compiled in self._compiled.items()}
+        render_ms = stats.pop('render_ms')
+        stats['avg_render_ms'] = round(render_ms / stats['renders'], 3) if stats['renders'] else None
+        stats['templates'] = len(templates)
+        stats['cached_shells'] = sum(1 for split in templates.values() if split)
+        return stats
+
+
+# Create singleton instance
+email_renderer = EmailRenderer()
@@ -4,103 +4,51 @@ Email Service Module for Multi-Vendor E-Commerce Platform
 Handles all email notifications using Flask-Mail with Gmail SMTP
 """
 
-from flask import current_app, render_template
+from flask import current_app
 from flask_mail import Mail, Message
-import pymysql
+from services.email_dispatcher import get_email_dispatcher
+from services.email_renderer import email_renderer
+from services.outbox import enqueue, handler
 from datetime import datetime
 import traceback
 
 # Initialize Flask-Mail (will be configured in app.py)
 mail = Mail()
 
-def get_db_connection():
-    """Get database connection"""
-    return pymysql.connect(
-        host=current_app.config['MYSQL_HOST'],
-        user=current_app.config['MYSQL_USER'],
-        password=current_app.config['MYSQL_PASSWORD'],
-        database=current_app.config['MYSQL_DB'],
-        cursorclass=pymysql.cursors.DictCursor
-    )
-
-def log_email(recipient_email, subject, email_type, status='pending', error_message=None, user_id=None, order_id=None, product_id=None):
-    """Log email activity to database"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # For test scenarios, don't log foreign key references that don't exist
-        if order_id and order_id not in [456, 789]:  # Test IDs that don't exist
-            # Check if order exists
-            cursor.execute("SELECT id FROM orders WHERE id = %s", (order_id,))
-            if not cursor.fetchone():
-                order_id = None
-        
-        if product_id and product_id == 123:  # Test ID that doesn't exist
-            # Check if product exists
-            cursor.execute("SELECT id FROM products WHERE id = %s", (product_id,))
-            if not cursor.fetchone():
-                product_id = None
-        
-        cursor.execute("""
-            INSERT INTO email_logs (recipient_email, subject, email_type, status, error_message, user_id, order_id, product_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (recipient_email, subject, email_type, status, error_message, user_id, order_id, product_id))
-        
-        conn.commit()
-        log_id = cursor.lastrowid
-        conn.close()
-        return log_id
-    except Exception as e:
-        print(f"Error logging email: {e}")
-        return None
-
-def update_email_log(log_id, status, error_message=None):
-    """Update email log status"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE email_logs SET status = %s, error_message = %s WHERE id = %s
-        """, (status, error_message, log_id))
-        
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error updating email log: {e}")
-
-def send_email(recipient, subject, template_name, email_type, **template_vars):
+def send_email(recipient, subject, template_name, email_type, html=None, **template_vars):
     """
     Send email using Flask-Mail
     
+    The message is rendered here and handed to the email dispatcher, which
+    sends it on a shared SMTP connection and logs it to email_logs in
+    batches, so the caller does not wait for SMTP.
+    
     Args:
         recipient: Email address of recipient
         subject: Email subject
         template_name: Name of email template (without .html)
         email_type: Type of email for logging
+        html: The message already rendered (e.g. by render_email_batch)
         **template_vars: Variables to pass to template
     
     Returns:
-        bool: True if email sent successfully, False otherwise
+        bool: True once queued (inside get_email_dispatcher().waiting(),
+        once sent), False otherwise
     """
-    log_id = None
+    dispatcher = get_email_dispatcher()
+    log = {
+        'recipient_email': recipient,
+        'subject': subject,
+        'email_type': email_type,
+        'user_id': template_vars.get('user_id'),
+        'order_id': template_vars.get('order_id'),
+        'product_id': template_vars.get('product_id')
+    }
     try:
-        # Log email attempt
-        log_id = log_email(
-            recipient_email=recipient,
-            subject=subject,
-            email_type=email_type,
-            user_id=template_vars.get('user_id'),
-            order_id=template_vars.get('order_id'),
-            product_id=template_vars.get('product_id')
-        )
-        
         # Check if email is configured
         if not current_app.config.get('MAIL_DEFAULT_SENDER'):
             print("❌ Email not configured: MAIL_DEFAULT_SENDER not set. Please check your .env file.")
-            if log_id:
-                update_email_log(log_id, 'failed', 'Email not configured')
+            dispatcher.log_failure(log, 'Email not configured')
             return False
         
         # Create message
@@ -110,28 +58,16 @@ def send_email(recipient, subject, template_name, email_type, **template_vars):
             sender=current_app.config['MAIL_DEFAULT_SENDER']
         )
         
-        # Render HTML template
-        msg.html = render_template(f'emails/{template_name}.html', **template_vars)
-        
-        # Send email
-        mail.send(msg)
-        
-        # Update log as sent
-        if log_id:
-            update_email_log(log_id, 'sent')
+        # Render HTML template (precompiled; only the per-message blocks render)
+        msg.html = html if html is not None else email_renderer.render(template_name, **template_vars)
         
-        print(f"✅ Email sent successfully to {recipient}: {subject}")
-        return True
+        return dispatcher.submit(msg, log)
         
     except Exception as e:
         error_msg = f"Failed to send email: {str(e)}"
         print(f"❌ {error_msg}")
         print(traceback.format_exc())
-        
-        # Update log as failed
-        if log_id:
-            update_email_log(log_id, 'failed', error_msg)
-        
+        dispatcher.log_failure(log, error_msg)
         return False
 
 # Email notification functions for different events
@@ -258,7 +194,24 @@ def send_order_status_email(customer_email, customer_name, order_number, new_sta
         order_id=order_id
     )
 
-def send_seller_order_notification(seller_email, seller_name, order_number, product_name, quantity, order_id):
+def render_seller_order_notifications(order_number, order_id, items):
+    """
+    Render the new-order email for each (seller_name, product_name,
+    quantity) of one order in a single pass; pass each result to
+    send_seller_order_notification as html
+    """
+    return email_renderer.render_batch('seller_order_notification', [
+        {
+            'seller_name': seller_name,
+            'order_number': order_number,
+            'product_name': product_name,
+            'quantity': quantity,
+            'order_id': order_id
+        }
+        for seller_name, product_name, quantity in items
+    ])
+
+def send_seller_order_notification(seller_email, seller_name, order_number, product_name, quantity, order_id, html=None):
     """Send email to seller when they receive an order"""
     subject = f"New Order Received - {order_number}"
     
@@ -267,6 +220,7 @@ def send_seller_order_notification(seller_email, seller_name, order_number, prod
         subject=subject,
         template_name='seller_order_notification',
         email_type='order_placed',
+        html=html,
         seller_name=seller_name,
         order_number=order_number,
         product_name=product_name,
@@ -315,17 +269,46 @@ def send_delivery_confirmation_email(recipient_email, recipient_name, order_numb
     if recipient_type == 'customer':
         subject = f"✅ Order Delivered - {order_number}"
         message = f"Your order {order_number} has been successfully delivered!"
+        orders_path = '/orders'
     else:  # seller
         subject = f"📦 Order Delivered - {order_number}"
         message = f"Order {order_number} has been successfully delivered to the customer."
+        orders_path = '/seller/orders'
+    
+    # Sent from the outbox worker, outside any request, so the link is built from SITE_URL
+    orders_url = f"{current_app.config['SITE_URL'].rstrip('/')}{orders_path}"
     
     return send_email(
         recipient_email,
         subject,
-        'emails/delivery_confirmation.html',
+        'delivery_confirmation',
         'delivery_confirmation',
         recipient_name=recipient_name,
         order_number=order_number,
         recipient_type=recipient_type,
-        message=message
+        message=message,
+        orders_url=orders_url
     )
+
+
+# Queued delivery through the transactional outbox (services/outbox.py)
+
+def queue_email(cursor, function, *args, key=None):
+    """
+    Send an email once the caller's transaction commits: records an outbox
+    row naming one of the send_*_email functions above and its arguments
+    (JSON values; pass amounts as float)
+    """
+    enqueue(cursor, 'email', {'function': function, 'args': list(args)}, key)
+
+
+@handler('email', concurrency=4, in_transaction=False)
+def _send_queued_email(cursor, payload):
+    """Outbox handler: one message to one recipient, retried while sending fails"""
+    send = globals().get(payload['function'])
+    if send is None or not payload['function'].startswith('send_'):
+        raise ValueError(f"Unknown email function: {payload['function']}")
+    with get_email_dispatcher().waiting():
+        sent = send(*payload['args'])
+    if not sent:
+        raise RuntimeError(f"{payload['function']} failed")
@@ -0,0 +1,225 @@
+"""
+Product Facet Service
+In-memory columnar index of the catalog used to count category, brand,
+price bucket and rating facets for the product listing without extra
+GROUP BY queries
+"""
+
+import threading
+import numpy as np
+from services.catalog_index import CatalogIndex
+
+# Upper bounds (exclusive) of the price histogram buckets; the last bucket is open ended.
+# Bucket links filter with price_lt, which is exclusive too, so a bucket's count matches its listing.
+PRICE_BUCKET_EDGES = [500, 1000, 2500, 5000, 10000, 25000, 50000, 100000]
+
+# "N stars & up" bands
+RATING_BANDS = [4, 3, 2, 1]
+
+
+class FacetIndex(CatalogIndex):
+    """
+    Columnar catalog snapshot: one numpy array per facet column, one slot per
+    product. Counting a facet is a boolean mask plus np.bincount over the
+    matching slots, so it costs a few vectorised passes regardless of how many
+    categories or brands exist.
+
+    Updates write a product's slot in place; removed products are tombstoned
+    (alive = False) and their slot reused by the next insert.
+    """
+
+    name = 'Facet'
+
+    def __init__(self, sync_interval=60, rebuild_interval=3600):
+        super().__init__(sync_interval, rebuild_interval)
+        self._write_lock = threading.Lock()
+        self._reset(0)
+
+    def _reset(self, capacity):
+        capacity = max(capacity, 64)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._category = np.zeros(capacity, dtype=np.int32)  # category code
+        self._brand = np.zeros(capacity, dtype=np.int32)  # brand code, 0 = no brand
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._rating = np.zeros(capacity, dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._slots = {}  # product_id -> slot
+        self._free = []
+        self._used = 0
+        # Dictionary encoding for the categorical columns
+        self._category_codes = {}  # category_id -> code
+        self._category_info = []  # code -> (category_id, name)
+        self._brand_codes = {'': 0}
+        self._brand_names = ['']
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        for attr in ('_ids', '_category', '_brand', '_price', '_rating', '_alive'):
+            old = getattr(self, attr)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+
+    def _encode_category(self, category_id, name):
+        code = self._category_codes.get(category_id)
+        if code is None:
+            code = len(self._category_info)
+            self._category_codes[category_id] = code
+            self._category_info.append((category_id, name))
+        elif self._category_info[code][1] != name:
+            self._category_info[code] = (category_id, name)
+        return code
+
+    def _encode_brand(self, brand):
+        brand = (brand or '').strip()
+        code = self._brand_codes.get(brand)
+        if code is None:
+            code = len(self._brand_names)
+            self._brand_codes[brand] = code
+            self._brand_names.append(brand)
+        return code
+
+    def _add_locked(self, row):
+        slot = self._slots.get(row['id'])
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                if self._used == len(self._ids):
+                    self._grow()
+                slot = self._used
+                self._used += 1
+            self._slots[row['id']] = slot
+        self._ids[slot] = row['id']
+        self._category[slot] = self._encode_category(row['category_id'], row['category_name'])
+        self._brand[slot] = self._encode_brand(row['brand'])
+        self._price[slot] = float(row['price'])
+        self._rating[slot] = float(row['average_rating'])
+        self._alive[slot] = True
+
+    def _build(self, rows):
+        with self._write_lock:
+            self._reset(len(rows) * 2)
+            for row in rows:
+                self._add_locked(row)
+
+    def _add(self, row):
+        with self._write_lock:
+            self._add_locked(row)
+
+    def _remove(self, product_id):
+        with self._write_lock:
+            slot = self._slots.pop(product_id, None)
+            if slot is not None:
+                self._alive[slot] = False
+                self._free.append(slot)
+
+    def _candidate_mask(self, product_ids, n):
+        mask = np.zeros(n, dtype=bool)
+        mask[[self._slots[pid] for pid in product_ids if pid in self._slots]] = True
+        return mask
+
+    def counts(self, category_id=None, brand=None, min_price=None, max_price=None,
+               min_rating=None, product_ids=None, price_lt=None):
+        """
+        Facet counts for the listing query described by the filters
+
+        product_ids restricts the base set (e.g. to search results). Each
+        facet is counted with every filter applied except its own, so the
+        counts show what selecting another value of that facet would return.
+        """
+        self.ensure_fresh()
+
+        with self._write_lock:
+            n = self._used
+            alive = self._alive[:n].copy()
+            category = self._category[:n].copy()
+            brand_col = self._brand[:n].copy()
+            price = self._price[:n].copy()
+            rating = self._rating[:n].copy()
+            category_info = list(self._category_info)
+            brand_names = list(self._brand_names)
+            brand_code = self._brand_codes.get((brand or '').strip()) if brand else None
+            category_code = self._category_codes.get(int(category_id)) if category_id else None
+            base = alive & self._candidate_mask(product_ids, n) if product_ids is not None else alive
+
+        filters = {}
+        if category_id:
+            filters['category'] = category == category_code if category_code is not None else np.zeros(n, dtype=bool)
+        if brand:
+            filters['brand'] = brand_col == brand_code if brand_code is not None else np.zeros(n, dtype=bool)
+        if min_price or max_price or price_lt:
+            price_mask = np.ones(n, dtype=bool)
+            if min_price:
+                price_mask &= price >= min_price
+            if max_price:
+                price_mask &= price <= max_price
+            if price_lt:
+                price_mask &= price < price_lt
+            filters['price'] = price_mask
+        if min_rating:
+            filters['rating'] = rating >= min_rating
+
+        def mask_without(facet):
+            mask = base.copy()
+            for name, filter_mask in filters.items():
+                if name != facet:
+                    mask &= filter_mask
+            return mask
+
+        # Category
+        category_counts = np.bincount(category[mask_without('category')], minlength=len(category_info))
+        categories = [
+            {'id': category_info[code][0], 'name': category_info[code][1], 'count': int(count)}
+            for code, count in enumerate(category_counts) if count
+        ]
+        categories.sort(key=lambda item: (-item['count'], item['name']))
+
+        # Brand (products without a brand are not a facet value)
+        brand_counts = np.bincount(brand_col[mask_without('brand')], minlength=len(brand_names))
+        brands = [
+            {'name': brand_names[code], 'count': int(count)}
+            for code, count in enumerate(brand_counts) if count and code
+        ]
+        brands.sort(key=lambda item: (-item['count'], item['name']))
+
+        # Price histogram
+        bucket_of = np.searchsorted(PRICE_BUCKET_EDGES, price[mask_without('price')], side='right')
+        bucket_counts = np.bincount(bucket_of, minlength=len(PRICE_BUCKET_EDGES) + 1)
+        lower_edges = [0] + PRICE_BUCKET_EDGES
+        upper_edges = PRICE_BUCKET_EDGES + [None]
+        price_buckets = [
+            {'min': lower_edges[i], 'max': upper_edges[i], 'count': int(count)}
+            for i, count in enumerate(bucket_counts) if count
+        ]
+
+        # Rating bands (cumulative: "4 & up" includes 5-star products)
+        stars = np.floor(rating[mask_without('rating')]).astype(np.int64)
+        star_counts = np.bincount(np.clip(stars, 0, 5), minlength=6)
+        ratings = [
+            {'min_rating': band, 'count': int(star_counts[band:].sum())}
+            for band in RATING_BANDS
+        ]
+
+        all_filters = mask_without(None)
+        return {
+            'total': int(all_filters.sum()),
+            'categories': categories,
+            'brands': brands,
+            'price_buckets': price_buckets,
+            'ratings': ratings
+        }
+
+    def stats(self):
+        """Index size and freshness"""
+        return {
+            'products': len(self._slots),
+            'slots': self._used,
+            'categories': len(self._category_info),
+            'brands': len(self._brand_names) - 1,
+            **self.sync_stats()
+        }
+
+
+# Create singleton instance
+facet_index = FacetIndex()
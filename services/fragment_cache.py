@@ -0,0 +1,137 @@
+"""
+Fragment Cache
+Rendered template fragments (product cards, category menus) reused across
+pages and users through a {% cache key, ttl %} Jinja tag
+
+    {% cache ('product_card', product.id, product.updated_at), 600 %}
+        ... markup ...
+    {% endcache %}
+
+Keys are any expression (a tuple whose first item names the fragment
+keeps the per-fragment stats readable); ttl is optional. Every key is
+combined with the catalog version, so bumping a catalog_versions counter
+(categories, flash deals) retires the fragments rendered before it.
+Put what else the markup depends on (updated_at, the visitor's role) in
+the key.
+"""
+
+import threading
+import time
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from services.db_pool import get_db_connection
+from services.response_cache import LocalTier
+
+# The catalog version is re-read at most this often per process
+CATALOG_VERSION_REFRESH_SECONDS = 2
+
+
+class FragmentCache:
+    """Per-process LRU of rendered fragments with per-fragment hit/miss counters"""
+
+    def __init__(self, max_entries=5000, default_ttl=300, enabled=True):
+        self.enabled = enabled
+        self.default_ttl = default_ttl
+        self.local = LocalTier(max_entries)
+        self._version = None
+        self._version_read_at = None
+        self._lock = threading.Lock()
+        self._fragments = {}  # fragment name -> {'hits': n, 'misses': n}
+        self._stats = {'version_reads': 0, 'version_errors': 0}
+
+    def catalog_version(self):
+        """All catalog_versions counters, re-read every few seconds; None if unreadable"""
+        now = time.monotonic()
+        if self._version_read_at is not None and now - self._version_read_at < CATALOG_VERSION_REFRESH_SECONDS:
+            return self._version
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT scope, version FROM catalog_versions ORDER BY scope")
+            version = tuple((row['scope'], row['version']) for row in cursor.fetchall())
+            conn.close()
+            with self._lock:
+                self._stats['version_reads'] += 1
+        except Exception as e:
+            print(f"❌ Failed to read the catalog version for fragments: {e}")
+            version = None
+            with self._lock:
+                self._stats['version_errors'] += 1
+        self._version, self._version_read_at = version, now
+        return version
+
+    def _count(self, name, outcome):
+        with self._lock:
+            counts = self._fragments.setdefault(name, {'hits': 0, 'misses': 0})
+            counts[outcome] += 1
+
+    def render(self, key, ttl, caller):
+        """Cached markup for key, or the rendered body (stored for next time)"""
+        if not self.enabled:
+            return caller()
+        version = self.catalog_version()
+        if version is None:
+            return caller()  # Cannot tell what is current; render without caching
+
+        name = str(key[0]) if isinstance(key, (tuple, list)) and key else str(key)
+        full_key = repr((key, version))
+        cached = self.local.get(full_key)
+        if cached is not None:
+            self._count(name, 'hits')
+            return cached
+
+        self._count(name, 'misses')
+        rendered = caller()
+        self.local.set(full_key, rendered, ttl or self.default_ttl, ())
+        return rendered
+
+    def stats(self):
+        """Entries and hit/miss counters per fragment"""
+        with self._lock:
+            fragments = {
+                name: dict(counts, hit_ratio=round(counts['hits'] / (counts['hits'] + counts['misses']), 4))
+                for name, counts in self._fragments.items()
+            }
+            stats = dict(self._stats)
+        return {
+            'enabled': self.enabled,
+            'entries': len(self.local),
+            'evictions': self.local.evictions,
+            'catalog_version': dict(self._version) if self._version else None,
+            **stats,
+            'fragments': fragments
+        }
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension adding {% cache key[, ttl] %} ... {% endcache %}"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        return Markup(fragment_cache.render(key, ttl, caller))
+
+
+# Create singleton instance
+fragment_cache = FragmentCache()
+
+
+def init_app(app):
+    """Configure the fragment cache and register the {% cache %} tag (before app.jinja_env is used)"""
+    fragment_cache.enabled = app.config['FRAGMENT_CACHE_ENABLED']
+    fragment_cache.default_ttl = app.config['FRAGMENT_CACHE_TTL']
+    fragment_cache.local.max_entries = app.config['FRAGMENT_CACHE_MAX_ENTRIES']
+    extensions = list(app.jinja_options.get('extensions', ()))
+    app.jinja_options = dict(app.jinja_options, extensions=extensions + [FragmentCacheExtension])
+    return fragment_cache
@@ -0,0 +1,218 @@
+"""
+Inventory Service
+Stock reservations for checkout: conditional atomic decrements, holds tied
+to the order's Razorpay payment, and release when the payment fails or
+the hold expires
+
+Lock order, everywhere: the orders row first, then products rows by
+ascending id, then product_stats rows by ascending id. commit() and
+release() lock the order's existing inventory_reservations rows between
+the orders row and the products rows; reserve() inserts the order's new
+reservations after decrementing products, and no other transaction can
+hold those rows yet. Concurrent checkouts touching the same products
+therefore queue instead of deadlocking.
+
+Release expired holds (e.g. every minute from cron):
+    python -m services.inventory_service
+"""
+
+from services import response_cache
+from services.db_pool import get_db_connection
+from services.product_stats import record_sale_counts
+
+# Minutes a customer has to pay before the order's stock is released
+RESERVATION_MINUTES = 15
+
+
+class InsufficientStock(Exception):
+    """A product had fewer units left than the order asked for"""
+
+    def __init__(self, product_id, requested):
+        super().__init__(f"Insufficient stock for product {product_id} ({requested} requested)")
+        self.product_id = product_id
+        self.requested = requested
+
+
+def _take(cursor, product_id, quantity):
+    """Decrement stock only if enough is left; False when it is not"""
+    cursor.execute("""
+        UPDATE products SET quantity = quantity - %s
+        WHERE id = %s AND is_active = 1 AND quantity >= %s
+    """, (quantity, product_id, quantity))
+    return cursor.rowcount == 1
+
+
+def reserve(cursor, order_id, units, minutes=RESERVATION_MINUTES):
+    """
+    Take units ({product_id: quantity}) out of stock for an order and hold
+    them for `minutes`. Runs on the caller's cursor inside its transaction.
+    Products are decremented in id order, each only if enough stock is
+    left; InsufficientStock is raised on the first that is short, and the
+    caller's rollback restores the ones already taken.
+    """
+    product_ids = sorted(units)
+    for product_id in product_ids:
+        if not _take(cursor, product_id, units[product_id]):
+            raise InsufficientStock(product_id, units[product_id])
+
+    cursor.execute(f"""
+        INSERT INTO inventory_reservations (order_id, product_id, quantity, expires_at)
+        VALUES {', '.join(['(%s, %s, %s, DATE_ADD(NOW(), INTERVAL %s MINUTE))'] * len(product_ids))}
+    """, [value for product_id in product_ids for value in (order_id, product_id, units[product_id], int(minutes))])
+
+
+def commit(cursor, order_id):
+    """
+    Make an order's holds permanent once it is paid. Holds already released
+    (the payment arrived after they expired) are taken again where stock
+    allows. Those that cannot be are marked 'short' and the order is
+    flagged stock_shortfall for a refund or backorder; returns their
+    product ids.
+    """
+    cursor.execute("""
+        SELECT id, product_id, quantity, status
+        FROM inventory_reservations
+        WHERE order_id = %s AND status != 'committed'
+        ORDER BY product_id
+        FOR UPDATE
+    """, (order_id,))
+    reservations = cursor.fetchall()
+
+    committed, short, retaken = [], [], {}
+    for reservation in reservations:
+        if reservation['status'] == 'released':
+            if not _take(cursor, reservation['product_id'], reservation['quantity']):
+                short.append(reservation)
+                continue
+            retaken[reservation['product_id']] = reservation['quantity']
+        committed.append(reservation['id'])
+    record_sale_counts(cursor, retaken)
+
+    if committed:
+        cursor.execute(f"""
+            UPDATE inventory_reservations SET status = 'committed'
+            WHERE id IN ({', '.join(['%s'] * len(committed))})
+        """, committed)
+    if short:
+        cursor.execute(f"""
+            UPDATE inventory_reservations SET status = 'short'
+            WHERE id IN ({', '.join(['%s'] * len(short))})
+        """, [reservation['id'] for reservation in short])
+        cursor.execute("UPDATE orders SET stock_shortfall = TRUE WHERE id = %s", (order_id,))
+        print(f"⚠️ Order {order_id} was paid after its hold expired; out of stock for products "
+              f"{[reservation['product_id'] for reservation in short]}, flagged for refund or backorder")
+    return [reservation['product_id'] for reservation in short]
+
+
+def release(cursor, order_id):
+    """
+    Put an order's held units back in stock (payment failed or timed out).
+    Runs on the caller's cursor; returns the number of units released. The
+    cached pages of the products are purged once the app context ends.
+    """
+    cursor.execute("""
+        SELECT id, product_id, quantity
+        FROM inventory_reservations
+        WHERE order_id = %s AND status = 'held'
+        ORDER BY product_id
+        FOR UPDATE
+    """, (order_id,))
+    reservations = cursor.fetchall()
+    if not reservations:
+        return 0
+
+    # Every products row first, then the stats rows (the shared lock order)
+    for reservation in reservations:
+        cursor.execute("UPDATE products SET quantity = quantity + %s WHERE id = %s",
+                       (reservation['quantity'], reservation['product_id']))
+    record_sale_counts(cursor, {reservation['product_id']: -reservation['quantity'] for reservation in reservations})
+
+    cursor.execute(f"""
+        UPDATE inventory_reservations SET status = 'released', released_at = NOW()
+        WHERE id IN ({', '.join(['%s'] * len(reservations))})
+    """, [reservation['id'] for reservation in reservations])
+
+    # Cached pages show stock: product pages always, listings only when it was sold out
+    released = {reservation['product_id']: reservation['quantity'] for reservation in reservations}
+    cursor.execute(f"""
+        SELECT id, category_id, quantity FROM products
+        WHERE id IN ({', '.join(['%s'] * len(released))})
+    """, list(released))
+    for product in cursor.fetchall():
+        response_cache.purge_product_later(product['id'], [product['category_id']],
+                                           listings=product['quantity'] <= released[product['id']])
+    return sum(reservation['quantity'] for reservation in reservations)
+
+
+def fail_order(cursor, order_id, customer_id=None):
+    """
+    Mark a still-unpaid order failed and cancelled and release its stock.
+    customer_id, when given, must own the order. Returns False (and changes
+    nothing) when the order is not pending payment.
+    """
+    query = """
+        UPDATE orders SET payment_status = 'failed', status = 'cancelled'
+        WHERE id = %s AND payment_status = 'pending'
+    """
+    params = [order_id]
+    if customer_id is not None:
+        query += " AND customer_id = %s"
+        params.append(customer_id)
+    cursor.execute(query, params)
+    if cursor.rowcount != 1:
+        return False
+    release(cursor, order_id)
+    return True
+
+
+def release_expired(product_ids=None, limit=200):
+    """
+    Fail the unpaid orders whose holds have expired and return their stock,
+    one order per transaction. product_ids limits the sweep to holds on
+    those products (checkout runs it before reserving). Returns the number
+    of orders released.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    query = """
+        SELECT DISTINCT r.order_id
+        FROM inventory_reservations r
+        JOIN orders o ON o.id = r.order_id
+        WHERE r.status = 'held' AND r.expires_at <= NOW() AND o.payment_status = 'pending'
+    """
+    params = []
+    if product_ids:
+        query += f" AND r.product_id IN ({', '.join(['%s'] * len(product_ids))})"
+        params.extend(product_ids)
+    query += " LIMIT %s"
+    params.append(limit)
+    cursor.execute(query, params)
+    order_ids = [row['order_id'] for row in cursor.fetchall()]
+
+    released = 0
+    for order_id in order_ids:
+        try:
+            if fail_order(cursor, order_id):
+                released += 1
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Failed to release expired reservations for order {order_id}: {e}")
+    conn.close()
+
+    if released:
+        print(f"📦 Released stock held by {released} unpaid orders")
+    return released
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Release stock held by orders whose payment window expired')
+    parser.add_argument('--limit', type=int, default=1000)
+    args = parser.parse_args()
+
+    response_cache.warn_unshared(app, 'reservation sweeper')
+    with app.app_context():
+        release_expired(limit=args.limit)
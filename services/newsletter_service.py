@@ -0,0 +1,514 @@
+"""
+Newsletter Campaigns
+Sends a campaign to every active newsletter subscriber: subscribers streamed
+from a server-side cursor a chunk at a time, the email rendered once per
+campaign and personalised by string substitution, messages fanned out over
+a pool of kept-open SMTP connections, and each chunk's delivery rows and
+the campaign checkpoint written in one transaction
+
+A campaign that crashed or was paused resumes after its checkpoint; at
+most the chunk in flight when the sender died is sent twice.
+
+    python -m services.newsletter_service create --subject "..." --heading "..." --body body.html
+    python -m services.newsletter_service send 3
+    python -m services.newsletter_service pause 3
+    python -m services.newsletter_service status
+"""
+
+import os
+import re
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from urllib.parse import quote
+import pymysql
+from flask import current_app
+from flask_mail import Message
+from markupsafe import escape
+from services.db_pool import get_db, get_db_connection, get_pool, transaction
+from services.email_renderer import email_renderer
+
+# Seconds MySQL waits on a stalled subscriber stream (the sender reads it only between chunks)
+STREAM_WRITE_TIMEOUT = 3600
+
+# Seconds an SMTP read or write may block before the connection is dropped
+SMTP_SOCKET_TIMEOUT = 30
+
+# Per-recipient merge tags, usable in a campaign's body as well
+MERGE_TAGS = {'NAME': 'name', 'EMAIL': 'email', 'UNSUBSCRIBE': 'unsubscribe_url'}
+MERGE_TAG_PATTERN = re.compile(r'\*\|(' + '|'.join(MERGE_TAGS) + r')\|\*')
+
+
+class CampaignTemplate:
+    """
+    A campaign email rendered once with merge tags (*|NAME|*) in place of
+    the per-recipient fields. The HTML is split on the tags up front, so
+    personalising a message only escapes the values and joins strings.
+    """
+
+    def __init__(self, html):
+        parts = MERGE_TAG_PATTERN.split(html)
+        self._literals = parts[0::2]
+        self._fields = [MERGE_TAGS[tag] for tag in parts[1::2]]
+
+    def fill(self, values):
+        out = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            out.append(str(escape(values[field])))
+            out.append(literal)
+        return ''.join(out)
+
+
+def unsubscribe_url(email):
+    return f"{current_app.config['SITE_URL'].rstrip('/')}/unsubscribe_newsletter/{quote(email, safe='')}"
+
+
+def create_campaign(subject, heading, body_html):
+    """Save a draft campaign; returns its id"""
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO newsletter_campaigns (subject, heading, body_html)
+            VALUES (%s, %s, %s)
+        """, (subject, heading, body_html))
+        return cursor.lastrowid
+
+
+def pause_campaign(campaign_id):
+    """Ask the sender to stop after its current chunk; False if it is not sending"""
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE newsletter_campaigns SET status = 'paused'
+            WHERE id = %s AND status = 'sending'
+        """, (campaign_id,))
+        return cursor.rowcount == 1
+
+
+def campaign_progress(campaign_id=None):
+    """
+    Progress of one campaign, or of every campaign sending or paused:
+    counts, percent done, messages per second since it started and ETA
+    """
+    cursor = get_db().cursor()
+    query = """
+        SELECT id, subject, status, total_recipients, sent_count, failed_count,
+               last_subscription_id, locked_by, started_at, heartbeat_at, completed_at,
+               TIMESTAMPDIFF(SECOND, started_at, COALESCE(completed_at, heartbeat_at)) as elapsed,
+               TIMESTAMPDIFF(SECOND, heartbeat_at, NOW()) as heartbeat_age
+        FROM newsletter_campaigns
+    """
+    if campaign_id is not None:
+        cursor.execute(query + " WHERE id = %s", (campaign_id,))
+    else:
+        cursor.execute(query + " WHERE status IN ('sending', 'paused') ORDER BY id")
+    campaigns = cursor.fetchall()
+
+    for campaign in campaigns:
+        done = campaign['sent_count'] + campaign['failed_count']
+        total = campaign['total_recipients']
+        rate = done / campaign['elapsed'] if campaign['elapsed'] else None
+        campaign['percent'] = round(done * 100 / total, 2) if total else None
+        campaign['per_second'] = round(rate, 2) if rate else None
+        campaign['eta_seconds'] = int((total - done) / rate) if rate and total and campaign['status'] == 'sending' else None
+    return campaigns
+
+
+class CampaignSender:
+    """
+    Sends campaigns from this process over `connections` SMTP connections
+
+    Each sender thread keeps its own connection open for the whole
+    campaign (reconnecting once when the server drops it); together they
+    send no faster than rate_limit messages per second. Subscribers are
+    read, sent and recorded chunk_size at a time. While a chunk is being
+    sent the campaign's heartbeat is renewed every stale_seconds / 3, so a
+    slow chunk is not mistaken for a dead sender; if another sender has
+    taken the campaign over, this one stops mid-chunk.
+    """
+
+    def __init__(self, app, connections=4, rate_limit=50.0, chunk_size=1000, stale_seconds=300):
+        self.app = app
+        self.connections = connections
+        self.rate_limit = rate_limit
+        self.chunk_size = chunk_size
+        self.stale_seconds = stale_seconds
+        self.token = f"sender-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix='newsletter')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open_connections = []
+        self._next_send_at = 0.0
+        self._next_heartbeat_at = 0.0
+        self._stop = threading.Event()
+        self._claim_lost = threading.Event()
+        self._stats = {'sent': 0, 'failed': 0, 'chunks': 0, 'connections_opened': 0, 'reconnects': 0, 'heartbeats': 0}
+
+    def stop(self):
+        """Stop after the chunk in flight and leave the campaign paused"""
+        self._stop.set()
+
+    def _claim(self, campaign_id):
+        """Take the campaign: a draft, a paused one, or one whose sender stopped heartbeating"""
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE newsletter_campaigns
+                SET status = 'sending', locked_by = %s, heartbeat_at = NOW(),
+                    started_at = COALESCE(started_at, NOW())
+                WHERE id = %s
+                  AND (status IN ('draft', 'paused')
+                       OR status = 'sending' AND (heartbeat_at IS NULL
+                           OR heartbeat_at < DATE_SUB(NOW(), INTERVAL %s SECOND)))
+            """, (self.token, campaign_id, self.stale_seconds))
+            if cursor.rowcount != 1:
+                return None
+            cursor.execute("SELECT * FROM newsletter_campaigns WHERE id = %s", (campaign_id,))
+            campaign = cursor.fetchone()
+
+            # Recipients already recorded plus those still ahead of the checkpoint
+            cursor.execute("""
+                SELECT COUNT(*) as remaining FROM newsletter_subscriptions
+                WHERE is_active = TRUE AND id > %s
+            """, (campaign['last_subscription_id'],))
+            campaign['total_recipients'] = (campaign['sent_count'] + campaign['failed_count']
+                                            + cursor.fetchone()['remaining'])
+            cursor.execute("UPDATE newsletter_campaigns SET total_recipients = %s WHERE id = %s",
+                           (campaign['total_recipients'], campaign_id))
+        return campaign
+
+    def _heartbeat(self, campaign_id):
+        """
+        Renew the claim from the send loop, at most every stale_seconds / 3
+        across threads; sets _claim_lost when another sender holds it
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_heartbeat_at:
+                return
+            self._next_heartbeat_at = now + self.stale_seconds / 3
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE newsletter_campaigns SET heartbeat_at = NOW()
+                WHERE id = %s AND locked_by = %s
+            """, (campaign_id, self.token))
+            conn.commit()
+            if cursor.rowcount != 1:
+                self._claim_lost.set()
+        except Exception as e:
+            print(f"⚠️ Failed to renew the heartbeat of campaign {campaign_id}: {e}")
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats['heartbeats'] += 1
+
+    def _release(self, campaign_id, status=None):
+        with transaction() as conn:
+            cursor = conn.cursor()
+            if status == 'sent':
+                # Exact totals (a chunk re-sent after a lost claim was counted twice)
+                cursor.execute("""
+                    SELECT COALESCE(SUM(status = 'sent'), 0) as sent, COALESCE(SUM(status = 'failed'), 0) as failed
+                    FROM newsletter_deliveries WHERE campaign_id = %s
+                """, (campaign_id,))
+                counts = cursor.fetchone()
+                cursor.execute("""
+                    UPDATE newsletter_campaigns
+                    SET status = 'sent', completed_at = NOW(), locked_by = NULL,
+                        sent_count = %s, failed_count = %s
+                    WHERE id = %s AND locked_by = %s
+                """, (counts['sent'], counts['failed'], campaign_id, self.token))
+            else:
+                cursor.execute("""
+                    UPDATE newsletter_campaigns
+                    SET status = COALESCE(%s, status), locked_by = NULL
+                    WHERE id = %s AND locked_by = %s
+                """, (status, campaign_id, self.token))
+
+    def _stream(self, after_id):
+        """
+        Active subscribers after after_id in id order, chunk_size at a time,
+        from an unbuffered (server-side) cursor on a dedicated connection so
+        neither the client nor the pool holds the whole list. A dropped
+        stream is reopened after the last subscriber it returned.
+        """
+        failures = 0
+        while True:
+            conn = pymysql.connect(**dict(get_pool().connect_kwargs, cursorclass=pymysql.cursors.SSDictCursor))
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SET SESSION net_write_timeout = %s", (STREAM_WRITE_TIMEOUT,))
+                cursor.execute("""
+                    SELECT id, email, name
+                    FROM newsletter_subscriptions
+                    WHERE is_active = TRUE AND id > %s
+                    ORDER BY id
+                """, (after_id,))
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        return
+                    failures = 0
+                    after_id = rows[-1]['id']
+                    yield rows
+            except pymysql.OperationalError as e:
+                failures += 1
+                if failures > 3:
+                    raise
+                print(f"⚠️ Subscriber stream dropped after id {after_id}, reopening: {e}")
+            finally:
+                # Closing the socket discards any unread rows without reading them
+                conn.close()
+
+    def _throttle(self):
+        if not self.rate_limit:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_send_at)
+            self._next_send_at = slot + 1.0 / self.rate_limit
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _open(self):
+        from services.email_service import mail
+        connection = mail.connect()
+        connection.__enter__()
+        if connection.host is not None and connection.host.sock is not None:
+            connection.host.sock.settimeout(SMTP_SOCKET_TIMEOUT)
+        self._local.connection = connection
+        with self._lock:
+            self._open_connections.append(connection)
+            self._stats['connections_opened'] += 1
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            with self._lock:
+                self._open_connections.remove(connection)
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass  # Already dropped by the server
+
+    def _close_all(self):
+        with self._lock:
+            connections, self._open_connections = self._open_connections, []
+        for connection in connections:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+    def _send_one(self, message):
+        connection = getattr(self._local, 'connection', None) or self._open()
+        try:
+            connection.send(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+            self._close()
+            with self._lock:
+                self._stats['reconnects'] += 1
+            self._open().send(message)
+
+    def _send_slice(self, campaign, template, recipients):
+        """Send a share of a chunk on this thread's connection; returns (subscription_id, error) pairs"""
+        results = []
+        with self.app.app_context():
+            sender = current_app.config['MAIL_DEFAULT_SENDER']
+            for recipient in recipients:
+                self._heartbeat(campaign['id'])
+                if self._claim_lost.is_set():
+                    break  # The new owner sends the rest of the chunk
+                self._throttle()
+                try:
+                    url = unsubscribe_url(recipient['email'])
+                    self._send_one(Message(
+                        subject=campaign['subject'],
+                        recipients=[recipient['email']],
+                        sender=sender,
+                        html=template.fill({'name': recipient['name'] or 'there', 'email': recipient['email'], 'unsubscribe_url': url}),
+                        extra_headers={'List-Unsubscribe': f'<{url}>'}
+                    ))
+                    error = None
+                except smtplib.SMTPRecipientsRefused as e:
+                    error = str(e)  # The address was refused; the connection is still good
+                except Exception as e:
+                    self._close()
+                    error = str(e)
+                results.append((recipient['id'], error))
+        return results
+
+    def _send_chunk(self, campaign, template, chunk):
+        slices = [chunk[i::self.connections] for i in range(self.connections)]
+        futures = [self._executor.submit(self._send_slice, campaign, template, part) for part in slices if part]
+        return [result for future in futures for result in future.result()]
+
+    def _record(self, campaign_id, last_id, results):
+        """
+        Write a chunk's delivery rows and move the checkpoint past it, in
+        one transaction. Returns the campaign status, or None when another
+        sender has taken the campaign over (its rows are still recorded).
+        """
+        sent = sum(1 for _, error in results if error is None)
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                INSERT INTO newsletter_deliveries (campaign_id, subscription_id, status, error_message)
+                VALUES {', '.join(['(%s, %s, %s, %s)'] * len(results))}
+                ON DUPLICATE KEY UPDATE status = VALUES(status), error_message = VALUES(error_message), sent_at = NOW()
+            """, [value for subscription_id, error in results for value in (
+                campaign_id, subscription_id, 'failed' if error else 'sent', error[:500] if error else None
+            )])
+            cursor.execute("""
+                UPDATE newsletter_campaigns
+                SET last_subscription_id = %s, sent_count = sent_count + %s,
+                    failed_count = failed_count + %s, heartbeat_at = NOW()
+                WHERE id = %s AND locked_by = %s
+            """, (last_id, sent, len(results) - sent, campaign_id, self.token))
+            if cursor.rowcount != 1:
+                return None
+            cursor.execute("SELECT status FROM newsletter_campaigns WHERE id = %s", (campaign_id,))
+            return cursor.fetchone()['status']
+
+    def send(self, campaign_id):
+        """
+        Send (or resume) a campaign from this process until it is finished,
+        paused or stopped. Returns the campaign's final status, or None if
+        it could not be claimed.
+        """
+        campaign = self._claim(campaign_id)
+        self._claim_lost.clear()
+        self._next_heartbeat_at = time.monotonic() + self.stale_seconds / 3
+        if campaign is None:
+            print(f"❌ Campaign {campaign_id} does not exist, is already sent, or another sender is running it")
+            return None
+
+        # Rendered once; every message is this HTML with the merge tags filled in
+        template = CampaignTemplate(email_renderer.render(
+            'newsletter',
+            subject=campaign['subject'],
+            heading=campaign['heading'],
+            body_html=campaign['body_html'],
+            **{field: f'*|{tag}|*' for tag, field in MERGE_TAGS.items()}
+        ))
+
+        total = campaign['total_recipients']
+        done = campaign['sent_count'] + campaign['failed_count']
+        resumed_from = campaign['last_subscription_id']
+        print(f"📨 Campaign {campaign_id}: sending to {total - done} of {total} subscribers"
+              + (f" (resuming after subscriber {resumed_from})" if resumed_from else ""))
+
+        started = time.monotonic()
+        sent_here = 0
+        status = 'sending'
+        try:
+            with closing(self._stream(resumed_from)) as chunks:
+                for chunk in chunks:
+                    results = self._send_chunk(campaign, template, chunk)
+                    if not results:
+                        # Lost the claim before sending any of the chunk
+                        print(f"⚠️ Campaign {campaign_id} was taken over by another sender; stopping")
+                        return None
+                    failed = sum(1 for _, error in results if error)
+                    with self._lock:
+                        self._stats['sent'] += len(results) - failed
+                        self._stats['failed'] += failed
+                        self._stats['chunks'] += 1
+
+                    status = self._record(campaign_id, chunk[-1]['id'], results)
+                    done += len(results)
+                    sent_here += len(results)
+                    rate = sent_here / (time.monotonic() - started)
+                    eta = (total - done) / rate if rate else 0
+                    print(f"📨 Campaign {campaign_id}: {done}/{total} ({done * 100 / max(total, 1):.1f}%), "
+                          f"{failed} failed in chunk, {rate:.1f} msg/s, ETA {int(eta // 60)}m{int(eta % 60):02d}s")
+
+                    if status is None:
+                        print(f"⚠️ Campaign {campaign_id} was taken over by another sender; stopping")
+                        return None
+                    if status == 'paused' or self._stop.is_set():
+                        status = 'paused'
+                        break
+                else:
+                    status = 'sent'
+        except BaseException:
+            # Let it be resumed right away instead of after stale_seconds
+            try:
+                self._release(campaign_id, 'paused')
+            except Exception as e:
+                print(f"❌ Failed to release campaign {campaign_id}: {e}")
+            raise
+        finally:
+            self._close_all()
+
+        self._release(campaign_id, status)
+        elapsed = time.monotonic() - started
+        print(f"{'✅' if status == 'sent' else '⏸️'} Campaign {campaign_id} {status}: "
+              f"{sent_here} messages in {elapsed:.0f}s ({sent_here / elapsed if elapsed else 0:.1f} msg/s)")
+        return status
+
+    def stats(self):
+        """This process's counters"""
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'open_connections': len(self._open_connections),
+                'rate_limit': self.rate_limit,
+                'chunk_size': self.chunk_size,
+                **self._stats
+            }
+
+
+if __name__ == '__main__':
+    import argparse
+    import signal
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Create and send newsletter campaigns')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='Save a draft campaign')
+    create.add_argument('--subject', required=True)
+    create.add_argument('--heading', required=True)
+    create.add_argument('--body', required=True, help='File with the body HTML (merge tags: *|NAME|*, *|EMAIL|*, *|UNSUBSCRIBE|*)')
+    send = commands.add_parser('send', help='Send or resume a campaign')
+    send.add_argument('campaign_id', type=int)
+    send.add_argument('--connections', type=int, default=app.config['NEWSLETTER_SMTP_CONNECTIONS'])
+    send.add_argument('--rate', type=float, default=app.config['NEWSLETTER_RATE_LIMIT'])
+    pause = commands.add_parser('pause', help='Stop a sending campaign after its current chunk')
+    pause.add_argument('campaign_id', type=int)
+    status = commands.add_parser('status', help='Progress of one campaign, or of all running ones')
+    status.add_argument('campaign_id', type=int, nargs='?')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'create':
+            with open(args.body, encoding='utf-8') as f:
+                print(f"📝 Created campaign {create_campaign(args.subject, args.heading, f.read())}")
+        elif args.command == 'send':
+            sender = CampaignSender(
+                app,
+                connections=args.connections,
+                rate_limit=args.rate,
+                chunk_size=app.config['NEWSLETTER_CHUNK_SIZE'],
+                stale_seconds=app.config['NEWSLETTER_STALE_SECONDS']
+            )
+            signal.signal(signal.SIGTERM, lambda *_: sender.stop())
+            try:
+                sender.send(args.campaign_id)
+            except KeyboardInterrupt:
+                print(f"⏸️ Interrupted; campaign {args.campaign_id} is paused (resume with send)")
+        elif args.command == 'pause':
+            print(f"⏸️ Campaign {args.campaign_id} will pause after its current chunk"
+                  if pause_campaign(args.campaign_id) else f"❌ Campaign {args.campaign_id} is not sending")
+        else:
+            for campaign in campaign_progress(args.campaign_id):
+                print(f"📨 {campaign['id']} [{campaign['status']}] {campaign['subject']}: "
+                      f"{campaign['sent_count']} sent, {campaign['failed_count']} failed of {campaign['total_recipients']} "
+                      f"({campaign['percent']}%), {campaign['per_second']} msg/s, ETA {campaign['eta_seconds']}s")
@@ -7,19 +7,9 @@ Handles OTP generation, validation, and cleanup
 import random
 import string
 from datetime import datetime, timedelta
-import pymysql
-from flask import current_app
+from services.db_pool import get_db_connection
 from services.email_service import send_login_otp_email
-
-def get_db_connection():
-    """Get database connection"""
-    return pymysql.connect(
-        host=current_app.config['MYSQL_HOST'],
-        user=current_app.config['MYSQL_USER'],
-        password=current_app.config['MYSQL_PASSWORD'],
-        database=current_app.config['MYSQL_DB'],
-        cursorclass=pymysql.cursors.DictCursor
-    )
+from services.email_dispatcher import get_email_dispatcher
 
 def generate_otp():
     """Generate a 6-digit OTP"""
@@ -60,8 +50,9 @@ def create_otp(user_id, user_email, user_name):
         conn.commit()
         conn.close()
         
-        # Send OTP email
-        email_sent = send_login_otp_email(user_email, user_name, otp_code, user_id)
+        # Send OTP email (waits for SMTP, so a failure is reported to the user)
+        with get_email_dispatcher().waiting():
+            email_sent = send_login_otp_email(user_email, user_name, otp_code, user_id)
         
         if email_sent:
             print(f"✅ OTP sent successfully to {user_email}")
@@ -0,0 +1,386 @@
+"""
+Transactional Outbox
+Side effects of a write (emails, loyalty points, counters) recorded as
+outbox rows in the same transaction as the write, then run by workers
+with retries, backoff and per-handler concurrency limits
+
+A handler runs inside a transaction that also marks its row done, so
+database effects (points, counters, further outbox rows) happen exactly
+once: if the worker loses its claim or the handler fails, all of it rolls
+back. External effects (an email) are at least once; handlers keep them
+to one recipient per row so a retry re-sends at most that message.
+
+Run the worker (retries, and everything when OUTBOX_DRAIN_IN_APP is off):
+    python -m services.outbox --threads 8
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g
+from services.db_pool import get_db_connection, transaction
+
+# Seconds a worker waits for another worker's claim to finish
+CLAIM_LOCK_TIMEOUT = 5
+
+# Seconds between purges of old done rows by the worker
+PURGE_INTERVAL = 600
+
+
+class LeaseLost(Exception):
+    """Another worker re-claimed the row while this one was running it"""
+
+
+class HandlerSpec:
+    def __init__(self, name, func, concurrency, max_attempts, in_transaction):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.in_transaction = in_transaction
+
+
+def enqueue(cursor, handler, payload, key=None):
+    """
+    Record a side effect to run after the caller's transaction commits.
+    Runs on the caller's cursor. key (unique) makes enqueueing the same
+    effect twice a no-op, e.g. 'order:42:points', for as long as the row is
+    kept (done rows are purged after OUTBOX_RETENTION_DAYS).
+    """
+    cursor.execute("""
+        INSERT INTO outbox (handler, payload, dedupe_key)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE id = id
+    """, (handler, json.dumps(payload, default=str), key))
+    g._outbox_kick = True
+
+
+class Outbox:
+    """Handler registry plus claiming and running of outbox rows"""
+
+    def __init__(self, lease_seconds=300, backoff_base=5, backoff_max=3600):
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._stats = {'claimed': 0, 'done': 0, 'retried': 0, 'dead': 0, 'lease_lost': 0}
+        self._by_handler = {}  # handler -> {'done': n, 'failed': n, 'run_ms': total}
+
+    def handler(self, name, concurrency=4, max_attempts=8, in_transaction=True):
+        """
+        Register func(cursor, payload) as the handler for rows named `name`.
+        concurrency caps rows of this handler running at once across all
+        workers; after max_attempts failures a row is marked dead. Handlers
+        with no database effects that block on I/O (sending mail) pass
+        in_transaction=False: they run with cursor None and hold no
+        connection, and the row is marked done afterwards.
+        """
+        def decorator(func):
+            self._handlers[name] = HandlerSpec(name, func, concurrency, max_attempts, in_transaction)
+            return func
+        return decorator
+
+    def _count(self, stat, handler=None, elapsed_ms=0.0):
+        with self._lock:
+            self._stats[stat] += 1
+            if handler:
+                counts = self._by_handler.setdefault(handler, {'done': 0, 'failed': 0, 'run_ms': 0.0})
+                counts['done' if stat == 'done' else 'failed'] += 1
+                counts['run_ms'] += elapsed_ms
+
+    def claim(self, limit, worker_id):
+        """
+        Claim up to `limit` runnable rows (pending and due, or running with an
+        expired lease), keeping every handler under its concurrency cap.
+        Claims are serialized across workers with a named lock, so the
+        running counts a budget is based on cannot change before it is
+        spent. Returns the claimed rows; each claim uses one attempt.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK('outbox_claim', %s) as locked", (CLAIM_LOCK_TIMEOUT,))
+            if not cursor.fetchone()['locked']:
+                return []  # Another worker is claiming; poll again
+            conn.commit()  # Read the running counts as of now, after the lock
+            cursor.execute("""
+                SELECT handler,
+                       SUM(status = 'running' AND locked_until > NOW()) as running,
+                       SUM(status = 'pending' AND available_at <= NOW()
+                           OR status = 'running' AND locked_until <= NOW()) as ready
+                FROM outbox
+                WHERE status IN ('pending', 'running')
+                GROUP BY handler
+            """)
+            budgets = {}
+            for row in cursor.fetchall():
+                spec = self._handlers.get(row['handler'])
+                if spec is None or not row['ready']:
+                    continue
+                budgets[row['handler']] = min(int(row['ready']), spec.concurrency - int(row['running']))
+
+            token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+            for handler, budget in budgets.items():
+                budget = min(budget, limit)
+                if budget <= 0:
+                    continue
+                cursor.execute("""
+                    UPDATE outbox
+                    SET status = 'running', locked_by = %s, attempts = attempts + 1,
+                        locked_until = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                    WHERE handler = %s
+                      AND (status = 'pending' AND available_at <= NOW()
+                           OR status = 'running' AND locked_until <= NOW())
+                    ORDER BY id
+                    LIMIT %s
+                """, (token, self.lease_seconds, handler, budget))
+                limit -= cursor.rowcount
+                conn.commit()
+                if limit <= 0:
+                    break
+
+            cursor.execute("SELECT * FROM outbox WHERE locked_by = %s AND status = 'running' ORDER BY id", (token,))
+            rows = cursor.fetchall()
+            conn.commit()
+        finally:
+            try:
+                cursor.execute("SELECT RELEASE_LOCK('outbox_claim')")
+            except Exception:
+                pass  # The lock goes with the session if the connection is gone
+            conn.close()
+        with self._lock:
+            self._stats['claimed'] += len(rows)
+        return rows
+
+    def process(self, app, row):
+        """Run one claimed row in its own app context and transaction"""
+        spec = self._handlers[row['handler']]
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                if not spec.in_transaction:
+                    spec.func(None, json.loads(row['payload']))
+                with transaction() as conn:
+                    cursor = conn.cursor()
+                    if spec.in_transaction:
+                        spec.func(cursor, json.loads(row['payload']))
+                    cursor.execute("""
+                        UPDATE outbox SET status = 'done', completed_at = NOW(), last_error = NULL
+                        WHERE id = %s AND locked_by = %s
+                    """, (row['id'], row['locked_by']))
+                    if cursor.rowcount != 1:
+                        raise LeaseLost(row['id'])
+            except LeaseLost:
+                self._count('lease_lost')
+                print(f"⚠️ Outbox row {row['id']} ({spec.name}) was re-claimed by another worker; rolled back")
+                return False
+            except Exception as e:
+                dead = self._fail(row, spec, e)
+                self._count('dead' if dead else 'retried', spec.name, (time.perf_counter() - started) * 1000)
+                return False
+        self._count('done', spec.name, (time.perf_counter() - started) * 1000)
+        return True
+
+    def _fail(self, row, spec, error):
+        """Schedule a retry with exponential backoff, or mark the row dead; True if dead"""
+        dead = row['attempts'] >= spec.max_attempts
+        delay = min(self.backoff_base * 2 ** (row['attempts'] - 1), self.backoff_max) * random.uniform(0.8, 1.2)
+        try:
+            with transaction() as conn:
+                conn.cursor().execute("""
+                    UPDATE outbox
+                    SET status = %s, available_at = DATE_ADD(NOW(), INTERVAL %s SECOND),
+                        locked_by = NULL, locked_until = NULL, last_error = %s
+                    WHERE id = %s AND locked_by = %s
+                """, ('dead' if dead else 'pending', int(delay), str(error)[:2000], row['id'], row['locked_by']))
+        except Exception as e:
+            print(f"❌ Failed to reschedule outbox row {row['id']}: {e}")
+        if dead:
+            print(f"❌ Outbox row {row['id']} ({spec.name}) failed {row['attempts']} times, giving up: {error}")
+        else:
+            print(f"⚠️ Outbox row {row['id']} ({spec.name}) failed (attempt {row['attempts']}), retrying in {delay:.0f}s: {error}")
+        return dead
+
+    def purge(self, retention_days, batch_size=1000):
+        """Delete done rows completed more than retention_days ago, in batches; returns rows deleted"""
+        deleted = 0
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            while True:
+                cursor.execute("""
+                    DELETE FROM outbox
+                    WHERE status = 'done' AND completed_at < DATE_SUB(NOW(), INTERVAL %s DAY)
+                    ORDER BY completed_at
+                    LIMIT %s
+                """, (retention_days, batch_size))
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+        finally:
+            conn.close()
+        if deleted:
+            print(f"🧹 Purged {deleted} outbox rows done more than {retention_days} days ago")
+        return deleted
+
+    def process_pending(self, limit=20):
+        """Claim and run due rows in the calling thread (the web process's drain); returns rows done"""
+        app = current_app._get_current_object()
+        rows = self.claim(limit, f"app-{os.getpid()}")
+        return sum(1 for row in rows if self.process(app, row))
+
+    def backlog(self):
+        """Rows per status and handler, and the age of the oldest due row"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT handler, status, COUNT(*) as count
+            FROM outbox
+            WHERE status != 'done'
+            GROUP BY handler, status
+        """)
+        counts = {}
+        for row in cursor.fetchall():
+            counts.setdefault(row['handler'], {})[row['status']] = row['count']
+        cursor.execute("""
+            SELECT TIMESTAMPDIFF(SECOND, MIN(available_at), NOW()) as oldest
+            FROM outbox
+            WHERE status = 'pending' AND available_at <= NOW()
+        """)
+        oldest = cursor.fetchone()['oldest']
+        conn.close()
+        return {'by_handler': counts, 'oldest_due_seconds': oldest}
+
+    def stats(self):
+        """This process's counters and the backlog in the table"""
+        with self._lock:
+            handlers = {
+                name: {
+                    'done': counts['done'],
+                    'failed': counts['failed'],
+                    'avg_run_ms': round(counts['run_ms'] / (counts['done'] + counts['failed']), 3)
+                }
+                for name, counts in self._by_handler.items()
+            }
+            stats = dict(self._stats)
+        try:
+            backlog = self.backlog()
+        except Exception as e:
+            print(f"❌ Failed to read the outbox backlog: {e}")
+            backlog = None
+        return {
+            **stats,
+            'handlers': handlers,
+            'limits': {name: spec.concurrency for name, spec in self._handlers.items()},
+            'backlog': backlog
+        }
+
+
+# Create singleton instance
+outbox = Outbox()
+handler = outbox.handler
+
+
+class OutboxWorker:
+    """Polls the outbox and runs claimed rows on a thread pool until stopped"""
+
+    def __init__(self, app, threads=8, poll_interval=1.0, retention_days=7):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.retention_days = retention_days
+        self._next_purge_at = 0.0
+        self.worker_id = f"worker-{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='outbox')
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def run_once(self):
+        """Fill the free threads with claimed rows; returns how many were dispatched"""
+        with self._lock:
+            free = self.threads - self._in_flight
+        if free <= 0:
+            return 0
+        with self.app.app_context():
+            rows = outbox.claim(free, self.worker_id)
+        for row in rows:
+            with self._lock:
+                self._in_flight += 1
+            self._executor.submit(outbox.process, self.app, row).add_done_callback(self._done)
+        return len(rows)
+
+    def purge_if_due(self):
+        """Purge old done rows at most once every PURGE_INTERVAL seconds"""
+        if time.monotonic() < self._next_purge_at:
+            return 0
+        self._next_purge_at = time.monotonic() + PURGE_INTERVAL
+        with self.app.app_context():
+            return outbox.purge(self.retention_days)
+
+    def run(self):
+        print(f"📮 Outbox worker {self.worker_id} started with {self.threads} threads")
+        while not self._stop.is_set():
+            try:
+                dispatched = self.run_once()
+            except Exception as e:
+                print(f"❌ Outbox poll failed: {e}")
+                dispatched = 0
+            try:
+                self.purge_if_due()
+            except Exception as e:
+                print(f"❌ Outbox purge failed: {e}")
+            self._stop.wait(0.05 if dispatched else self.poll_interval)
+        self._executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stop.set()
+
+
+def _kick(exc=None):
+    """After an app context that enqueued rows, drain them on the task queue"""
+    if g.pop('_outbox_kick', False) and current_app.config['OUTBOX_DRAIN_IN_APP']:
+        from services import task_queue
+        task_queue.submit('outbox_drain', outbox.process_pending)
+
+
+def init_app(app):
+    """Configure the outbox and drain new rows in the web process (OUTBOX_DRAIN_IN_APP)"""
+    outbox.lease_seconds = app.config['OUTBOX_LEASE_SECONDS']
+    app.teardown_appcontext(_kick)
+    return outbox
+
+
+if __name__ == '__main__':
+    import argparse
+    import signal
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Run outbox handlers (emails, loyalty points, counters)')
+    parser.add_argument('--threads', type=int, default=app.config['OUTBOX_WORKER_THREADS'])
+    parser.add_argument('--poll-interval', type=float, default=app.config['OUTBOX_POLL_INTERVAL'])
+    args = parser.parse_args()
+
+    # This process is the worker: rows enqueued by handlers are picked up by its own loop
+    app.config['OUTBOX_DRAIN_IN_APP'] = False
+    from services import response_cache
+    response_cache.warn_unshared(app, 'outbox worker')
+    # The handlers registered on import of app live in services.outbox, not __main__
+    from services.outbox import OutboxWorker as Worker
+    worker = Worker(app, threads=args.threads, poll_interval=args.poll_interval,
+                    retention_days=app.config['OUTBOX_RETENTION_DAYS'])
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
@@ -0,0 +1,99 @@
+"""
+Keyset (Cursor) Pagination
+Seek-method paging for the product listing: each page continues from the
+last row of the previous one instead of using OFFSET, so page 1 and page 5000
+cost the same and rows never shift between pages.
+"""
+
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+# sort mode -> (column, direction, value type)
+# Every mode breaks ties on p.id in the same direction so the order is total;
+# each SQL mode is backed by a (is_active, <column>, id) composite index.
+# 'relevance' is the search engine's BM25 score, attached to rows in Python.
+PRODUCT_SORTS = {
+    'newest': ('p.created_at', 'DESC', 'datetime'),
+    'price_low': ('p.price', 'ASC', 'decimal'),
+    'price_high': ('p.price', 'DESC', 'decimal'),
+    'name': ('p.name', 'ASC', 'str'),
+    'relevance': ('relevance', 'DESC', 'float'),
+}
+DEFAULT_SORT = 'newest'
+
+
+def resolve_sort(sort_by, searching=False):
+    """
+    Map a ?sort= value onto a known sort mode.
+    Searches default to relevance; relevance needs a search term.
+    """
+    if not sort_by:
+        return 'relevance' if searching else DEFAULT_SORT
+    if sort_by == 'relevance' and not searching:
+        return DEFAULT_SORT
+    return sort_by if sort_by in PRODUCT_SORTS else DEFAULT_SORT
+
+
+def _column_key(column):
+    """'p.created_at' -> 'created_at' (the key in a DictCursor row)"""
+    return column.split('.')[-1]
+
+
+def encode_cursor(sort_by, row):
+    """Build the opaque next-page token from the last row of a page"""
+    column, _, kind = PRODUCT_SORTS[sort_by]
+    value = row[_column_key(column)]
+    if kind == 'datetime':
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    elif kind == 'decimal':
+        value = str(value)
+    payload = json.dumps([sort_by, value, row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(sort_by, token):
+    """
+    Decode a next-page token.
+    Returns (value, id), or None when the token is missing, malformed or was
+    issued for a different sort mode (the caller then serves the first page).
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        token_sort, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if token_sort != sort_by:
+            return None
+        kind = PRODUCT_SORTS[sort_by][2]
+        if kind == 'datetime':
+            value = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        elif kind == 'decimal':
+            value = Decimal(value)
+        elif kind == 'float':
+            value = float(value)
+        elif not isinstance(value, str):
+            return None
+        return value, int(last_id)
+    except (ValueError, TypeError, InvalidOperation, UnicodeError):
+        return None
+
+
+def keyset_clause(sort_by, position):
+    """
+    SQL for continuing after `position` plus the ORDER BY for the sort mode.
+
+    Returns (where_sql, params, order_sql); where_sql is empty on the first
+    page. The OR-expanded form is used instead of a row constructor because
+    MySQL only turns the former into an index range scan.
+    """
+    column, direction, _ = PRODUCT_SORTS[sort_by]
+    order_sql = f" ORDER BY {column} {direction}, p.id {direction}"
+    if position is None:
+        return '', [], order_sql
+
+    op = '<' if direction == 'DESC' else '>'
+    value, last_id = position
+    where_sql = f" AND ({column} {op} %s OR ({column} = %s AND p.id {op} %s))"
+    return where_sql, [value, value, last_id], order_sql
@@ -0,0 +1,79 @@
+"""
+Payment Gateway Client
+Razorpay client over a pooled HTTP session: kept-alive connections,
+connect/read timeouts on every call and per-call latency counters
+"""
+
+import threading
+import time
+import razorpay
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class GatewaySession(requests.Session):
+    """
+    requests.Session with a connection pool, a default timeout and stats
+
+    Only failures to connect are retried (the request never reached the
+    gateway, so retrying cannot create a second order); read timeouts and
+    error responses are raised to the caller.
+    """
+
+    def __init__(self, timeout=(3, 10), pool_size=10, connect_retries=2):
+        super().__init__()
+        self.timeout = timeout
+        retry = Retry(total=connect_retries, connect=connect_retries, read=0, status=0, other=0, backoff_factor=0.2)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'errors': 0, 'timeouts': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        outcome = None
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.Timeout:
+            outcome = 'timeouts'
+            raise
+        except requests.RequestException:
+            outcome = 'errors'
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats['calls'] += 1
+                self._stats['total_ms'] += elapsed
+                self._stats['max_ms'] = max(self._stats['max_ms'], elapsed)
+                if outcome:
+                    self._stats[outcome] += 1
+
+    def stats(self):
+        """Call counts and latency of gateway requests made by this process"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_ms'] = round(stats['total_ms'] / stats['calls'], 3) if stats['calls'] else None
+        stats['total_ms'] = round(stats['total_ms'], 3)
+        stats['max_ms'] = round(stats['max_ms'], 3)
+        stats['timeout'] = list(self.timeout)
+        return stats
+
+
+def init_app(app):
+    """Create the application's Razorpay client on a pooled session"""
+    session = GatewaySession(
+        timeout=(app.config['RAZORPAY_CONNECT_TIMEOUT'], app.config['RAZORPAY_READ_TIMEOUT']),
+        pool_size=app.config['RAZORPAY_POOL_SIZE']
+    )
+    app.extensions['payment_gateway'] = session
+    return razorpay.Client(session=session, auth=(app.config['RAZORPAY_KEY_ID'], app.config['RAZORPAY_KEY_SECRET']))
+
+
+def get_gateway_session():
+    """Get the gateway HTTP session of the current application"""
+    return current_app.extensions['payment_gateway']
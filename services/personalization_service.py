@@ -0,0 +1,216 @@
+"""
+Personalized Recommendation Service
+Ranked homepage recommendations per customer, precomputed into
+customer_recommendations and invalidated when the customer's orders or
+wishlist change
+
+Precompute for recently active customers (e.g. every few minutes from cron):
+    python -m services.personalization_service --active-days 30
+"""
+
+from services.db_pool import get_db_connection
+from services.recommendation_engine import recommendation_engine
+from services.trending_service import trending_service
+
+# Ranked candidates stored per customer
+CANDIDATES_PER_CUSTOMER = 50
+
+# Lists are also recomputed once this old, to follow rating and stock changes
+MAX_AGE_HOURS = 24
+
+
+def invalidate(cursor, customer_id):
+    """
+    Mark a customer's stored list out of date after an order or wishlist
+    change. Runs on the caller's cursor, so it commits with that change.
+    """
+    cursor.execute("""
+        INSERT INTO customer_recommendation_state (customer_id, version)
+        VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, (customer_id,))
+
+
+def _profile(cursor, customer_id):
+    """(purchased product ids, purchased categories, wishlist categories)"""
+    cursor.execute("""
+        SELECT DISTINCT oi.product_id, p.category_id
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        JOIN products p ON p.id = oi.product_id
+        WHERE o.customer_id = %s
+    """, (customer_id,))
+    purchases = cursor.fetchall()
+    cursor.execute("""
+        SELECT DISTINCT p.category_id
+        FROM wishlist w
+        JOIN products p ON p.id = w.product_id
+        WHERE w.customer_id = %s
+    """, (customer_id,))
+    wishlist = cursor.fetchall()
+    return (
+        [row['product_id'] for row in purchases],
+        {row['category_id'] for row in purchases},
+        {row['category_id'] for row in wishlist}
+    )
+
+
+def compute(cursor, customer_id):
+    """
+    Recompute and store one customer's ranked candidates; returns them as
+    [(product_id, score)]. Customers with no orders or wishlist get an
+    empty list (they are served trending products instead).
+
+    The state version is read before the profile, so an invalidation that
+    lands while computing leaves the list stale for the next request.
+    """
+    cursor.execute("SELECT version FROM customer_recommendation_state WHERE customer_id = %s", (customer_id,))
+    state = cursor.fetchone()
+    version = state['version'] if state else 0
+
+    purchased, purchased_categories, wishlist_categories = _profile(cursor, customer_id)
+    if purchased_categories or wishlist_categories:
+        ranked = recommendation_engine.personalized(
+            purchased_categories, wishlist_categories, purchased, CANDIDATES_PER_CUSTOMER
+        )
+    else:
+        ranked = []
+
+    cursor.execute("DELETE FROM customer_recommendations WHERE customer_id = %s", (customer_id,))
+    if ranked:
+        cursor.execute(f"""
+            INSERT INTO customer_recommendations (customer_id, product_id, score)
+            VALUES {', '.join(['(%s, %s, %s)'] * len(ranked))}
+        """, [value for product_id, score in ranked for value in (customer_id, product_id, score)])
+    cursor.execute("""
+        INSERT INTO customer_recommendation_state (customer_id, version, computed_version, computed_at)
+        VALUES (%s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE computed_version = VALUES(computed_version), computed_at = NOW()
+    """, (customer_id, version, version))
+    return ranked
+
+
+class PersonalizationService:
+    """
+    Serves a customer's stored list; a missing or invalidated list is
+    recomputed on the spot (a few indexed reads plus a vectorised pass over
+    the recommendation engine's arrays) and stored for the next visit
+    """
+
+    def __init__(self):
+        self._stats = {'served_stored': 0, 'recomputed': 0, 'cold_start': 0}
+
+    def get_recommendations(self, customer_id, limit=20):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT computed_version <=> version
+                       AND computed_at >= DATE_SUB(NOW(), INTERVAL %s HOUR) as is_fresh
+                FROM customer_recommendation_state
+                WHERE customer_id = %s
+            """, (MAX_AGE_HOURS, customer_id))
+            state = cursor.fetchone()
+
+            if state and state['is_fresh']:
+                cursor.execute("""
+                    SELECT product_id, score
+                    FROM customer_recommendations
+                    WHERE customer_id = %s
+                    ORDER BY score DESC
+                """, (customer_id,))
+                ranked = [(row['product_id'], row['score']) for row in cursor.fetchall()]
+                self._stats['served_stored'] += 1
+            else:
+                ranked = compute(cursor, customer_id)
+                conn.commit()
+                self._stats['recomputed'] += 1
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        scores = dict(ranked)
+        recommendations = recommendation_engine.product_info([product_id for product_id, _ in ranked])[:limit]
+        for rec in recommendations:
+            rec['personalization_score'] = float(scores[rec['id']])
+
+        if not recommendations:
+            self._stats['cold_start'] += 1
+            return trending_service.get_trending(limit)
+        return recommendations
+
+    def stored_version(self, customer_id):
+        """
+        (version, computed_at, has_list) of the customer's stored list if it
+        is fresh, else None (the next request recomputes it)
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT st.version, st.computed_at,
+                   EXISTS (SELECT 1 FROM customer_recommendations cr WHERE cr.customer_id = st.customer_id) as has_list
+            FROM customer_recommendation_state st
+            WHERE st.customer_id = %s
+            AND st.computed_version <=> st.version
+            AND st.computed_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+        """, (customer_id, MAX_AGE_HOURS))
+        state = cursor.fetchone()
+        conn.close()
+        return (state['version'], state['computed_at'], bool(state['has_list'])) if state else None
+
+    def stats(self):
+        """How requests were served"""
+        return dict(self._stats)
+
+
+def precompute_active(active_days=30):
+    """
+    Recompute the lists of customers active in the last `active_days`
+    (ordered or wishlisted) whose list is missing, invalidated or older
+    than MAX_AGE_HOURS
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT active.customer_id
+            FROM (
+                SELECT customer_id FROM orders WHERE created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+                UNION
+                SELECT customer_id FROM wishlist WHERE created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            ) active
+            LEFT JOIN customer_recommendation_state st ON st.customer_id = active.customer_id
+            WHERE st.customer_id IS NULL
+            OR NOT (st.computed_version <=> st.version)
+            OR st.computed_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
+        """, (active_days, active_days, MAX_AGE_HOURS))
+        customer_ids = [row['customer_id'] for row in cursor.fetchall()]
+
+        for customer_id in customer_ids:
+            compute(cursor, customer_id)
+            conn.commit()
+        print(f"✨ Personalized recommendations precomputed for {len(customer_ids)} customers")
+        return len(customer_ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# Create singleton instance
+personalization_service = PersonalizationService()
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Precompute personalized recommendations for active customers')
+    parser.add_argument('--active-days', type=int, default=30)
+    args = parser.parse_args()
+
+    with app.app_context():
+        precompute_active(args.active_days)
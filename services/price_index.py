@@ -0,0 +1,143 @@
+"""
+Product Price Index
+Sorted (price, id) arrays over in-stock products, globally and per
+category, for nearest-price lookups
+"""
+
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from services.catalog_index import CatalogIndex
+
+# Similar-price candidates lie within this fraction of the product's price
+PRICE_BAND = 0.3
+
+
+class PriceIndex(CatalogIndex):
+    """
+    Sorted-array price index
+
+    In-stock products are kept as (price, product_id) pairs in one sorted
+    list for the whole catalog and one per category. The nearest prices to
+    a product are found by bisecting to its position and walking outwards
+    from both sides, so a lookup is O(log n + k) whatever the catalog size.
+    Product changes insort/delete single pairs.
+    """
+
+    name = 'Price'
+
+    def __init__(self, sync_interval=60, rebuild_interval=3600):
+        super().__init__(sync_interval, rebuild_interval)
+        self._write_lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._global = []  # sorted (price, product_id)
+        self._by_category = defaultdict(list)  # category_id -> sorted (price, product_id)
+        self._products = {}  # product_id -> (price, category_id, rating, in_stock)
+
+    # -- CatalogIndex hooks ---------------------------------------------------
+
+    def _unlink(self, product_id):
+        previous = self._products.pop(product_id, None)
+        if previous is None:
+            return
+        price, category_id, _, in_stock = previous
+        if not in_stock:
+            return
+        for keys in (self._global, self._by_category[category_id]):
+            i = bisect_left(keys, (price, product_id))
+            if i < len(keys) and keys[i] == (price, product_id):
+                del keys[i]
+
+    def _add_locked(self, row, bulk=False):
+        price = float(row['price'])
+        in_stock = row['quantity'] > 0
+        self._unlink(row['id'])
+        # Out-of-stock products are never suggested but can still be looked up from
+        self._products[row['id']] = (price, row['category_id'], float(row['average_rating']), in_stock)
+        if not in_stock:
+            return
+        if bulk:
+            self._global.append((price, row['id']))
+            self._by_category[row['category_id']].append((price, row['id']))
+        else:
+            insort(self._global, (price, row['id']))
+            insort(self._by_category[row['category_id']], (price, row['id']))
+
+    def _build(self, rows):
+        with self._write_lock:
+            self._reset()
+            for row in rows:
+                self._add_locked(row, bulk=True)
+            self._global.sort()
+            for keys in self._by_category.values():
+                keys.sort()
+
+    def _add(self, row):
+        with self._write_lock:
+            self._add_locked(row)
+
+    def _remove(self, product_id):
+        with self._write_lock:
+            self._unlink(product_id)
+
+    # -- queries -----------------------------------------------------------
+
+    def nearest(self, product_id, limit=5, same_category=False):
+        """
+        Ids of the in-stock products priced closest to product_id, within
+        PRICE_BAND of its price, closest first (equal distances by rating).
+        Searches the product's category only if same_category is set.
+        """
+        self.ensure_fresh()
+
+        with self._write_lock:
+            product = self._products.get(product_id)
+            if product is None:
+                return []
+            price, category_id, _, _ = product
+            keys = self._by_category.get(category_id, []) if same_category else self._global
+            low_limit, high_limit = price * (1 - PRICE_BAND), price * (1 + PRICE_BAND)
+
+            # keys[low] walks down from the product's position, keys[high] walks up
+            high = bisect_left(keys, (price, product_id))
+            low = high - 1
+            if high < len(keys) and keys[high][1] == product_id:
+                high += 1
+
+            def distance(i):
+                return abs(keys[i][0] - price)
+
+            def rating(i):
+                return self._products[keys[i][1]][2]
+
+            similar = []
+            while len(similar) < limit:
+                low_ok = low >= 0 and keys[low][0] >= low_limit
+                high_ok = high < len(keys) and keys[high][0] <= high_limit
+                if not low_ok and not high_ok:
+                    break
+                take_low = low_ok and (
+                    not high_ok or (distance(low), -rating(low)) <= (distance(high), -rating(high))
+                )
+                if take_low:
+                    similar.append(keys[low][1])
+                    low -= 1
+                else:
+                    similar.append(keys[high][1])
+                    high += 1
+            return similar
+
+    def stats(self):
+        """Index size and freshness"""
+        return {
+            'products': len(self._products),
+            'in_stock': len(self._global),
+            'categories': len(self._by_category),
+            **self.sync_stats()
+        }
+
+
+# Create singleton instance
+price_index = PriceIndex()
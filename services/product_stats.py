@@ -0,0 +1,115 @@
+"""
+Product Statistics Service
+Incrementally maintained per-product counters (ratings, sales, views) in the
+product_stats table, so readers never re-aggregate product_reviews or
+order_items on the request path
+"""
+
+# Readers join the stats row instead of aggregating, e.g.
+#   LEFT JOIN product_stats ps ON ps.product_id = p.id
+#   COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as avg_rating,
+#   COALESCE(ps.rating_count, 0) as review_count
+# A product without a stats row has no reviews, sales or views yet.
+
+
+def _star_column(rating):
+    rating = int(rating)
+    if rating < 1 or rating > 5:
+        raise ValueError(f"Rating must be between 1 and 5, got {rating}")
+    return f"rating_{rating}"
+
+
+def _bump(cursor, product_id, deltas):
+    """
+    Add deltas ({column: amount}) to a product's stats row in one statement,
+    creating the row on first use. Every update is O(1): a single-row upsert
+    on the primary key, run on the caller's cursor so it commits (or rolls
+    back) with the caller's transaction.
+    """
+    columns = list(deltas)
+    values = [deltas[column] for column in columns]
+    cursor.execute(f"""
+        INSERT INTO product_stats (product_id, {', '.join(columns)})
+        VALUES (%s, {', '.join(['GREATEST(%s, 0)'] * len(columns))})
+        ON DUPLICATE KEY UPDATE
+            {', '.join(f'{column} = GREATEST({column} + %s, 0)' for column in columns)}
+    """, [product_id] + values + values)
+
+
+def record_review(cursor, product_id, rating):
+    """A review with `rating` stars was added"""
+    _bump(cursor, product_id, {'rating_sum': int(rating), 'rating_count': 1, _star_column(rating): 1})
+
+
+def change_review_rating(cursor, product_id, old_rating, new_rating):
+    """A review was edited from `old_rating` to `new_rating` stars"""
+    if int(old_rating) == int(new_rating):
+        return
+    _bump(cursor, product_id, {
+        'rating_sum': int(new_rating) - int(old_rating),
+        _star_column(old_rating): -1,
+        _star_column(new_rating): 1
+    })
+
+
+def remove_review(cursor, product_id, rating):
+    """A review with `rating` stars was deleted"""
+    _bump(cursor, product_id, {'rating_sum': -int(rating), 'rating_count': -1, _star_column(rating): -1})
+
+
+def record_sale_counts(cursor, counts):
+    """
+    Add many products' sales ({product_id: quantity}; a negative quantity
+    takes units back) with one statement per sign. Rows are written in
+    product_id order, the lock order checkout and stock release share.
+    """
+    counts = {product_id: int(quantity) for product_id, quantity in counts.items() if int(quantity)}
+    added = sorted(product_id for product_id, quantity in counts.items() if quantity > 0)
+    removed = sorted(product_id for product_id, quantity in counts.items() if quantity < 0)
+    if added:
+        cursor.execute(f"""
+            INSERT INTO product_stats (product_id, sales_count)
+            VALUES {', '.join(['(%s, %s)'] * len(added))}
+            ON DUPLICATE KEY UPDATE sales_count = sales_count + VALUES(sales_count)
+        """, [value for product_id in added for value in (product_id, counts[product_id])])
+    if removed:
+        cursor.execute(f"""
+            UPDATE product_stats
+            SET sales_count = GREATEST(sales_count - CASE product_id
+                {' '.join(['WHEN %s THEN %s'] * len(removed))} ELSE 0 END, 0)
+            WHERE product_id IN ({', '.join(['%s'] * len(removed))})
+            ORDER BY product_id
+        """, [value for product_id in removed for value in (product_id, -counts[product_id])] + removed)
+
+
+def record_view_counts(cursor, counts):
+    """
+    Add many products' views ({product_id: views}) in one multi-row upsert.
+    Rows are written in product_id order so concurrent flushes lock them in
+    the same order.
+    """
+    if not counts:
+        return
+    product_ids = sorted(counts)
+    cursor.execute(f"""
+        INSERT INTO product_stats (product_id, view_count)
+        VALUES {', '.join(['(%s, %s)'] * len(product_ids))}
+        ON DUPLICATE KEY UPDATE view_count = view_count + VALUES(view_count)
+    """, [value for product_id in product_ids for value in (product_id, int(counts[product_id]))])
+
+
+def get_product_stats(cursor, product_id):
+    """
+    Stats of one product as a dict: avg_rating, review_count, rating
+    histogram {5: n, ..., 1: n}, sales_count and view_count
+    """
+    cursor.execute("SELECT * FROM product_stats WHERE product_id = %s", (product_id,))
+    row = cursor.fetchone() or {}
+    count = row.get('rating_count') or 0
+    return {
+        'avg_rating': (row.get('rating_sum') or 0) / count if count else 0.0,
+        'review_count': count,
+        'rating_distribution': {star: row.get(f'rating_{star}') or 0 for star in range(5, 0, -1)},
+        'sales_count': row.get('sales_count') or 0,
+        'view_count': row.get('view_count') or 0
+    }
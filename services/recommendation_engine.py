@@ -0,0 +1,386 @@
+"""
+Recommendation Engine
+In-memory, vectorised scoring for product page recommendations: per-product
+feature columns in numpy arrays, scored for every candidate in one pass
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from services.catalog_index import CatalogIndex
+from services.db_pool import get_db_connection
+from services.response_cache import LocalTier
+
+# Strategy weights (same category / co-purchased / recently viewed)
+CATEGORY_WEIGHT = 0.4
+COLLABORATIVE_WEIGHT = 0.35
+RECENTLY_VIEWED_WEIGHT = 0.25
+
+RECENTLY_VIEWED_DAYS = 30
+
+# Seconds a customer's recent views are kept in memory before being re-read
+# (views recorded in this process are added as they happen)
+RECENT_VIEWS_TTL = 300
+RECENT_VIEWS_MAX_CUSTOMERS = 10000
+
+CATEGORY_REASON = 'Similar products in {}'
+COLLABORATIVE_REASON = 'Customers who bought this also bought'
+RECENTLY_VIEWED_REASON = 'Based on your browsing history'
+
+
+class RecommendationEngine(CatalogIndex):
+    """
+    Columnar snapshot of the catalog's recommendation features
+
+    One numpy array per feature (category, rating, review count, sales,
+    stock), one slot per product, maintained like FacetIndex. The
+    co-purchase neighbours from product_similarity are held alongside and
+    reloaded with every full rebuild. A recommendation request gathers the
+    candidate slots of every strategy, scores them with array arithmetic and
+    picks the top k with argpartition, so it does not touch the database
+    except to read a signed-in customer's recently viewed products, which
+    are then kept in memory for RECENT_VIEWS_TTL seconds and updated by the
+    view tracker as new views are recorded.
+    """
+
+    name = 'Recommendation'
+
+    def __init__(self, sync_interval=60, rebuild_interval=3600):
+        super().__init__(sync_interval, rebuild_interval)
+        self._write_lock = threading.Lock()
+        self._reset(0)
+        self._neighbours = {}  # product_id -> (similar product ids, similarity scores)
+        self._recent_views = LocalTier(RECENT_VIEWS_MAX_CUSTOMERS)  # customer_id -> (loaded_at, {product_id: viewed_at})
+        self._timings = {'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'recent_view_reads': 0}
+        self._timings_lock = threading.Lock()
+
+    def _reset(self, capacity):
+        capacity = max(capacity, 64)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._category = np.zeros(capacity, dtype=np.int64)
+        self._rating = np.zeros(capacity, dtype=np.float64)
+        self._reviews = np.zeros(capacity, dtype=np.float64)
+        self._sales = np.zeros(capacity, dtype=np.float64)
+        self._category_score = np.zeros(capacity, dtype=np.float64)  # request independent part
+        self._available = np.zeros(capacity, dtype=bool)  # indexed and in stock
+        self._info = [None] * capacity  # slot -> display fields of the product
+        self._by_category = {}  # category_id -> available slots, best category_score first
+        self._slots = {}  # product_id -> slot
+        self._free = []
+        self._used = 0
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        for attr in ('_ids', '_category', '_rating', '_reviews', '_sales', '_category_score', '_available'):
+            old = getattr(self, attr)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+        self._info.extend([None] * (capacity - len(self._info)))
+
+    def _add_locked(self, row):
+        slot = self._slots.get(row['id'])
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                if self._used == len(self._ids):
+                    self._grow()
+                slot = self._used
+                self._used += 1
+            self._slots[row['id']] = slot
+        else:
+            self._by_category.pop(int(self._category[slot]), None)
+        self._by_category.pop(row['category_id'], None)
+        self._ids[slot] = row['id']
+        self._category[slot] = row['category_id']
+        self._rating[slot] = float(row['average_rating'])
+        self._reviews[slot] = row['review_count']
+        self._sales[slot] = row['sales_count']
+        self._category_score[slot] = (
+            self._rating[slot] * 0.4 + (self._sales[slot] / 10.0) * 0.3 + (self._reviews[slot] / 5.0) * 0.3
+        )
+        self._available[slot] = row['quantity'] > 0
+        self._info[slot] = {
+            'id': row['id'],
+            'name': row['name'],
+            'price': float(row['price']),
+            'discount_price': float(row['discount_price']) if row['discount_price'] else None,
+            'image_url': row['image_url'],
+            'category_name': row['category_name'],
+            'business_name': row['business_name'],
+            'avg_rating': float(row['average_rating']),
+            'review_count': row['review_count']
+        }
+
+    def _load_neighbours(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT product_id, similar_product_id, score
+            FROM product_similarity
+            ORDER BY product_id
+        """)
+        rows = cursor.fetchall()
+        conn.close()
+
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row['product_id'], ([], []))
+            grouped[row['product_id']][0].append(row['similar_product_id'])
+            grouped[row['product_id']][1].append(row['score'])
+        return {
+            product_id: (np.array(ids, dtype=np.int64), np.array(scores, dtype=np.float64))
+            for product_id, (ids, scores) in grouped.items()
+        }
+
+    def _build(self, rows):
+        try:
+            neighbours = self._load_neighbours()
+        except Exception as e:
+            print(f"❌ Failed to load co-purchase neighbours: {e}")
+            neighbours = self._neighbours
+        with self._write_lock:
+            self._reset(len(rows) * 2)
+            for row in rows:
+                self._add_locked(row)
+            self._neighbours = neighbours
+
+    def _add(self, row):
+        with self._write_lock:
+            self._add_locked(row)
+
+    def _remove(self, product_id):
+        with self._write_lock:
+            slot = self._slots.pop(product_id, None)
+            if slot is not None:
+                self._by_category.pop(int(self._category[slot]), None)
+                self._available[slot] = False
+                self._info[slot] = None
+                self._free.append(slot)
+
+    def _recent_views_of(self, customer_id):
+        """{product_id: last viewed_at} of the customer, read once per RECENT_VIEWS_TTL"""
+        cached = self._recent_views.get(customer_id)
+        if cached is not None:
+            return cached[1]
+        loaded_at = time.monotonic()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT product_id, MAX(viewed_at) as viewed_at
+            FROM recently_viewed
+            WHERE customer_id = %s
+            AND viewed_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY product_id
+        """, (customer_id, RECENTLY_VIEWED_DAYS))
+        rows = cursor.fetchall()
+        conn.close()
+        views = {row['product_id']: row['viewed_at'] for row in rows}
+        self._recent_views.set(customer_id, (loaded_at, views), RECENT_VIEWS_TTL, ())
+        with self._timings_lock:
+            self._timings['recent_view_reads'] += 1
+        return views
+
+    def note_view(self, customer_id, product_id, viewed_at):
+        """Add a view just recorded by this process to the customer's cached recent views"""
+        cached = self._recent_views.get(customer_id)
+        if cached is None:
+            return  # Read from the database on next use
+        loaded_at, views = cached
+        remaining = loaded_at + RECENT_VIEWS_TTL - time.monotonic()
+        if remaining > 0:
+            self._recent_views.set(customer_id, (loaded_at, {**views, product_id: viewed_at}), remaining, ())
+
+    def _recently_viewed(self, customer_id):
+        """{product_id: hours since last viewed} for the customer's recent views"""
+        now = datetime.now()
+        cutoff = now - timedelta(days=RECENTLY_VIEWED_DAYS)
+        return {
+            product_id: int((now - viewed_at).total_seconds() // 3600)
+            for product_id, viewed_at in self._recent_views_of(customer_id).items()
+            if viewed_at >= cutoff
+        }
+
+    def recently_viewed_version(self, customer_id):
+        """
+        Changes whenever the customer's recently viewed input to recommend()
+        may have: a new view, a view leaving the window, or any view's age
+        in hours ticking over
+        """
+        now = datetime.now()
+        cutoff = now - timedelta(days=RECENTLY_VIEWED_DAYS)
+        viewed = [viewed_at for viewed_at in self._recent_views_of(customer_id).values() if viewed_at >= cutoff]
+        return (
+            len(viewed),
+            max(viewed, default=None),
+            sum(int((now - viewed_at).total_seconds() // 3600) for viewed_at in viewed)
+        )
+
+    def _scatter(self, product_ids, values):
+        """Map (product ids, values) onto (slots, values), dropping unindexed products"""
+        pairs = [(self._slots[pid], value) for pid, value in zip(product_ids, values) if pid in self._slots]
+        if not pairs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        slots, values = zip(*pairs)
+        return np.array(slots, dtype=np.int64), np.array(values, dtype=np.float64)
+
+    def _category_ranking(self, category_id, n):
+        """Available slots of a category by descending category score (cached until it changes)"""
+        ranking = self._by_category.get(category_id)
+        if ranking is None:
+            members = np.flatnonzero((self._category[:n] == category_id) & self._available[:n])
+            ranking = members[np.argsort(-self._category_score[members], kind='stable')]
+            self._by_category[category_id] = ranking
+        return ranking
+
+    @staticmethod
+    def _positions(candidates, slots, values):
+        """Positions of slots within the sorted candidates, dropping slots that are not candidates"""
+        position = np.searchsorted(candidates, slots)
+        found = position < len(candidates)
+        found[found] = candidates[position[found]] == slots[found]
+        return position[found], values[found]
+
+    def recommend(self, product_id, customer_id=None, limit=5):
+        """
+        Top `limit` products to show next to product_id
+
+        Every in-stock candidate is scored as the weighted sum of the
+        strategies it qualifies for: same category (for everyone), bought
+        together with product_id and recently viewed (for signed-in
+        customers). Each strategy scores a candidate by its rating and
+        popularity plus, respectively, nothing, co-purchase similarity and
+        view recency.
+        """
+        started = time.perf_counter()
+        self.ensure_fresh()
+        viewed = self._recently_viewed(customer_id) if customer_id else {}
+
+        with self._write_lock:
+            n = self._used
+            slot = self._slots.get(product_id)
+
+            # Candidate slots of each strategy; only these are scored. Products
+            # that only match the category cannot outrank the category's top
+            # `limit`, so that is all the category strategy contributes.
+            if slot is not None:
+                category_slots = self._category_ranking(int(self._category[slot]), n)[:limit + 1]
+            else:
+                category_slots = np.zeros(0, dtype=np.int64)
+            neighbours = self._neighbours.get(product_id, ((), ())) if customer_id else ((), ())
+            similar_slots, similarity = self._scatter(*neighbours)
+            viewed_slots, hours_ago = self._scatter(list(viewed), list(viewed.values()))
+
+            candidates = np.unique(np.concatenate((category_slots, similar_slots, viewed_slots)))
+            candidates = candidates[self._available[candidates]]
+            if slot is not None:
+                candidates = candidates[candidates != slot]
+            score = np.zeros(len(candidates), dtype=np.float64)
+            matched = np.zeros((3, len(candidates)), dtype=bool)  # which strategies recommended each
+            rating = self._rating[candidates]
+            reviews = self._reviews[candidates]
+
+            # Same category
+            if slot is not None:
+                matched[0] = self._category[candidates] == self._category[slot]
+                score += np.where(matched[0], CATEGORY_WEIGHT * self._category_score[candidates], 0.0)
+
+            # Bought together (similarity in [0, 1], scaled to weigh like a rating)
+            position, similarity = self._positions(candidates, similar_slots, similarity)
+            score[position] += COLLABORATIVE_WEIGHT * (
+                similarity * 5 * 0.5 + rating[position] * 0.3 + (reviews[position] / 5.0) * 0.2
+            )
+            matched[1, position] = True
+
+            # Recently viewed
+            position, hours_ago = self._positions(candidates, viewed_slots, hours_ago)
+            score[position] += RECENTLY_VIEWED_WEIGHT * (
+                hours_ago * -0.1 + rating[position] * 0.4 + (reviews[position] / 5.0) * 0.2
+            )
+            matched[2, position] = True
+
+            best = np.arange(len(candidates))
+            if len(best) > limit:
+                best = np.argpartition(-score, limit - 1)[:limit]
+            best = best[np.argsort(-score[best], kind='stable')]
+
+            recommendations = []
+            for i in best:
+                info = self._info[candidates[i]]
+                reasons = []
+                if matched[0, i]:
+                    reasons.append(CATEGORY_REASON.format(info['category_name']))
+                if matched[1, i]:
+                    reasons.append(COLLABORATIVE_REASON)
+                if matched[2, i]:
+                    reasons.append(RECENTLY_VIEWED_REASON)
+                recommendations.append({
+                    **info,
+                    'score': round(float(score[i]), 4),
+                    'reason': ' • '.join(reasons[:2])
+                })
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._timings_lock:
+            self._timings['requests'] += 1
+            self._timings['total_ms'] += elapsed_ms
+            self._timings['max_ms'] = max(self._timings['max_ms'], elapsed_ms)
+        return recommendations
+
+    def personalized(self, purchased_categories, wishlist_categories, exclude_ids=(), limit=50):
+        """
+        Rank the catalog for a customer profile: products in categories the
+        customer bought from (+2.0) or wishlisted (+1.5), then by rating and
+        review count. Returns [(product_id, score)], best first.
+        """
+        self.ensure_fresh()
+
+        with self._write_lock:
+            n = self._used
+            category = self._category[:n]
+            score = (
+                np.where(np.isin(category, list(purchased_categories)), 2.0, 0.0) +
+                np.where(np.isin(category, list(wishlist_categories)), 1.5, 0.0) +
+                self._rating[:n] * 0.5 +
+                (self._reviews[:n] / 10.0) * 0.3
+            )
+            eligible = self._available[:n] & (score > 0)
+            excluded, _ = self._scatter(exclude_ids, [0] * len(exclude_ids))
+            eligible[excluded] = False
+
+            candidates = np.flatnonzero(eligible)
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-score[candidates], limit - 1)[:limit]]
+            candidates = candidates[np.argsort(-score[candidates], kind='stable')]
+            return [(int(self._ids[slot]), round(float(score[slot]), 4)) for slot in candidates]
+
+    def product_info(self, product_ids):
+        """Display fields of the given products that are still available, in the given order"""
+        self.ensure_fresh()
+
+        with self._write_lock:
+            slots = [self._slots.get(product_id) for product_id in product_ids]
+            return [dict(self._info[slot]) for slot in slots if slot is not None and self._available[slot]]
+
+    def stats(self):
+        """Index size, freshness and request latency"""
+        with self._timings_lock:
+            timings = dict(self._timings)
+        requests = timings['requests']
+        return {
+            'products': len(self._slots),
+            'slots': self._used,
+            'products_with_neighbours': len(self._neighbours),
+            'requests': requests,
+            'avg_ms': round(timings['total_ms'] / requests, 3) if requests else None,
+            'max_ms': round(timings['max_ms'], 3),
+            'cached_recent_views': len(self._recent_views),
+            'recent_view_reads': timings['recent_view_reads'],
+            **self.sync_stats()
+        }
+
+
+# Create singleton instance
+recommendation_engine = RecommendationEngine()
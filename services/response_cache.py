@@ -0,0 +1,424 @@
+"""
+Response Cache
+Two-tier cache of the catalog pages served to anonymous visitors: a
+per-process LRU in front of an optional shared store, with TTLs and
+tag-based purges when the data behind a page changes
+"""
+
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+from flask import current_app, request, session, g
+
+try:
+    import redis
+except ImportError:  # Only needed for RESPONSE_CACHE_SHARED=redis://...
+    redis = None
+
+# Tags: what a cached response depends on. Views declare them, writers purge them.
+CATALOG = 'catalog'  # Every page showing products (seller approval changes)
+LISTINGS = 'listing:all'  # Product lists not narrowed to one category (home page, /products, search)
+CATEGORIES = 'categories'  # Category menus and /api/categories
+FLASH_DEALS = 'flash_deals'
+
+# Shared-store tag sets outlive their entries; expired members are harmless
+_TAG_SET_TTL = 86400
+
+# Only these bodies are cached (text, stored as str in the shared store)
+_CACHEABLE_TYPES = ('text/html', 'application/json')
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
+
+
+class LocalTier:
+    """Thread-safe LRU of entries with an expiry time each and a tag -> keys index"""
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, entry, tags)
+        self._keys_by_tag = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, entry, ttl, tags):
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, entry, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def purge(self, tags):
+        """Drop every entry carrying one of the tags; returns how many"""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._keys_by_tag.get(tag, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def _drop(self, key):
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        for tag in item[2]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryStore:
+    """
+    Local stand-in for the shared store (RESPONSE_CACHE_SHARED=memory)
+
+    Same interface and serialised values as RedisStore, kept in this
+    process, so the two-tier path can be run without a Redis server.
+    """
+
+    def __init__(self):
+        self._values = {}  # key -> (expires_at, value)
+        self._tags = {}  # tag -> keys
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._values.get(key)
+            if item is None or item[0] <= time.monotonic():
+                self._values.pop(key, None)
+                return None
+            return item[1]
+
+    def set(self, key, value, ttl, tags):
+        with self._lock:
+            self._values[key] = (time.monotonic() + ttl, value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def purge(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.pop(tag, ()))
+            for key in keys:
+                self._values.pop(key, None)
+            return len(keys)
+
+
+class RedisStore:
+    """Shared store in Redis: one string per entry and one set of entry keys per tag"""
+
+    def __init__(self, url, prefix='resp:'):
+        self.prefix = prefix
+        # A slow cache must not be slower than the database it saves
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+
+    def get(self, key):
+        value = self._redis.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl, tags):
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.set(self.prefix + key, value, ex=ttl)
+        for tag in tags:
+            tag_key = f'{self.prefix}tag:{tag}'
+            pipe.sadd(tag_key, self.prefix + key)
+            pipe.expire(tag_key, _TAG_SET_TTL)
+        pipe.execute()
+
+    def purge(self, tags):
+        tag_keys = [f'{self.prefix}tag:{tag}' for tag in tags]
+        pipe = self._redis.pipeline(transaction=False)
+        for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+        keys = set()
+        for members in pipe.execute():
+            keys.update(members)
+        self._redis.delete(*keys, *tag_keys)
+        return len(keys)
+
+
+class ResponseCache:
+    """
+    Cached responses, looked up in the local tier, then the shared store
+
+    Entries are written to both tiers. With a shared store the local copy
+    lives at most local_ttl seconds: a purge clears this process's local
+    tier and the shared store, and other processes' local copies expire
+    soon after. Without one, each process caches (and purges) on its own.
+    A response rendered while a purge ran is not stored, so a fill that
+    read the old data cannot outlive the purge.
+    """
+
+    def __init__(self, max_entries=2000, shared=None, local_ttl=5):
+        self.local = LocalTier(max_entries)
+        self.shared = shared
+        self.local_ttl = local_ttl
+        self._purge_count = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'stores': 0,
+            'stale_stores_skipped': 0, 'purges': 0, 'purged_entries': 0, 'shared_errors': 0
+        }
+        self._endpoints = {}  # endpoint -> {'hits': n, 'misses': n}
+
+    def _count(self, endpoint, stat, outcome):
+        with self._lock:
+            self._stats[stat] += 1
+            counts = self._endpoints.setdefault(endpoint, {'hits': 0, 'misses': 0})
+            counts[outcome] += 1
+
+    def _shared_error(self, action, e):
+        with self._lock:
+            self._stats['shared_errors'] += 1
+        print(f"❌ Shared response cache {action} failed: {e}")
+
+    def _local_ttl(self, ttl):
+        return min(ttl, self.local_ttl) if self.shared is not None else ttl
+
+    def get(self, key, endpoint):
+        """(entry, tier name) or (None, None)"""
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count(endpoint, 'local_hits', 'hits')
+            return entry, 'local'
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                self._shared_error('read', e)
+                value = None
+            if value is not None:
+                entry = json.loads(value)
+                self.local.set(key, entry, self._local_ttl(entry['ttl']), entry['tags'])
+                self._count(endpoint, 'shared_hits', 'hits')
+                return entry, 'shared'
+
+        self._count(endpoint, 'misses', 'misses')
+        return None, None
+
+    def purge_marker(self):
+        """Taken before rendering and handed to store()"""
+        return self._purge_count
+
+    def store(self, key, entry, purge_marker):
+        if purge_marker != self._purge_count:
+            with self._lock:
+                self._stats['stale_stores_skipped'] += 1
+            return
+        self.local.set(key, entry, self._local_ttl(entry['ttl']), entry['tags'])
+        if self.shared is not None:
+            try:
+                self.shared.set(key, json.dumps(entry), entry['ttl'], entry['tags'])
+            except Exception as e:
+                self._shared_error('write', e)
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def purge(self, tags):
+        """Drop every cached response carrying one of the tags, in both tiers"""
+        with self._lock:
+            self._purge_count += 1
+        purged = self.local.purge(tags)
+        if self.shared is not None:
+            try:
+                purged += self.shared.purge(tags)
+            except Exception as e:
+                self._shared_error('purge', e)
+        with self._lock:
+            self._stats['purges'] += 1
+            self._stats['purged_entries'] += purged
+
+    @staticmethod
+    def _ratio(hits, total):
+        return round(hits / total, 4) if total else None
+
+    def stats(self):
+        """Hit/miss counters overall and per endpoint"""
+        with self._lock:
+            stats = dict(self._stats)
+            endpoints = {
+                endpoint: dict(counts, hit_ratio=self._ratio(counts['hits'], counts['hits'] + counts['misses']))
+                for endpoint, counts in self._endpoints.items()
+            }
+        hits = stats['local_hits'] + stats['shared_hits']
+        return {
+            'shared_store': type(self.shared).__name__ if self.shared is not None else None,
+            'local_entries': len(self.local),
+            'local_evictions': self.local.evictions,
+            'hit_ratio': self._ratio(hits, hits + stats['misses']),
+            **stats,
+            'endpoints': endpoints
+        }
+
+
+def _cacheable_request():
+    """Anonymous GETs with nothing flashed: the same page for every visitor"""
+    return request.method == 'GET' and 'user_id' not in session and '_flashes' not in session
+
+
+def _request_key():
+    return request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+
+
+def _storable(response):
+    return (
+        response.status_code == 200
+        and response.mimetype in _CACHEABLE_TYPES
+        and not response.direct_passthrough
+        and 'Set-Cookie' not in response.headers
+        and not session.modified
+        and not g.get('response_cache_skip')
+    )
+
+
+def cached(ttl, tags=()):
+    """
+    Cache a view's response for anonymous visitors for `ttl` seconds
+
+    `tags` name the data the response depends on; a callable is given the
+    view's arguments. Views can add tags while rendering with tag(), or
+    keep a response out of the cache with skip().
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def decorated_function(*args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None or not _cacheable_request():
+                return view(*args, **kwargs)
+
+            key = _request_key()
+            entry, tier = cache.get(key, request.endpoint)
+            if entry is not None:
+                response = current_app.response_class(
+                    entry['body'], status=entry['status'], content_type=entry['content_type']
+                )
+                response.headers['X-Cache'] = f'HIT-{tier}'
+                return response
+
+            marker = cache.purge_marker()
+            g.response_cache_tags = set(tags(*args, **kwargs) if callable(tags) else tags)
+            response = current_app.make_response(view(*args, **kwargs))
+            if _storable(response):
+                cache.store(key, {
+                    'status': response.status_code,
+                    'content_type': response.content_type,
+                    'body': response.get_data(as_text=True),
+                    'ttl': ttl,
+                    'tags': sorted(g.response_cache_tags)
+                }, marker)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return decorated_function
+    return decorator
+
+
+def tag(*tags):
+    """Add tags to the response being rendered by a cached view"""
+    if 'response_cache_tags' in g:
+        g.response_cache_tags.update(tags)
+
+
+def skip():
+    """Do not cache the response being rendered (e.g. a degraded fallback page)"""
+    g.response_cache_skip = True
+
+
+def purge(*tags):
+    """Drop the cached responses carrying any of these tags"""
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.purge(tags)
+
+
+def purge_product(product_id, category_ids=(), listings=True):
+    """
+    Drop the cached pages showing a product: its own page and, unless
+    listings=False, the listings it appears in (home page, unfiltered and
+    search listings, its categories)
+    """
+    tags = [product_tag(product_id)]
+    if listings:
+        tags.append(LISTINGS)
+        tags.extend(category_tag(category_id) for category_id in category_ids if category_id)
+    purge(*tags)
+
+
+def purge_product_later(product_id, category_ids=(), listings=True):
+    """
+    purge_product() once the current app context ends, i.e. after the
+    caller's transaction has committed; for helpers that write on the
+    caller's cursor (stock released by inventory_service)
+    """
+    g.setdefault('_response_cache_purges', []).append((product_id, tuple(category_ids), listings))
+
+
+def _purge_deferred(exc=None):
+    for product_id, category_ids, listings in g.pop('_response_cache_purges', ()):
+        purge_product(product_id, category_ids, listings)
+
+
+def _shared_store(url):
+    if not url:
+        return None
+    if url == 'memory':
+        return MemoryStore()
+    if redis is None:
+        print("⚠️ RESPONSE_CACHE_SHARED is set but the redis package is not installed; caching in-process only")
+        return None
+    return RedisStore(url)
+
+
+def init_app(app):
+    """Create the application's response cache (unless disabled)"""
+    app.teardown_appcontext(_purge_deferred)
+    if not app.config['RESPONSE_CACHE_ENABLED']:
+        return None
+    cache = ResponseCache(
+        max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+        shared=_shared_store(app.config['RESPONSE_CACHE_SHARED']),
+        local_ttl=app.config['RESPONSE_CACHE_LOCAL_TTL']
+    )
+    app.extensions['response_cache'] = cache
+    return cache
+
+
+def warn_unshared(app, process):
+    """For processes other than the web server: say their purges stay in-process"""
+    cache = app.extensions.get('response_cache')
+    if cache is not None and cache.shared is None:
+        print(f"⚠️ RESPONSE_CACHE_SHARED is not set: pages cached by the web processes are not purged by "
+              f"the {process}, and show its changes only when their TTL runs out")
+
+
+def get_response_cache():
+    """Get the response cache of the current application (None if disabled)"""
+    return current_app.extensions.get('response_cache')
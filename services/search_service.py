@@ -0,0 +1,171 @@
+"""
+Product Search Service
+In-process inverted index with BM25 ranking, shared by the product listing
+(/products?search=) and the AI shopping assistant
+"""
+
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from services.catalog_index import CatalogIndex
+
+# Field weights: a term in the product name counts three times as much as
+# the same term in the description
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'brand': 2.0,
+    'category_name': 2.0,
+    'description': 1.0,
+}
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'to', 'with', 'your', 'you', 'this', 'that'
+}
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    """Lowercase, split on non-alphanumerics, drop stop words, fold plurals"""
+    tokens = []
+    for token in TOKEN_RE.findall((text or '').lower()):
+        if token in STOP_WORDS:
+            continue
+        # Cheap plural folding so "phones" matches "phone"
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class SearchIndex:
+    """
+    BM25 inverted index over product text fields
+
+    Postings map term -> {product_id: weighted term frequency}, so a query
+    only touches the postings of its own terms and latency depends on how
+    common the terms are, not on catalog size.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}  # product_id -> {term: weighted tf}, for removal
+        self._doc_lengths = {}
+        self._total_length = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def _index_fields(self, fields):
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields.get(field)):
+                terms[token] += weight
+        return terms
+
+    def add(self, product_id, fields):
+        """Index (or re-index) one product"""
+        terms = self._index_fields(fields)
+        length = sum(terms.values())
+        with self._lock:
+            self._remove_locked(product_id)
+            for term, tf in terms.items():
+                self._postings[term][product_id] = tf
+            self._doc_terms[product_id] = terms
+            self._doc_lengths[product_id] = length
+            self._total_length += length
+
+    def remove(self, product_id):
+        """Drop one product from the index"""
+        with self._lock:
+            self._remove_locked(product_id)
+
+    def _remove_locked(self, product_id):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(product_id, 0)
+
+    def search(self, query, limit=None):
+        """
+        Rank products for a free-text query
+
+        Returns a list of (product_id, score), best match first; ties are
+        broken by the newer (higher) product id.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if not doc_count:
+                return []
+            avg_length = self._total_length / doc_count or 1.0
+
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for product_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[product_id] / avg_length)
+                    scores[product_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return ranked[:limit] if limit else ranked
+
+
+class ProductSearchService(CatalogIndex):
+    """
+    Keeps a SearchIndex in sync with the products table (see CatalogIndex).
+    Callers always join the ranked ids back to the products table, so a row
+    deleted by another worker and not yet synced out is harmless.
+    """
+
+    name = 'Search'
+
+    def __init__(self, sync_interval=60, rebuild_interval=3600):
+        super().__init__(sync_interval, rebuild_interval)
+        self.index = SearchIndex()
+
+    def _build(self, rows):
+        index = SearchIndex(self.index.k1, self.index.b)
+        for row in rows:
+            index.add(row['id'], row)
+        self.index = index
+
+    def _add(self, row):
+        self.index.add(row['id'], row)
+
+    def _remove(self, product_id):
+        self.index.remove(product_id)
+
+    def search(self, query, limit=None):
+        """Ranked (product_id, score) pairs for a free-text query"""
+        self.ensure_fresh()
+        return self.index.search(query, limit)
+
+    def stats(self):
+        """Index size and freshness"""
+        return {
+            'documents': len(self.index),
+            'terms': len(self.index._postings),
+            **self.sync_stats()
+        }
+
+
+# Create singleton instance
+search_service = ProductSearchService()
@@ -0,0 +1,289 @@
+"""
+Server-Side Sessions
+Session data (user, cart coupon, buy-now item, comparison list, pending
+login) kept in a server-side store; the cookie only carries a signed
+session id
+"""
+
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+
+try:
+    import redis
+except ImportError:  # Only needed for SESSION_STORE=redis://...
+    redis = None
+
+# Payloads larger than this are zlib-compressed
+_COMPRESS_OVER = 512
+
+# SQLite: expired rows are deleted every this many saves
+_SQLITE_CLEANUP_EVERY = 1000
+
+
+def _serialize(data):
+    """Compact tagged JSON (the cookie session's format), compressed when large"""
+    raw = TaggedJSONSerializer().dumps(data).encode('utf-8')
+    if len(raw) > _COMPRESS_OVER:
+        return b'z' + zlib.compress(raw)
+    return b'j' + raw
+
+
+def _deserialize(value):
+    raw = zlib.decompress(value[1:]) if value[:1] == b'z' else value[1:]
+    return TaggedJSONSerializer().loads(raw.decode('utf-8'))
+
+
+class SQLiteStore:
+    """Sessions in a local SQLite file, shared by the worker processes of one host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._saves = 0
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def _connection(self):
+        # One connection per thread; WAL lets readers run alongside a writer
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, value, ttl):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+            (sid, value, time.time() + ttl)
+        )
+        self._saves += 1
+        if self._saves % _SQLITE_CLEANUP_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, sid):
+        self._connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+class MemoryStore:
+    """
+    Local stand-in for the Redis store (SESSION_STORE=memory): same
+    get/set-with-expiry/delete calls, kept in this process only
+    """
+
+    def __init__(self):
+        self._values = {}  # sid -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            item = self._values.get(sid)
+            if item is None or item[0] <= time.time():
+                self._values.pop(sid, None)
+                return None
+            return item[1]
+
+    def save(self, sid, value, ttl):
+        with self._lock:
+            self._values[sid] = (time.time() + ttl, value)
+
+    def delete(self, sid):
+        with self._lock:
+            self._values.pop(sid, None)
+
+
+class RedisStore:
+    """Sessions in Redis, shared by every worker and host"""
+
+    def __init__(self, url, prefix='session:'):
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def load(self, sid):
+        return self._redis.get(self.prefix + sid)
+
+    def save(self, sid, value, ttl):
+        self._redis.set(self.prefix + sid, value, ex=int(ttl))
+
+    def delete(self, sid):
+        self._redis.delete(self.prefix + sid)
+
+
+class ServerSession(SessionMixin):
+    """
+    Session loaded from the store on first access
+
+    Requests that never touch the session (static files, most JSON
+    endpoints) cost no store read. modified is set by item assignment and
+    deletion; mutating a stored list in place still needs
+    session.modified = True, as with the cookie session.
+    """
+
+    def __init__(self, sid, loader):
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self._loader = loader
+        self._data = None
+        self.loaded_user_id = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        self.accessed = True
+        if self._data is None:
+            self._data = self._loader(self.sid) if self.sid else {}
+            self.loaded_user_id = self._data.get('user_id')
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f'<ServerSession {self._data!r}>'
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Reads the session id from a signed cookie and the data from the store
+
+    The store is written, and the cookie sent, only when the session
+    changed. An emptied session is deleted. When the signed-in user
+    changes (login, logout) the session gets a new id, so an id known
+    before login is useless after it.
+    """
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'loads': 0, 'load_errors': 0, 'saves': 0, 'unchanged': 0, 'deletes': 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def _load(self, sid):
+        self._count('loads')
+        try:
+            value = self.store.load(sid)
+            return _deserialize(value) if value is not None else {}
+        except Exception as e:
+            self._count('load_errors')
+            print(f"❌ Failed to load session: {e}")
+            return {}
+
+    def open_session(self, app, request):
+        self._count('opened')
+        sid = None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('utf-8')
+            except BadSignature:
+                sid = None  # Tampered, or a cookie from before server-side sessions
+        return ServerSession(sid, self._load)
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.modified:
+            if session.loaded:
+                self._count('unchanged')
+            return
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid:
+                self.store.delete(session.sid)
+                self._count('deletes')
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.sid is None or session.get('user_id') != session.loaded_user_id:
+            if session.sid:
+                self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+
+        self.store.save(session.sid, _serialize(dict(session)), self.ttl)
+        self._count('saves')
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode('utf-8')).decode('utf-8'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def stats(self):
+        """Store reads and writes; unchanged = loaded but not written back"""
+        with self._lock:
+            return {'store': type(self.store).__name__, **self._stats}
+
+
+def _store(url):
+    if url == 'memory':
+        return MemoryStore()
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        if redis is None:
+            raise RuntimeError("SESSION_STORE is a Redis URL but the redis package is not installed")
+        return RedisStore(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported SESSION_STORE: {url}")
+
+
+def init_app(app):
+    """Switch the app to server-side sessions (SESSION_STORE='' keeps signed cookie sessions)"""
+    url = app.config['SESSION_STORE']
+    if not url:
+        return None
+    interface = ServerSessionInterface(_store(url), app.permanent_session_lifetime.total_seconds())
+    app.session_interface = interface
+    return interface
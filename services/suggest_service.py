@@ -0,0 +1,226 @@
+"""
+Search Suggestion Service
+Prefix index over product names, brands and category names for
+search-as-you-type, ranked by popularity (views and sales)
+"""
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from services.catalog_index import CatalogIndex
+
+# A sale says more about popularity than a view
+SALES_WEIGHT = 5
+
+# Prefixes up to this length match too many keys to scan per keystroke, so
+# their top suggestions are kept precomputed
+SHORT_PREFIX_LENGTH = 3
+SHORT_PREFIX_TOP = 20
+
+MAX_SUGGESTIONS = 20
+
+WORD_START_RE = re.compile(r'(?:^|(?<=[\s\-/(]))\w', re.UNICODE)
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def _word_suffixes(text):
+    """'apple iphone 15' -> ['apple iphone 15', 'iphone 15', '15'] so any word start matches"""
+    return [text[match.start():] for match in WORD_START_RE.finditer(text)]
+
+
+class SuggestIndex(CatalogIndex):
+    """
+    Sorted-array prefix index
+
+    Every suggestion (a product name, a brand or a category) is stored under
+    each of its word suffixes in one sorted list, so a prefix lookup is a
+    bisect followed by a scan of the matching range. Prefixes of up to
+    SHORT_PREFIX_LENGTH characters, whose ranges can cover much of the
+    catalog, are answered from precomputed top lists instead.
+
+    Product changes update the list with insort and only mark the affected
+    short-prefix tables stale, so nothing is rebuilt wholesale.
+    """
+
+    name = 'Suggest'
+
+    def __init__(self, sync_interval=60, rebuild_interval=3600):
+        super().__init__(sync_interval, rebuild_interval)
+        self._write_lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._keys = []  # sorted (key, entry)
+        self._entries = {}  # entry -> {'text', 'type', 'score'}
+        self._short = {}  # prefix -> [(score, text, entry)] best first
+        self._stale = set()  # short prefixes whose table must be recomputed
+        # Per-product contributions, so brand/category scores can be updated incrementally
+        self._products = {}  # product_id -> (score, brand_entry, category_entry)
+        self._refcount = defaultdict(int)  # brand/category entry -> number of products
+        self._bulk = False  # While building, keys are sorted once at the end
+
+    # -- entries ---------------------------------------------------------
+
+    def _entry_keys(self, entry):
+        return _word_suffixes(normalize(self._entries[entry]['text']))
+
+    def _mark_stale(self, key):
+        for n in range(1, min(SHORT_PREFIX_LENGTH, len(key)) + 1):
+            self._stale.add(key[:n])
+
+    def _put_entry(self, entry, text, kind, score):
+        """Insert an entry, or update its text/score in place"""
+        current = self._entries.get(entry)
+        if current is not None and current['text'] != text:
+            self._drop_entry(entry)
+            current = None
+        if current is None:
+            self._entries[entry] = {'text': text, 'type': kind, 'score': score}
+            if self._bulk:
+                return
+            for key in self._entry_keys(entry):
+                insort(self._keys, (key, entry))
+                self._mark_stale(key)
+        elif current['score'] != score:
+            current['score'] = score
+            if self._bulk:
+                return
+            for key in self._entry_keys(entry):
+                self._mark_stale(key)
+
+    def _drop_entry(self, entry):
+        if entry not in self._entries:
+            return
+        if self._bulk:
+            del self._entries[entry]
+            return
+        for key in self._entry_keys(entry):
+            i = bisect_left(self._keys, (key, entry))
+            if i < len(self._keys) and self._keys[i] == (key, entry):
+                del self._keys[i]
+            self._mark_stale(key)
+        del self._entries[entry]
+
+    def _adjust_group(self, entry, text, kind, delta_score, delta_count):
+        """Add/subtract one product's contribution to a brand or category entry"""
+        if entry is None:
+            return
+        self._refcount[entry] += delta_count
+        if self._refcount[entry] <= 0:
+            del self._refcount[entry]
+            self._drop_entry(entry)
+            return
+        current = self._entries.get(entry)
+        if current is None:
+            self._put_entry(entry, text, kind, delta_score)
+        else:
+            self._put_entry(entry, text or current['text'], kind, current['score'] + delta_score)
+
+    # -- CatalogIndex hooks ---------------------------------------------------
+
+    def _add_locked(self, row):
+        product_id = row['id']
+        score = int(row['view_count']) + SALES_WEIGHT * int(row['sales_count'])
+        brand = (row['brand'] or '').strip()
+        brand_entry = ('brand', brand.lower()) if brand else None
+        category_entry = ('category', row['category_id'])
+
+        self._remove_locked(product_id)
+        self._products[product_id] = (score, brand_entry, category_entry)
+        self._put_entry(('product', product_id), row['name'], 'product', score)
+        self._adjust_group(brand_entry, brand, 'brand', score, 1)
+        self._adjust_group(category_entry, row['category_name'], 'category', score, 1)
+
+    def _remove_locked(self, product_id):
+        previous = self._products.pop(product_id, None)
+        if previous is None:
+            return
+        score, brand_entry, category_entry = previous
+        self._drop_entry(('product', product_id))
+        self._adjust_group(brand_entry, None, 'brand', -score, -1)
+        self._adjust_group(category_entry, None, 'category', -score, -1)
+
+    def _build(self, rows):
+        with self._write_lock:
+            self._reset()
+            self._bulk = True
+            for row in rows:
+                self._add_locked(row)
+            self._keys = sorted((key, entry) for entry in self._entries for key in self._entry_keys(entry))
+            self._bulk = False
+
+    def _add(self, row):
+        with self._write_lock:
+            self._add_locked(row)
+
+    def _remove(self, product_id):
+        with self._write_lock:
+            self._remove_locked(product_id)
+
+    # -- queries -----------------------------------------------------------
+
+    def _scan(self, prefix, limit):
+        """Best `limit` distinct suggestions among keys starting with prefix"""
+        keys = self._keys
+        candidates = {}
+        for i in range(bisect_left(keys, (prefix,)), len(keys)):
+            key, entry = keys[i]
+            if not key.startswith(prefix):
+                break
+            candidates[entry] = self._entries[entry]['score']
+        best = heapq.nsmallest(
+            limit, candidates,
+            key=lambda entry: (-candidates[entry], self._entries[entry]['text'].lower())
+        )
+        return [(candidates[entry], self._entries[entry]['text'], entry) for entry in best]
+
+    def suggest(self, query, limit=8):
+        """
+        Top suggestions for a search box prefix
+
+        Returns a list of {'text', 'type'} dicts, most popular first, with
+        duplicate texts (e.g. a brand and a product both called "Bose") merged.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        self.ensure_fresh()
+
+        with self._write_lock:
+            if len(prefix) <= SHORT_PREFIX_LENGTH:
+                if prefix in self._stale or prefix not in self._short:
+                    self._short[prefix] = self._scan(prefix, SHORT_PREFIX_TOP)
+                    self._stale.discard(prefix)
+                ranked = self._short[prefix]
+            else:
+                ranked = self._scan(prefix, limit * 2)
+
+            suggestions = []
+            seen = set()
+            for _, text, entry in ranked:
+                if text.lower() in seen:
+                    continue
+                seen.add(text.lower())
+                suggestions.append({'text': text, 'type': self._entries[entry]['type']})
+                if len(suggestions) == limit:
+                    break
+            return suggestions
+
+    def stats(self):
+        """Index size and freshness"""
+        return {
+            'entries': len(self._entries),
+            'keys': len(self._keys),
+            'cached_prefixes': len(self._short),
+            **self.sync_stats()
+        }
+
+
+# Create singleton instance
+suggest_index = SuggestIndex()
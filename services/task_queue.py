@@ -0,0 +1,138 @@
+"""
+Background Task Queue
+Per-process pool of worker threads that runs work a response does not
+have to wait for (order emails, loyalty awards, counters) after the
+request's transaction has committed
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from flask import current_app
+
+
+class TaskQueue:
+    """
+    Bounded queue drained by worker threads, each task run in an app context
+
+    Tasks get their own request-style database connection (get_db() and
+    transaction() work as in a view) and must not use request or session.
+    When the queue is full, or workers=0, a task runs inline in the caller
+    instead of being dropped. Loss bound: tasks still queued when the
+    process is killed are lost; on a normal exit the queue is drained for
+    up to drain_timeout seconds.
+    """
+
+    def __init__(self, app, workers=4, max_pending=1000, drain_timeout=10.0):
+        self.app = app
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._tasks = {}  # task name -> counters
+        self._stats = {'submitted': 0, 'ran_inline': 0}
+
+    def submit(self, name, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in the background; name groups its stats"""
+        with self._lock:
+            self._stats['submitted'] += 1
+        if self.workers > 0:
+            self._ensure_threads()
+            try:
+                self._queue.put_nowait((name, func, args, kwargs, time.monotonic()))
+                return
+            except queue.Full:
+                pass
+        with self._lock:
+            self._stats['ran_inline'] += 1
+        self._run_task(name, func, args, kwargs, time.monotonic())
+
+    def _ensure_threads(self):
+        # Started lazily so that forked worker processes each get their own
+        if self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid, self._threads = os.getpid(), []
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'task-worker-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            name, func, args, kwargs, queued_at = self._queue.get()
+            try:
+                self._run_task(name, func, args, kwargs, queued_at)
+            finally:
+                self._queue.task_done()
+
+    def _run_task(self, name, func, args, kwargs, queued_at):
+        started = time.monotonic()
+        failed = False
+        try:
+            with self.app.app_context():
+                func(*args, **kwargs)
+        except Exception as e:
+            failed = True
+            print(f"❌ Background task {name} failed: {e}")
+        finished = time.monotonic()
+        with self._lock:
+            counts = self._tasks.setdefault(name, {'done': 0, 'failed': 0, 'wait_ms': 0.0, 'run_ms': 0.0})
+            counts['failed' if failed else 'done'] += 1
+            counts['wait_ms'] += (started - queued_at) * 1000
+            counts['run_ms'] += (finished - started) * 1000
+
+    def drain(self):
+        """Wait (up to drain_timeout) for queued tasks to finish; True if the queue emptied"""
+        deadline = time.monotonic() + self.drain_timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def stats(self):
+        """Backlog, worker count and per-task counters (average wait and run time)"""
+        with self._lock:
+            tasks = {
+                name: {
+                    'done': counts['done'],
+                    'failed': counts['failed'],
+                    'avg_wait_ms': round(counts['wait_ms'] / (counts['done'] + counts['failed']), 3),
+                    'avg_run_ms': round(counts['run_ms'] / (counts['done'] + counts['failed']), 3)
+                }
+                for name, counts in self._tasks.items()
+            }
+            return {
+                'workers': self.workers,
+                'pending': self._queue.qsize(),
+                'max_pending': self._queue.maxsize,
+                **self._stats,
+                'tasks': tasks
+            }
+
+
+def init_app(app):
+    """Create the application's task queue and drain it on shutdown"""
+    task_queue = TaskQueue(
+        app,
+        workers=app.config['TASK_QUEUE_WORKERS'],
+        max_pending=app.config['TASK_QUEUE_MAX_PENDING']
+    )
+    app.extensions['task_queue'] = task_queue
+    atexit.register(task_queue.drain)
+    return task_queue
+
+
+def get_task_queue():
+    """Get the task queue of the current application"""
+    return current_app.extensions['task_queue']
+
+
+def submit(name, func, *args, **kwargs):
+    """Queue a task on the current application's task queue"""
+    get_task_queue().submit(name, func, *args, **kwargs)
@@ -0,0 +1,248 @@
+"""
+Trending Products Service
+Exponentially time-decayed sales and view counters per product, updated as
+orders, payments and views happen, and a top-K list served from memory
+
+Backfill recent orders into empty counters (e.g. after the migration):
+    python -m services.trending_service --backfill-days 14
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from services.db_pool import get_db_connection
+
+# An event loses half its weight every HALF_LIFE_HOURS
+HALF_LIFE_HOURS = 24
+
+# Contribution of one event to the trending score
+VIEW_WEIGHT = 0.003  # per view
+ORDER_WEIGHT = 0.2  # per unit ordered
+PAYMENT_WEIGHT = 0.2  # per unit paid for (a paid unit counts 0.4 in total)
+
+# The precomputed list: how many products, and how often it is re-read
+TOP_K = 50
+REFRESH_SECONDS = 10
+
+# Forward decay: instead of decaying every counter as time passes, each event
+# is stored multiplied by 2^(age of the generation / half-life), so counters
+# only ever grow, updates are plain additions and the ranking is ORDER BY
+# score on an index. The multiplier is reset every GENERATION_DAYS (to keep
+# it far from float overflow); rows from the previous generation are
+# rescaled when next written or read, and older ones have decayed to nothing.
+GENERATION_DAYS = 30
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+_GENERATION_SECONDS = GENERATION_DAYS * 86400
+_HALF_LIFE_SECONDS = HALF_LIFE_HOURS * 3600
+_HALF_LIVES_PER_GENERATION = _GENERATION_SECONDS / _HALF_LIFE_SECONDS
+
+
+def _generation(now=None):
+    """(generation number, forward-decay multiplier of an event at `now`)"""
+    elapsed = (now if now is not None else time.time()) - _EPOCH
+    generation = int(elapsed // _GENERATION_SECONDS)
+    age = elapsed - generation * _GENERATION_SECONDS
+    return generation, math.pow(2.0, age / _HALF_LIFE_SECONDS)
+
+
+def record_activity(cursor, views=None, orders=None, payments=None, now=None):
+    """
+    Add events to the trending counters in one multi-row upsert
+
+    views, orders and payments map product_id -> count (views, or units).
+    Runs on the caller's cursor; rows are written in product_id order so
+    concurrent writers lock them in the same order.
+    """
+    views, orders, payments = views or {}, orders or {}, payments or {}
+    product_ids = sorted(set(views) | set(orders) | set(payments))
+    if not product_ids:
+        return
+    generation, weight = _generation(now)
+
+    params = []
+    for product_id in product_ids:
+        view_count = views.get(product_id, 0)
+        units = orders.get(product_id, 0)
+        score = view_count * VIEW_WEIGHT + units * ORDER_WEIGHT + payments.get(product_id, 0) * PAYMENT_WEIGHT
+        params.extend((product_id, generation, view_count * weight, units * weight, score * weight))
+
+    # Columns are assigned left to right, so generation must be updated last
+    rescale = "POW(2, (generation - VALUES(generation)) * %s)"
+    cursor.execute(f"""
+        INSERT INTO product_trending (product_id, generation, views, sales, score)
+        VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(product_ids))}
+        ON DUPLICATE KEY UPDATE
+            views = views * {rescale} + VALUES(views),
+            sales = sales * {rescale} + VALUES(sales),
+            score = score * {rescale} + VALUES(score),
+            generation = VALUES(generation)
+    """, params + [_HALF_LIVES_PER_GENERATION] * 3)
+
+
+class TrendingService:
+    """
+    Serves the top TOP_K trending products from a per-process list that is
+    re-read from product_trending at most every REFRESH_SECONDS
+    """
+
+    def __init__(self):
+        self._top = []
+        self._digest = None  # Hash of _top, for ETags
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._stats = {'refreshes': 0, 'failed_refreshes': 0, 'last_refresh_ms': None}
+
+    def _fetch_generation(self, cursor, generation):
+        cursor.execute("""
+            SELECT
+                p.id,
+                p.name,
+                p.price,
+                p.discount_price,
+                p.image_url,
+                c.name as category_name,
+                s.business_name,
+                COALESCE(ps.rating_sum / NULLIF(ps.rating_count, 0), 0) as avg_rating,
+                COALESCE(ps.rating_count, 0) as review_count,
+                t.views,
+                t.sales,
+                t.score
+            FROM product_trending t
+            JOIN products p ON p.id = t.product_id
+            JOIN categories c ON p.category_id = c.id
+            JOIN sellers s ON p.seller_id = s.id
+            LEFT JOIN product_stats ps ON ps.product_id = p.id
+            WHERE t.generation = %s
+            AND t.score > 0
+            AND p.is_active = 1
+            AND p.quantity > 0
+            ORDER BY t.score DESC
+            LIMIT %s
+        """, (generation, TOP_K))
+        return cursor.fetchall()
+
+    def _refresh(self):
+        started = time.perf_counter()
+        generation, weight = _generation()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            current = self._fetch_generation(cursor, generation)
+            previous = self._fetch_generation(cursor, generation - 1)
+        finally:
+            conn.close()
+
+        # Counters are stored in forward-decay units of their generation;
+        # divide by the current multiplier to get today's decayed values
+        scale = {generation: 1.0 / weight, generation - 1: math.pow(2.0, -_HALF_LIVES_PER_GENERATION) / weight}
+        ranked = []
+        for gen, rows in ((generation, current), (generation - 1, previous)):
+            for row in rows:
+                ranked.append({
+                    'id': row['id'],
+                    'name': row['name'],
+                    'price': float(row['price']),
+                    'discount_price': float(row['discount_price']) if row['discount_price'] else None,
+                    'image_url': row['image_url'],
+                    'category_name': row['category_name'],
+                    'business_name': row['business_name'],
+                    'avg_rating': float(row['avg_rating']),
+                    'review_count': row['review_count'],
+                    'recent_sales': round(row['sales'] * scale[gen], 2),
+                    'view_count': round(row['views'] * scale[gen], 1),
+                    'trending_score': round(row['score'] * scale[gen], 4)
+                })
+        ranked.sort(key=lambda item: item['trending_score'], reverse=True)
+
+        self._top = ranked[:TOP_K]
+        self._digest = hashlib.sha1(json.dumps(self._top, sort_keys=True).encode('utf-8')).hexdigest()
+        self._refreshed_at = time.monotonic()
+        self._stats['refreshes'] += 1
+        self._stats['last_refresh_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._refreshed_at is None or now - self._refreshed_at >= REFRESH_SECONDS:
+            with self._lock:
+                if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= REFRESH_SECONDS:
+                    try:
+                        self._refresh()
+                    except Exception as e:
+                        self._stats['failed_refreshes'] += 1
+                        print(f"❌ Trending refresh failed: {e}")
+                        if self._refreshed_at is None:
+                            raise
+
+    def get_trending(self, limit=10):
+        """Top trending products, most trending first"""
+        self._ensure_fresh()
+        return [dict(item) for item in self._top[:limit]]
+
+    def content_version(self):
+        """Hash of the current list (equal lists hash equally in every process)"""
+        self._ensure_fresh()
+        return self._digest
+
+    def stats(self):
+        """List size, freshness and refresh counters"""
+        return {
+            'products': len(self._top),
+            'seconds_since_refresh': round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at else None,
+            **self._stats
+        }
+
+
+def backfill(days=14):
+    """
+    Rebuild the counters from the last `days` of orders, each weighted by
+    its own age. Views have no history to replay and start from zero.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT oi.product_id, oi.quantity, o.payment_status, o.created_at
+            FROM order_items oi
+            JOIN orders o ON oi.order_id = o.id
+            WHERE o.created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        """, (days,))
+        rows = cursor.fetchall()
+
+        # Replay as one batch at "now": an event of age a counts 2^(-a / half-life)
+        now = time.time()
+        orders, payments = {}, {}
+        for row in rows:
+            created = row['created_at'].timestamp()
+            decay = math.pow(2.0, -max(now - created, 0) / _HALF_LIFE_SECONDS)
+            orders[row['product_id']] = orders.get(row['product_id'], 0) + row['quantity'] * decay
+            if row['payment_status'] == 'completed':
+                payments[row['product_id']] = payments.get(row['product_id'], 0) + row['quantity'] * decay
+
+        cursor.execute("DELETE FROM product_trending")
+        record_activity(cursor, orders=orders, payments=payments, now=now)
+        conn.commit()
+        print(f"🔥 Trending counters backfilled from {len(rows)} order lines ({days} days)")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# Create singleton instance
+trending_service = TrendingService()
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Backfill the trending counters from recent orders')
+    parser.add_argument('--backfill-days', type=int, default=14)
+    args = parser.parse_args()
+
+    with app.app_context():
+        backfill(args.backfill_days)
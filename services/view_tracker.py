@@ -0,0 +1,247 @@
+"""
+Product View Tracker
+Buffers product page views in memory and writes them to the database in
+periodic batches instead of two writes and a commit per view
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+import pymysql
+from flask import current_app
+from services.db_pool import get_db_connection
+from services.product_stats import record_view_counts
+from services.recommendation_engine import recommendation_engine
+from services.trending_service import record_activity
+
+
+class ViewBuffer:
+    """
+    Per-process buffer of product views
+
+    record() only updates two in-memory maps: a view counter per product
+    and the latest view time per (customer, session, product). A background
+    thread flushes them every flush_interval seconds, or as soon as
+    flush_size views are pending, with one multi-row upsert into each of
+    product_stats and product_trending and one multi-row insert into
+    recently_viewed, so repeated views of a popular product become a single
+    row update.
+
+    Loss bound: a crash loses at most the views recorded since the last
+    flush (flush_interval seconds or flush_size views). While the database
+    is unreachable failed batches are kept and retried, up to max_backlog
+    pending views; views beyond that are dropped and counted. Views of
+    products (or by customers) that no longer exist are dropped at flush
+    time rather than retried, so one bad id cannot stall the buffer.
+    """
+
+    def __init__(self, app, flush_interval=5.0, flush_size=500, max_backlog=50000):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_backlog = max_backlog
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._reset_pending()
+        self._stats = {
+            'recorded': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'invalid_dropped': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'rows_written': 0,
+            'last_flush_ms': None
+        }
+
+    def _reset_pending(self):
+        self._counts = Counter()  # product_id -> views
+        self._recent = {}  # (customer_id, session_id, product_id) -> last viewed_at
+        self._pending = 0  # views not yet flushed
+        self._oldest = None  # monotonic time of the oldest pending view
+
+    def record(self, product_id, customer_id=None, session_id=None):
+        """Buffer one view of product_id by a customer or an anonymous session"""
+        self._ensure_thread()
+        viewed_at = datetime.now()
+        with self._lock:
+            if self._pending >= self.max_backlog:
+                self._stats['dropped'] += 1
+                return
+            self._counts[product_id] += 1
+            self._recent[(customer_id, session_id, product_id)] = viewed_at
+            self._pending += 1
+            self._stats['recorded'] += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._pending >= self.flush_size:
+                self._wakeup.set()
+        if customer_id:
+            # Recommendations see the view now rather than after the flush
+            recommendation_engine.note_view(customer_id, product_id, viewed_at)
+
+    def _ensure_thread(self):
+        # Started lazily so that forked worker processes each get their own
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='view-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _take(self):
+        with self._lock:
+            batch = (self._counts, self._recent, self._pending, self._oldest)
+            self._reset_pending()
+        return batch
+
+    def _restore(self, counts, recent, pending, oldest):
+        """Put a failed batch back in front of views recorded meanwhile"""
+        with self._lock:
+            if self._pending + pending > self.max_backlog:
+                self._stats['dropped'] += pending
+                return
+            counts.update(self._counts)
+            for key, viewed_at in self._recent.items():
+                recent[key] = viewed_at
+            self._counts, self._recent = counts, recent
+            self._pending += pending
+            self._oldest = oldest
+
+    @staticmethod
+    def _drop_unknown(cursor, counts, recent):
+        """
+        Remove views of products, and recent rows of customers, that are not
+        in the database
+        """
+        cursor.execute(f"""
+            SELECT id FROM products WHERE id IN ({', '.join(['%s'] * len(counts))})
+        """, list(counts))
+        known = {row['id'] for row in cursor.fetchall()}
+        customer_ids = {customer_id for customer_id, _, _ in recent if customer_id is not None}
+        known_customers = set()
+        if customer_ids:
+            cursor.execute(f"""
+                SELECT id FROM customers WHERE id IN ({', '.join(['%s'] * len(customer_ids))})
+            """, list(customer_ids))
+            known_customers = {row['id'] for row in cursor.fetchall()}
+
+        for product_id in [product_id for product_id in counts if product_id not in known]:
+            del counts[product_id]
+        for key in [key for key in recent if key[2] not in known
+                    or (key[0] is not None and key[0] not in known_customers)]:
+            del recent[key]
+
+    def _write(self, counts, recent):
+        """
+        Write one batch in a single transaction, leaving counts and recent
+        as they were; returns (views written, rows written)
+        """
+        counts, recent = Counter(counts), dict(recent)
+        with self.app.app_context():
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                self._drop_unknown(cursor, counts, recent)
+                if counts:
+                    record_view_counts(cursor, counts)
+                    record_activity(cursor, views=counts)
+                if recent:
+                    rows = sorted(recent.items(), key=lambda item: item[0][2])
+                    cursor.execute(f"""
+                        INSERT INTO recently_viewed (customer_id, product_id, session_id, viewed_at)
+                        VALUES {', '.join(['(%s, %s, %s, %s)'] * len(rows))}
+                        ON DUPLICATE KEY UPDATE viewed_at = VALUES(viewed_at)
+                    """, [value for (customer_id, session_id, product_id), viewed_at in rows
+                          for value in (customer_id, product_id, session_id, viewed_at)])
+                conn.commit()
+                return sum(counts.values()), len(counts) + len(recent)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    def flush(self):
+        """Write all pending views; returns the number of views flushed"""
+        with self._flush_lock:
+            counts, recent, pending, oldest = self._take()
+            if not pending:
+                return 0
+            started = time.perf_counter()
+            try:
+                try:
+                    written, rows = self._write(counts, recent)
+                except pymysql.err.IntegrityError:
+                    # A product or customer was deleted between the check and
+                    # the insert: check again, and give up on the batch if
+                    # that still fails rather than re-queueing a bad id
+                    try:
+                        written, rows = self._write(counts, recent)
+                    except pymysql.err.IntegrityError as e:
+                        with self._lock:
+                            self._stats['failed_flushes'] += 1
+                            self._stats['invalid_dropped'] += pending
+                        print(f"❌ Dropped {pending} product views that reference missing rows: {e}")
+                        return 0
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed_flushes'] += 1
+                print(f"❌ Failed to flush {pending} product views: {e}")
+                self._restore(counts, recent, pending, oldest)
+                return 0
+
+            # Counted once, from the attempt that was committed
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['flushed'] += written
+                self._stats['invalid_dropped'] += pending - written
+                self._stats['rows_written'] += rows
+                self._stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            return written
+
+    def stats(self):
+        """Backlog size and age plus flush counters"""
+        with self._lock:
+            return {
+                'pending_views': self._pending,
+                'pending_products': len(self._counts),
+                'pending_recent_rows': len(self._recent),
+                'oldest_pending_seconds': round(time.monotonic() - self._oldest, 1) if self._oldest else None,
+                'flush_interval': self.flush_interval,
+                'flush_size': self.flush_size,
+                'max_backlog': self.max_backlog,
+                **self._stats
+            }
+
+
+def init_app(app):
+    """Create the application's view buffer and flush it on shutdown"""
+    buffer = ViewBuffer(
+        app,
+        flush_interval=app.config['VIEW_FLUSH_INTERVAL'],
+        flush_size=app.config['VIEW_FLUSH_SIZE'],
+        max_backlog=app.config['VIEW_MAX_BACKLOG']
+    )
+    app.extensions['view_buffer'] = buffer
+    atexit.register(buffer.flush)
+    return buffer
+
+
+def get_view_buffer():
+    """Get the view buffer of the current application"""
+    return current_app.extensions['view_buffer']
@@ -58,9 +58,9 @@ class AdvancedSearch {
     
     async fetchSuggestions(query) {
         try {
-            const response = await fetch(`/api/search_suggestions?q=${encodeURIComponent(query)}`);
+            const response = await fetch(`/api/search/suggest?q=${encodeURIComponent(query)}`);
             const data = await response.json();
-            this.displaySuggestions(data.suggestions || []);
+            this.displaySuggestions((data.suggestions || []).map(s => s.text));
         } catch (error) {
             console.error('Failed to fetch suggestions:', error);
             // Fallback to local suggestions